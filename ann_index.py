@@ -0,0 +1,238 @@
+"""
+Approximate nearest-neighbour index for large face galleries
+Pure-NumPy IVF (inverted file) index: encodings are partitioned with k-means
+and a query only scans the nprobe closest partitions instead of every vector.
+nprobe is the recall/latency knob - higher scans more lists (better recall)
+"""
+
+import os
+import threading
+
+import numpy as np
+
+ENCODING_DIM = 128
+
+
+def default_index_path(db_path='facecheck.db'):
+    """Index file kept next to the database"""
+    base, _ = os.path.splitext(os.path.abspath(db_path))
+    return f"{base}_ann.npz"
+
+
+def kmeans(vectors, n_clusters, iters=10, seed=0):
+    """Lloyd's k-means on float32 vectors; returns (n_clusters, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    n_clusters = max(1, min(n_clusters, n))
+    centroids = vectors[rng.choice(n, n_clusters, replace=False)].copy()
+    v_sq = np.einsum('ij,ij->i', vectors, vectors)
+
+    for _ in range(iters):
+        c_sq = np.einsum('ij,ij->i', centroids, centroids)
+        assign = np.argmin(c_sq[None, :] - 2.0 * (vectors @ centroids.T), axis=1)
+        counts = np.bincount(assign, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        # Re-seed empty clusters with the points farthest from their centroid
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            d = v_sq - 2.0 * np.einsum('ij,ij->i', vectors, centroids[assign]) + c_sq[assign]
+            centroids[empty] = vectors[np.argsort(d)[-len(empty):]]
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index with incremental insert/delete
+    Each partition keeps its own contiguous vector/id arrays (grown by doubling)
+    """
+
+    def __init__(self, dim=ENCODING_DIM, nprobe=8):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.centroids = None
+        self._list_vecs = []    # per list: (capacity, dim) float32
+        self._list_ids = []     # per list: (capacity,) int64
+        self._list_size = []    # per list: populated rows
+        self._where = {}        # owner id -> (list, row)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, owner_id):
+        return int(owner_id) in self._where
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def n_lists(self):
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @staticmethod
+    def suggested_lists(n):
+        """Roughly sqrt(N) partitions, the usual IVF rule of thumb"""
+        return max(1, int(np.sqrt(max(n, 1))))
+
+    def train(self, vectors, n_lists=None, iters=10, sample_size=20000, seed=0):
+        """Learn partition centroids from (a sample of) the gallery; clears existing lists"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if n_lists is None:
+            n_lists = self.suggested_lists(len(vectors))
+        if len(vectors) > sample_size:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        with self._lock:
+            self.centroids = kmeans(vectors, n_lists, iters=iters, seed=seed)
+            self._reset_lists()
+
+    def _reset_lists(self):
+        n = len(self.centroids)
+        self._list_vecs = [np.zeros((4, self.dim), dtype=np.float32) for _ in range(n)]
+        self._list_ids = [np.zeros(4, dtype=np.int64) for _ in range(n)]
+        self._list_size = [0] * n
+        self._where = {}
+
+    def _assign(self, vectors):
+        c_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        return np.argmin(c_sq[None, :] - 2.0 * (vectors @ self.centroids.T), axis=1)
+
+    def add(self, ids, vectors):
+        """Insert (or move) identities; vectors are assigned to their nearest partition"""
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex must be trained before adding vectors")
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+
+        with self._lock:
+            for owner_id in ids:
+                self._discard(int(owner_id))
+            lists = self._assign(vectors)
+            for owner_id, vector, lst in zip(ids, vectors, lists):
+                self._append(int(lst), int(owner_id), vector)
+
+    def _append(self, lst, owner_id, vector):
+        size = self._list_size[lst]
+        if size == len(self._list_ids[lst]):
+            capacity = size * 2
+            vecs = np.zeros((capacity, self.dim), dtype=np.float32)
+            vecs[:size] = self._list_vecs[lst][:size]
+            ids = np.zeros(capacity, dtype=np.int64)
+            ids[:size] = self._list_ids[lst][:size]
+            self._list_vecs[lst], self._list_ids[lst] = vecs, ids
+        self._list_vecs[lst][size] = vector
+        self._list_ids[lst][size] = owner_id
+        self._list_size[lst] = size + 1
+        self._where[owner_id] = (lst, size)
+
+    def remove(self, owner_id):
+        """Delete an identity (swap-with-last inside its partition)"""
+        with self._lock:
+            return self._discard(int(owner_id))
+
+    def _discard(self, owner_id):
+        loc = self._where.pop(owner_id, None)
+        if loc is None:
+            return False
+        lst, row = loc
+        last = self._list_size[lst] - 1
+        if row != last:
+            moved = int(self._list_ids[lst][last])
+            self._list_vecs[lst][row] = self._list_vecs[lst][last]
+            self._list_ids[lst][row] = moved
+            self._where[moved] = (lst, row)
+        self._list_size[lst] = last
+        return True
+
+    def search(self, query, k=1, nprobe=None):
+        """
+        k nearest identities to one query among the nprobe closest partitions
+        Returns: (ids, distances) sorted by distance; may be shorter than k
+        """
+        nprobe = self.nprobe if nprobe is None else nprobe
+        q = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        with self._lock:
+            if not self.is_trained or not self._where:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+            c_dist = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2.0 * (self.centroids @ q)
+            nprobe = max(1, min(nprobe, len(c_dist)))
+            probe_lists = np.argpartition(c_dist, nprobe - 1)[:nprobe]
+
+            chunks = [(self._list_vecs[l][:self._list_size[l]], self._list_ids[l][:self._list_size[l]])
+                      for l in probe_lists if self._list_size[l]]
+            if not chunks:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            vecs = np.concatenate([c[0] for c in chunks])
+            ids = np.concatenate([c[1] for c in chunks])
+
+        diff = vecs - q
+        dists = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+        k = min(k, len(dists))
+        top = np.argpartition(dists, k - 1)[:k]
+        top = top[np.argsort(dists[top])]
+        return ids[top], dists[top]
+
+    def reconcile(self, ids, vectors):
+        """
+        Bring a (possibly stale, loaded-from-disk) index in line with the gallery:
+        drop ids that no longer exist, add new ones and re-add changed vectors
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            wanted = {int(i): r for r, i in enumerate(ids)}
+            for owner_id in [o for o in self._where if o not in wanted]:
+                self._discard(owner_id)
+
+            stale = []
+            for owner_id, row in wanted.items():
+                loc = self._where.get(owner_id)
+                if loc is None or not np.array_equal(self._list_vecs[loc[0]][loc[1]], vectors[row]):
+                    stale.append(row)
+            if stale:
+                stale = np.asarray(stale)
+                self.add(ids[stale], vectors[stale])
+            return len(stale)
+
+    def save(self, path):
+        """Persist centroids and partitions to one .npz file (atomic replace)"""
+        with self._lock:
+            if not self.is_trained:
+                raise RuntimeError("Cannot save an untrained index")
+            sizes = np.asarray(self._list_size, dtype=np.int64)
+            vecs = np.concatenate([self._list_vecs[l][:s] for l, s in enumerate(sizes)])
+            ids = np.concatenate([self._list_ids[l][:s] for l, s in enumerate(sizes)])
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"  # per process: recognition workers save concurrently
+            np.savez(tmp_path, centroids=self.centroids, sizes=sizes, vectors=vecs, ids=ids,
+                     nprobe=np.int64(self.nprobe))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with np.load(path) as data:
+            index = cls(dim=data['centroids'].shape[1], nprobe=int(data['nprobe']))
+            index.centroids = data['centroids'].astype(np.float32)
+            index._reset_lists()
+            offsets = np.concatenate([[0], np.cumsum(data['sizes'])])
+            vectors, ids = data['vectors'], data['ids']
+            for lst in range(len(index.centroids)):
+                start, end = offsets[lst], offsets[lst + 1]
+                size = int(end - start)
+                capacity = max(4, size)
+                index._list_vecs[lst] = np.zeros((capacity, index.dim), dtype=np.float32)
+                index._list_vecs[lst][:size] = vectors[start:end]
+                index._list_ids[lst] = np.zeros(capacity, dtype=np.int64)
+                index._list_ids[lst][:size] = ids[start:end]
+                index._list_size[lst] = size
+                for row, owner_id in enumerate(ids[start:end]):
+                    index._where[int(owner_id)] = (lst, row)
+        return index
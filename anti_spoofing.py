@@ -6,7 +6,18 @@ Optimized to reduce false positives while detecting fake faces (photos/videos)
 import cv2
 import numpy as np
 import os
-from datetime import datetime
+
+from lbp_texture import lbp_texture_score
+from liveness_state import LivenessState
+from face_crop import FaceCrop, FaceCropPreprocessor
+
+
+def gray_of(face_region):
+    """Gray face: computed once by the preprocessing for a FaceCrop, converted here for a raw region"""
+    if isinstance(face_region, FaceCrop):
+        return face_region.gray
+    return cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY) if len(face_region.shape) == 3 else face_region
+
 
 class AntiSpoofingDetector:
     def __init__(self):
@@ -24,6 +35,10 @@ class AntiSpoofingDetector:
         
         # Texture analysis (key for detecting photos)
         self.TEXTURE_THRESHOLD = 0.35  # Lower - more lenient for real skin
+        # LBP variant: the threshold was tuned for 3x3 'default' codes (radius 1);
+        # 'uniform'/'ror'/'nri_uniform' and extra radii need their own threshold
+        self.LBP_METHOD = 'default'
+        self.LBP_RADII = (1,)
         
         # Color diversity (key for detecting screens)
         self.COLOR_DIVERSITY_THRESHOLD = 0.20  # Lower - more natural variation accepted
@@ -45,15 +60,35 @@ class AntiSpoofingDetector:
         self.FREQUENCY_THRESHOLD = 0.25
         
         # ============= DETECTION STATE =============
-        self.frame_history = []
+        # Motion/blink history; callers pass their kiosk's LivenessState,
+        # this one is only used when they do not
         self.max_history_size = 5  # Reduced for faster processing
-        
-        self.blink_counter = 0
-        self.blink_detected = False
+        self.state = LivenessState(max_history=self.max_history_size)
         
         # Confidence mode
         self.strict_mode = False  # Set to True for higher security
         
+        # ============= PREPROCESSING =============
+        # Face crops are resized to ANALYSIS_SIZE x ANALYSIS_SIZE before the checks,
+        # so their cost does not depend on the camera (None: native size)
+        self.ANALYSIS_SIZE = 128
+        self.preprocessor = FaceCropPreprocessor()
+        
+        # ============= CASCADE =============
+        # Run the checks cheapest first and stop once the decision is settled
+        # (False runs all of them, e.g. to show every check's score)
+        self.CASCADE_ENABLED = True
+        self.ALWAYS_RUN_CHECKS = ('motion_analysis',)  # updates the kiosk's history
+        # Milliseconds per check on the 128x128 analysis crop (python benchmark_anti_spoofing.py)
+        self.CHECK_COST_MS = {
+            'print_detection': 1.62,  # fft2 plus two percentile passes
+            'edge_analysis': 0.34,
+            'texture_analysis': 0.31,
+            'color_analysis': 0.87,  # HSV and LAB conversions
+            'reflection_analysis': 0.10,
+            'motion_analysis': 0.07
+        }
+        
     def calculate_ear(self, eye_landmarks):
         """Calculate Eye Aspect Ratio (EAR) for blink detection"""
         try:
@@ -79,8 +114,9 @@ class AntiSpoofingDetector:
             print(f"Error calculating EAR: {e}")
             return 0.5  # Neutral value on error
     
-    def detect_blink_pattern(self, face_landmarks):
+    def detect_blink_pattern(self, face_landmarks, state=None):
         """Detect natural blinking patterns (optional check)"""
+        state = state or self.state
         try:
             if not face_landmarks or 'left_eye' not in face_landmarks or 'right_eye' not in face_landmarks:
                 # Don't penalize if we can't detect eyes
@@ -94,12 +130,13 @@ class AntiSpoofingDetector:
             avg_ear = (left_ear + right_ear) / 2.0
             
             # Very lenient blink detection
-            if avg_ear < self.EAR_THRESHOLD:
-                self.blink_counter += 1
-            else:
-                if self.blink_counter >= self.BLINK_FRAMES_THRESHOLD:
-                    self.blink_detected = True
-                self.blink_counter = 0
+            with state.lock:
+                if avg_ear < self.EAR_THRESHOLD:
+                    state.blink_counter += 1
+                else:
+                    if state.blink_counter >= self.BLINK_FRAMES_THRESHOLD:
+                        state.blink_detected = True
+                    state.blink_counter = 0
             
             # Always pass if eyes are detected (don't require blink)
             return True, float(avg_ear)
@@ -111,7 +148,7 @@ class AntiSpoofingDetector:
     def detect_print_artifacts(self, face_region):
         """Detect printing artifacts that indicate a photo"""
         try:
-            gray = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY) if len(face_region.shape) == 3 else face_region
+            gray = gray_of(face_region)
             
             # Check for print patterns using Fourier Transform
             f_transform = np.fft.fft2(gray)
@@ -136,7 +173,7 @@ class AntiSpoofingDetector:
     def check_edge_characteristics(self, face_region):
         """Check edge characteristics - photos/screens have different edges"""
         try:
-            gray = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY) if len(face_region.shape) == 3 else face_region
+            gray = gray_of(face_region)
             
             # Apply Canny edge detection
             edges = cv2.Canny(gray, 50, 150)
@@ -159,35 +196,12 @@ class AntiSpoofingDetector:
             return True, 1.0  # Pass on error
     
     def analyze_texture_lbp(self, face_region):
-        """Analyze texture using Local Binary Patterns (LBP) - optimized"""
+        """Analyze texture using Local Binary Patterns (LBP) - vectorized (see lbp_texture.py)"""
         try:
-            gray = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY) if len(face_region.shape) == 3 else face_region
-            
-            # Use simpler LBP calculation for speed
-            h, w = gray.shape
-            lbp = np.zeros_like(gray)
-            
-            # Simple 3x3 LBP
-            for i in range(1, h-1):
-                for j in range(1, w-1):
-                    center = gray[i, j]
-                    code = 0
-                    code |= (gray[i-1, j-1] >= center) << 0
-                    code |= (gray[i-1, j] >= center) << 1
-                    code |= (gray[i-1, j+1] >= center) << 2
-                    code |= (gray[i, j+1] >= center) << 3
-                    code |= (gray[i+1, j+1] >= center) << 4
-                    code |= (gray[i+1, j] >= center) << 5
-                    code |= (gray[i+1, j-1] >= center) << 6
-                    code |= (gray[i, j-1] >= center) << 7
-                    lbp[i, j] = code
-            
-            # Calculate entropy
-            hist = cv2.calcHist([lbp], [0], None, [256], [0, 256])
-            hist_norm = hist / (lbp.shape[0] * lbp.shape[1])
-            entropy = -np.sum(hist_norm * np.log2(hist_norm + 1e-7))
-            
-            texture_score = min(entropy / 8.0, 1.0)
+            gray = gray_of(face_region)
+            
+            # Entropy of the LBP histogram, normalized to 0..1
+            texture_score = lbp_texture_score(gray, radii=self.LBP_RADII, method=self.LBP_METHOD)
             
             # More lenient threshold
             return bool(texture_score > self.TEXTURE_THRESHOLD), float(texture_score)
@@ -200,8 +214,11 @@ class AntiSpoofingDetector:
         """Analyze color distribution - screens/photos have different color characteristics"""
         try:
             # Convert to HSV and LAB for better color analysis
-            hsv = cv2.cvtColor(face_region, cv2.COLOR_BGR2HSV)
-            lab = cv2.cvtColor(face_region, cv2.COLOR_BGR2LAB)
+            if isinstance(face_region, FaceCrop):
+                hsv, lab = face_region.hsv, face_region.lab
+            else:
+                hsv = cv2.cvtColor(face_region, cv2.COLOR_BGR2HSV)
+                lab = cv2.cvtColor(face_region, cv2.COLOR_BGR2LAB)
             
             # Calculate color diversity
             h_std = np.std(hsv[:, :, 0]) / 180.0
@@ -225,7 +242,7 @@ class AntiSpoofingDetector:
     def detect_specular_reflection(self, face_region):
         """Detect excessive specular reflections (screens/glossy photos)"""
         try:
-            gray = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
+            gray = gray_of(face_region)
             
             blurred = cv2.GaussianBlur(gray, (5, 5), 0)
             
@@ -245,37 +262,23 @@ class AntiSpoofingDetector:
             print(f"Error in reflection analysis: {e}")
             return True, 0.0  # Pass on error
     
-    def analyze_motion_patterns(self, current_landmarks, face_region):
-        """Analyze head movement patterns - very lenient"""
+    def analyze_motion_patterns(self, current_landmarks, face_region, state=None):
+        """Analyze head movement patterns - very lenient
+        Only the nose tip goes into the history; face_region is not kept"""
+        state = state or self.state
         try:
-            self.frame_history.append({
-                'landmarks': current_landmarks,
-                'timestamp': datetime.now(),
-                'face_region': face_region
-            })
+            with state.lock:
+                state.add_frame(current_landmarks)
+                frame_count = state.count
+                motion_scores = state.motion_steps()
             
-            if len(self.frame_history) > self.max_history_size:
-                self.frame_history.pop(0)
-            
-            if len(self.frame_history) < 2:
+            if frame_count < 2:
                 return True, 0.0  # Pass if not enough data
             
-            # Calculate motion
-            motion_scores = []
-            for i in range(1, len(self.frame_history)):
-                prev_landmarks = self.frame_history[i-1]['landmarks']
-                curr_landmarks = self.frame_history[i]['landmarks']
-                
-                if prev_landmarks and curr_landmarks and 'nose_tip' in prev_landmarks and 'nose_tip' in curr_landmarks:
-                    prev_nose = np.array(prev_landmarks['nose_tip'][0])
-                    curr_nose = np.array(curr_landmarks['nose_tip'][0])
-                    motion = np.linalg.norm(curr_nose - prev_nose)
-                    motion_scores.append(motion)
-            
-            if motion_scores:
+            if len(motion_scores):
                 avg_motion = np.mean(motion_scores)
                 # Very lenient - even small motion is OK
-                has_natural_motion = avg_motion > self.MOTION_THRESHOLD or len(self.frame_history) < 3
+                has_natural_motion = avg_motion > self.MOTION_THRESHOLD or frame_count < 3
             else:
                 has_natural_motion = True
                 avg_motion = 0.0
@@ -286,10 +289,88 @@ class AntiSpoofingDetector:
             print(f"Error in motion analysis: {e}")
             return True, 0.0  # Pass on error
     
-    def comprehensive_anti_spoofing_check(self, image, face_landmarks, face_location):
+    def check_table(self, face_region, face_landmarks, state=None):
+        """
+        (name, weight, critical, run) of every check, in the order the full
+        evaluation adds up their weights; run() returns (passed, score)
+        """
+        def reflection():
+            no_reflection, reflection_ratio = self.detect_specular_reflection(face_region)
+            return no_reflection, 1.0 - reflection_ratio
+        
+        def motion():
+            natural_motion, motion_score = self.analyze_motion_patterns(face_landmarks, face_region, state)
+            return natural_motion, min(motion_score / 10.0, 1.0)
+        
+        checks = []
+        # ========== CRITICAL CHECKS (Must pass to indicate real person) ==========
+        if self.PHOTO_DETECTION_ENABLED:
+            # Print Artifact Detection (KEY for photos)
+            checks.append(('print_detection', 0.30, True, lambda: self.detect_print_artifacts(face_region)))
+        # Edge Characteristics (KEY for screens/photos)
+        checks.append(('edge_analysis', 0.25, True, lambda: self.check_edge_characteristics(face_region)))
+        # ========== SUPPORTING CHECKS (Help but not critical) ==========
+        checks.append(('texture_analysis', 0.15, False, lambda: self.analyze_texture_lbp(face_region)))
+        checks.append(('color_analysis', 0.15, False, lambda: self.analyze_color_distribution(face_region)))
+        checks.append(('reflection_analysis', 0.10, False, reflection))
+        # Motion (optional - very lenient)
+        checks.append(('motion_analysis', 0.05, False, motion))
+        return checks
+    
+    def cascade_order(self, checks):
+        """
+        Order to run the checks in: motion first (it records the frame in the
+        kiosk's history, so it runs on every frame), then the critical checks
+        (only they can settle the result early) and then the rest, each group
+        by measured cost per unit of weight
+        """
+        always = [name for name, _, _, _ in checks if name in self.ALWAYS_RUN_CHECKS]
+        rest = sorted((check for check in checks if check[0] not in self.ALWAYS_RUN_CHECKS),
+                      key=lambda check: (not check[2], self.CHECK_COST_MS.get(check[0], 1.0) / check[1]))
+        return always + [name for name, _, _, _ in rest]
+    
+    def decision_bounds(self, checks, outcomes):
+        """
+        (critical confidence, its lower bound, weighted confidence, its upper bound)
+        given the outcomes so far, a check not run yet counting as passed for the
+        critical confidence and the upper bound and as failed for the lower bound.
+        The weights are added in the same order as the full evaluation, so with
+        every outcome known both pairs are exactly its values
+        """
+        def passed(name, unknown):
+            return outcomes[name]['passed'] if name in outcomes else unknown
+        
+        critical = [name for name, _, is_critical, _ in checks if is_critical]
+        critical_high = sum(1 for name in critical if passed(name, True)) / len(critical) if critical else 1.0
+        critical_low = sum(1 for name in critical if passed(name, False)) / len(critical) if critical else 1.0
+        
+        total_weight = sum(weight for _, weight, _, _ in checks)
+        if total_weight <= 0:
+            return critical_high, critical_low, 1.0, 1.0
+        lower = sum(weight if passed(name, False) else 0 for name, weight, _, _ in checks) / total_weight
+        upper = sum(weight if passed(name, True) else 0 for name, weight, _, _ in checks) / total_weight
+        return critical_high, critical_low, lower, upper
+    
+    def cascade_settled(self, checks, outcomes):
+        """
+        True once the critical checks alone reject the face: the full evaluation
+        then reports the critical verdict, whose confidence depends only on the
+        critical checks, so the checks not run yet cannot change any field of it.
+        A face that may be live always runs every check, as callers read its
+        weighted confidence (the kiosk page wants 0.7, marking 0.5)
+        """
+        critical_high, critical_low, _, _ = self.decision_bounds(checks, outcomes)
+        return critical_high < 0.5 and critical_high == critical_low
+    
+    def comprehensive_anti_spoofing_check(self, image, face_landmarks, face_location, state=None, cascade=None):
         """
         Enhanced anti-spoofing analysis optimized for real people
         Focus on detecting obvious fakes (photos/videos) while being lenient on real faces
+        state is the kiosk's LivenessState (motion history); the detector's own when omitted
+        With cascade (CASCADE_ENABLED by default) the critical checks run first,
+        cheapest first, and the rest are skipped once they reject the face; the
+        result (is_live, confidence, details) is always the full evaluation's and
+        'skipped' lists the checks not run
         """
         try:
             results = {
@@ -299,11 +380,10 @@ class AntiSpoofingDetector:
                 'details': 'Liveness check passed'
             }
             
-            # Extract face region
-            top, right, bottom, left = face_location
-            face_region = image[top:bottom, left:right]
+            # Extract the face region once, at the analysis size, gray computed once for every check
+            face_region = self.preprocessor.prepare(image, face_location, self.ANALYSIS_SIZE)
             
-            if face_region.size == 0:
+            if face_region is None:
                 # Don't fail completely, just warn
                 return {
                     'is_live': True,  # Pass by default
@@ -312,102 +392,38 @@ class AntiSpoofingDetector:
                     'details': 'Face detected but region extraction had issues - allowing access'
                 }
             
-            # ========== CRITICAL CHECKS (Must pass to indicate real person) ==========
-            
-            # 1. Print Artifact Detection (KEY for photos)
-            if self.PHOTO_DETECTION_ENABLED:
-                is_not_print, freq_score = self.detect_print_artifacts(face_region)
-                results['checks']['print_detection'] = {
-                    'passed': is_not_print,
-                    'score': freq_score,
-                    'weight': 0.30,  # High weight
-                    'critical': True
-                }
-            
-            # 2. Edge Characteristics (KEY for screens/photos)
-            is_natural_edges, sharpness = self.check_edge_characteristics(face_region)
-            results['checks']['edge_analysis'] = {
-                'passed': is_natural_edges,
-                'score': sharpness,
-                'weight': 0.25,  # High weight
-                'critical': True
-            }
-            
-            # ========== SUPPORTING CHECKS (Help but not critical) ==========
-            
-            # 3. Texture Analysis (supporting)
-            texture_natural, texture_score = self.analyze_texture_lbp(face_region)
-            results['checks']['texture_analysis'] = {
-                'passed': texture_natural,
-                'score': texture_score,
-                'weight': 0.15,
-                'critical': False
-            }
-            
-            # 4. Color Distribution (supporting)
-            color_natural, color_score = self.analyze_color_distribution(face_region)
-            results['checks']['color_analysis'] = {
-                'passed': color_natural,
-                'score': color_score,
-                'weight': 0.15,
-                'critical': False
-            }
-            
-            # 5. Specular Reflection (supporting)
-            no_reflection, reflection_ratio = self.detect_specular_reflection(face_region)
-            results['checks']['reflection_analysis'] = {
-                'passed': no_reflection,
-                'score': 1.0 - reflection_ratio,
-                'weight': 0.10,
-                'critical': False
-            }
-            
-            # 6. Motion (optional - very lenient)
-            natural_motion, motion_score = self.analyze_motion_patterns(face_landmarks, face_region)
-            results['checks']['motion_analysis'] = {
-                'passed': natural_motion,
-                'score': min(motion_score / 10.0, 1.0),
-                'weight': 0.05,
-                'critical': False
-            }
+            # Every check: (name, weight, critical, run), in the order the full evaluation adds them up
+            checks = self.check_table(face_region, face_landmarks, state)
+            threshold = 0.60 if self.strict_mode else 0.40  # Strict mode: 60%, normal mode: 40% (very lenient)
+            
+            # Critical checks cheapest first; stop once they reject the face on their own
+            cascade = self.CASCADE_ENABLED if cascade is None else cascade
+            order = self.cascade_order(checks) if cascade else [name for name, _, _, _ in checks]
+            runs = {name: (weight, critical, run) for name, weight, critical, run in checks}
+            outcomes = {}
+            for name in order:
+                weight, critical, run = runs[name]
+                passed, score = run()
+                outcomes[name] = {'passed': passed, 'score': score, 'weight': weight, 'critical': critical}
+                if cascade and self.cascade_settled(checks, outcomes):
+                    break
+            results['checks'] = {name: outcomes[name] for name, _, _, _ in checks if name in outcomes}
+            results['skipped'] = [name for name, _, _, _ in checks if name not in outcomes]
             
             # ========== CONFIDENCE CALCULATION ==========
-            
-            # Check critical tests first
-            critical_checks = [check for check in results['checks'].values() if check.get('critical', False)]
-            critical_passed = sum(1 for check in critical_checks if check['passed'])
-            critical_total = len(critical_checks)
+            # Checks are only skipped after a critical rejection, which does not depend on them
+            critical_confidence, _, confidence, _ = self.decision_bounds(checks, outcomes)
             
             # If ANY critical check fails, it's likely a fake
-            if critical_total > 0 and critical_passed < critical_total:
-                # Calculate how many critical checks failed
-                critical_confidence = critical_passed / critical_total
-                
-                # Only fail if MULTIPLE critical checks fail or confidence is very low
-                if critical_confidence < 0.5:  # Less than 50% of critical checks passed
-                    results['is_live'] = False
-                    results['confidence'] = critical_confidence * 0.6  # Scale down
-                    results['details'] = f"⚠️ Anti-Spoofing: Detected patterns consistent with photo/video (confidence: {critical_confidence:.0%})"
-                    return results
-            
-            # Calculate overall weighted score
-            total_weight = sum(check.get('weight', 0) for check in results['checks'].values())
-            weighted_score = sum(
-                check.get('weight', 0) if check['passed'] else 0
-                for check in results['checks'].values()
-            )
-            
-            if total_weight > 0:
-                confidence = weighted_score / total_weight
-            else:
-                confidence = 1.0
-            
+            # Only fail if MULTIPLE critical checks fail or confidence is very low
+            if critical_confidence < 0.5:  # Less than 50% of critical checks passed
+                results['is_live'] = False
+                results['confidence'] = critical_confidence * 0.6  # Scale down
+                results['details'] = f"⚠️ Anti-Spoofing: Detected patterns consistent with photo/video (confidence: {critical_confidence:.0%})"
+                return results
+            
+            # Overall weighted score (every check ran)
             # VERY LENIENT threshold - only fail on obvious fakes
-            if self.strict_mode:
-                threshold = 0.60  # Strict mode: 60%
-            else:
-                threshold = 0.40  # Normal mode: 40% (very lenient)
-            
             is_live = confidence >= threshold
             
             results['is_live'] = bool(is_live)
@@ -431,10 +447,8 @@ class AntiSpoofingDetector:
             }
     
     def reset_state(self):
-        """Reset detector state for new session"""
-        self.frame_history.clear()
-        self.blink_counter = 0
-        self.blink_detected = False
+        """Reset the detector's own state (kiosk states are reset through their store)"""
+        self.state.reset()
 
 
 # Global anti-spoofing detector instance
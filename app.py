@@ -1,5 +1,6 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 import sqlite3
+import json
 from datetime import datetime
 import os
 import time
@@ -37,6 +38,278 @@ except ImportError as e:
     print(f"Anti-spoofing not available: {e}")
     ANTI_SPOOFING_AVAILABLE = False
 
+# Resolution-aware detection (downscaled HOG, escalating upsample, optional cascade backends)
+from face_detection import create_detector, parse_upsample_tiers
+from frame_analysis import FrameAnalysis
+from recognition_service import RecognitionService, recognize_frame, recheck_anti_spoofing, decode_image, MATCH_TOLERANCE
+from face_tracking import FaceTracker
+from liveness_state import LivenessStateStore
+from debug_capture import FrameCaptureRing
+from frame_cache import FrameResultCache
+from pipeline_metrics import StageMetrics, StageTimer
+from gallery_maintenance import GalleryMaintainer, ensure_registration_schema
+from recognition_jobs import RecognitionJobManager, JobQueueFull, FINAL_STATES
+from event_checkin import EventCheckinWriter, MARKED, EVENT_STATUSES
+# Future timeouts are only the builtin TimeoutError from Python 3.11 on
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from security_config import SecurityConfig
+face_detector = create_detector(
+    SecurityConfig.DETECTOR_BACKEND,
+    scale=SecurityConfig.DETECTION_SCALE,
+    upsample_tiers=parse_upsample_tiers(SecurityConfig.DETECTION_UPSAMPLE_TIERS),
+    cascade_scale=SecurityConfig.DETECTOR_CASCADE_SCALE,
+    cascade_path=SecurityConfig.DETECTOR_CASCADE_PATH or None
+)
+
+# Import persistent face encoding store and in-memory gallery
+try:
+    from face_encoding_store import encoding_store, file_content_hash
+    from face_gallery import StudentGallery, FacultyGallery, ClassGalleryCache
+    from ann_index import default_index_path
+    student_gallery = StudentGallery(
+        encoding_store,
+        ann_min_size=SecurityConfig.ANN_MIN_GALLERY_SIZE,
+        ann_path=default_index_path('facecheck.db'),
+        ann_nprobe=SecurityConfig.ANN_NPROBE,
+        reduction=SecurityConfig.TEMPLATE_MATCH_REDUCTION,
+        k=SecurityConfig.TEMPLATE_MATCH_K,
+        precision=SecurityConfig.GALLERY_PRECISION,
+        rerank=SecurityConfig.GALLERY_RERANK
+    )
+    # Event check-in matches faculty against their registered faces
+    faculty_gallery = FacultyGallery(encoding_store)
+    ENCODING_STORE_AVAILABLE = True
+except ImportError as e:
+    print(f"Face encoding store not available: {e}")
+    ENCODING_STORE_AVAILABLE = False
+
+def load_class_roster(class_id):
+    """Student ids enrolled in a class (feeds the per-class sub-galleries)"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute('SELECT student_id FROM student_class WHERE class_id = ?', (class_id,)).fetchall()
+        return [row['student_id'] for row in rows]
+    finally:
+        conn.close()
+
+if ENCODING_STORE_AVAILABLE:
+    class_galleries = ClassGalleryCache(student_gallery, load_class_roster)
+
+# Recognition worker processes (0 = recognize inline in the request thread)
+recognition_service = None
+if FACE_RECOGNITION_AVAILABLE and ENCODING_STORE_AVAILABLE and SecurityConfig.RECOGNITION_WORKERS > 0:
+    recognition_service = RecognitionService(
+        worker_count=SecurityConfig.RECOGNITION_WORKERS,
+        db_path='facecheck.db',
+        job_timeout=SecurityConfig.RECOGNITION_TIMEOUT
+    )
+
+# Asynchronous recognition jobs: frames run on the worker pool, or on one
+# background thread so request threads never run the dlib pipeline
+inline_recognition_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recognition-job')
+
+def submit_recognition_job(image_bytes, class_id, multi_face, kiosk_id=None):
+    """Future for one frame's result; near-duplicates of a recent frame resolve at once
+    Called from the async detect request, so wants_timings() still sees that request"""
+    started = time.perf_counter()
+    echo_timings = wants_timings()
+    context = (class_id, multi_face)
+    cache_timer = StageTimer()
+    with cache_timer.stage('cache'):
+        cached, frame_key = frame_cache.lookup(kiosk_id, image_bytes, context)
+    if cached:
+        cached = recheck_cached_result(cached, image_bytes, kiosk_id, cache_timer)
+    if cached:
+        timings = record_timings('detect_async', kiosk_id, cached, started, cache_timer.timings)
+        if echo_timings:
+            cached['timings'] = timings
+        future = Future()
+        future.set_result(cached)
+        return future
+    
+    if recognition_service:
+        session = face_tracker.session(kiosk_id)
+        liveness = liveness_states.get(kiosk_id)
+        tracks, liveness_sent = kiosk_snapshots(session, liveness)
+        future = recognition_service.submit(image_bytes, class_id=class_id, multi_face=multi_face,
+                                            tracks=tracks, liveness=liveness_sent)
+        
+        def restore_state(done):
+            # Runs before the cache and job callbacks, so they never see 'tracking_state'/'liveness_state'
+            if not done.cancelled() and done.exception() is None:
+                restore_kiosk_state(done.result(), session, tracks, liveness, liveness_sent)
+        future.add_done_callback(restore_state)
+    else:
+        future = inline_recognition_executor.submit(recognize_for_kiosk, image_bytes, class_id, multi_face, kiosk_id)
+    
+    def record(done):
+        # Before remember(): the cache never keeps one request's timings
+        if not done.cancelled() and done.exception() is None:
+            timings = record_timings('detect_async', kiosk_id, done.result(), started, cache_timer.timings)
+            if echo_timings:
+                done.result()['timings'] = timings
+    
+    def remember(done):
+        if not done.cancelled() and done.exception() is None and cacheable_result(done.result()):
+            result = {key: value for key, value in done.result().items() if key != 'timings'}
+            frame_cache.store(kiosk_id, frame_key, result, context)
+    future.add_done_callback(record)
+    future.add_done_callback(remember)
+    return future
+
+# Near-duplicate frames from the same kiosk reuse the previous result for a short TTL
+frame_cache = FrameResultCache(
+    ttl=SecurityConfig.FRAME_CACHE_TTL,
+    max_distance=SecurityConfig.FRAME_CACHE_MAX_DISTANCE,
+    method=SecurityConfig.FRAME_CACHE_HASH
+)
+
+# Per-kiosk face tracks: identities carry over between frames until re-verification
+face_tracker = FaceTracker(
+    reverify_every=SecurityConfig.TRACK_REVERIFY_EVERY,
+    idle_timeout=SecurityConfig.TRACK_IDLE_TIMEOUT,
+    tolerance=MATCH_TOLERANCE
+)
+
+# Per-kiosk anti-spoofing motion/blink history (one kiosk's frames never mix with another's)
+# Kept in this process's memory, like the tracks and the frame cache: serve with one
+# web process (threads for concurrency, RECOGNITION_WORKERS for CPU)
+liveness_states = LivenessStateStore(
+    max_kiosks=SecurityConfig.LIVENESS_MAX_KIOSKS,
+    idle_timeout=SecurityConfig.LIVENESS_IDLE_TIMEOUT
+)
+
+def kiosk_snapshots(session, liveness):
+    """The kiosk's tracks (None without tracking) and liveness history to send with a worker job"""
+    if session is None:
+        return None, liveness.snapshot()
+    with session.lock:
+        return session.snapshot(), liveness.snapshot()
+
+def restore_kiosk_state(result, session, tracks, liveness, liveness_sent):
+    """
+    Adopt the tracks and liveness history a worker returned with result
+    Frames of one kiosk can run on two workers at once: each state is only
+    adopted if it did not change since the snapshot sent with the job (so the
+    slower frame never rolls it back); otherwise that frame's update is dropped
+    """
+    liveness.restore(result.pop('liveness_state', None), expected_version=liveness_sent['version'])
+    state = result.pop('tracking_state', None)
+    if session:
+        with session.lock:
+            session.restore(state, expected_version=tracks['version'])
+
+def recognize_for_kiosk(image_bytes, class_id, multi_face, kiosk_id, gallery='student'):
+    """Blocking recognition of one frame using the kiosk's tracking session
+    gallery is 'student' (class attendance) or 'faculty' (event check-in)"""
+    session = face_tracker.session(kiosk_id)
+    liveness = liveness_states.get(kiosk_id)
+    if recognition_service:
+        tracks, liveness_sent = kiosk_snapshots(session, liveness)
+        result = recognition_service.recognize(image_bytes, class_id=class_id, multi_face=multi_face,
+                                               tracks=tracks, gallery=gallery, liveness=liveness_sent)
+        restore_kiosk_state(result, session, tracks, liveness, liveness_sent)
+        return result
+    if session is None:
+        return process_face_recognition(image_bytes, class_id=class_id, multi_face=multi_face, gallery=gallery,
+                                        liveness=liveness)
+    with session.lock:
+        return process_face_recognition(image_bytes, class_id=class_id, multi_face=multi_face, tracking=session,
+                                        gallery=gallery, liveness=liveness)
+
+# Per-stage latency by endpoint and kiosk (Prometheus /metrics and the admin metrics view)
+stage_metrics = StageMetrics(
+    window_seconds=SecurityConfig.STAGE_METRICS_WINDOW,
+    max_kiosks=SecurityConfig.STAGE_METRICS_MAX_KIOSKS
+)
+
+def record_timings(endpoint, kiosk_id, result, started, extra=None):
+    """Move a result's stage timings (ms) into stage_metrics, adding 'total'; returns them"""
+    timings = dict(extra or {})
+    if isinstance(result, dict):
+        timings.update(result.pop('timings', None) or {})
+    timings['total'] = round((time.perf_counter() - started) * 1000.0, 3)
+    stage_metrics.observe(endpoint, kiosk_id, timings)
+    return timings
+
+def wants_timings():
+    """Echo stage timings in detect responses: DEBUG_TIMINGS, or debug_timings=1 from an admin"""
+    if SecurityConfig.DEBUG_TIMINGS:
+        return True
+    return (session.get('role') == 'admin'
+            and request.values.get('debug_timings', '').lower() in ('1', 'true', 'yes'))
+
+def cacheable_result(result):
+    """Only results of a full pipeline run (they carry 'detection') with no face rejected as a spoof are reused"""
+    if not isinstance(result, dict) or 'detection' not in result:
+        return False
+    faces = result.get('faces') or [result]
+    return all(face.get('student_id') != 'SPOOFING_DETECTED' for face in faces)
+
+def recheck_cached_result(cached, image_bytes, kiosk_id, timer):
+    """
+    A cache hit reuses identities, never an anti-spoofing verdict: landmarks and
+    the anti-spoofing checks run again on this frame at the cached face
+    locations, with the kiosk's motion history (milliseconds, against the
+    detection and encoding the hit still skips). A frame with no face has
+    nothing to check. None: treat it as a miss
+    """
+    if not ANTI_SPOOFING_AVAILABLE or cached.get('face_locations') == []:
+        return cached
+    with timer.stage('decode'):
+        image = decode_image(image_bytes)
+    if image is None or not FACE_RECOGNITION_AVAILABLE:
+        return None
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return recheck_anti_spoofing(rgb_image, cached, liveness=liveness_states.get(kiosk_id), timer=timer)
+
+# Uploaded frames stay in memory; optionally sample some to disk for debugging
+debug_frames = FrameCaptureRing(
+    directory=os.path.join(SecurityConfig.TEMP_FOLDER, 'debug_frames'),
+    capacity=SecurityConfig.DEBUG_CAPTURE_FRAMES,
+    every=SecurityConfig.DEBUG_CAPTURE_EVERY
+)
+
+recognition_jobs = RecognitionJobManager(
+    submit_recognition_job,
+    max_age=SecurityConfig.RECOGNITION_JOB_MAX_AGE,
+    max_pending=SecurityConfig.RECOGNITION_JOB_QUEUE_LIMIT
+)
+
+def invalidate_class_gallery(class_id):
+    """Forget the cached roster of a class after enrollment changes"""
+    if ENCODING_STORE_AVAILABLE:
+        class_galleries.invalidate(class_id)
+    frame_cache.clear()
+    face_tracker.reset_all()
+    if recognition_service:
+        recognition_service.broadcast('invalidate_class', class_id)
+
+def refresh_gallery_user(user_id):
+    """Push one user's registration/status change into the in-memory gallery"""
+    if not ENCODING_STORE_AVAILABLE:
+        return
+    try:
+        student_gallery.refresh_user(user_id)
+        faculty_gallery.refresh_user(user_id)
+    except Exception as e:
+        print(f"Warning: Failed to refresh gallery for user {user_id}: {e}")
+    frame_cache.clear()
+    face_tracker.reset_all()
+    if recognition_service:
+        recognition_service.broadcast('refresh_user', user_id)
+
+# Background consistency passes over registered photos (keeps face_registered current)
+gallery_maintainer = None
+if ENCODING_STORE_AVAILABLE:
+    gallery_maintainer = GalleryMaintainer(
+        'facecheck.db', encoding_store,
+        on_change=lambda user_ids: [refresh_gallery_user(user_id) for user_id in user_ids]
+    )
+
+# Event door check-ins: queued, de-duplicated and committed in batches by one writer thread
+event_checkins = EventCheckinWriter('facecheck.db', max_batch=SecurityConfig.EVENT_CHECKIN_BATCH_SIZE)
+
 app = Flask(__name__)
 # Generate secure secret key from environment or create new one
 app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
@@ -50,6 +323,12 @@ app.config.update(
     SESSION_REFRESH_EACH_REQUEST=True  # Refresh session on each request
 )
 
+@app.before_request
+def start_background_jobs():
+    """Start the gallery consistency thread with the first request (not on import)"""
+    if gallery_maintainer:
+        gallery_maintainer.start(SecurityConfig.GALLERY_CHECK_INTERVAL)
+
 # Rate limiting for login attempts
 login_attempts = {}
 
@@ -87,14 +366,9 @@ def get_db_connection():
         conn.row_factory = sqlite3.Row
         # Enable foreign key constraints
         conn.execute('PRAGMA foreign_keys = ON')
-        # Ensure expected schema exists (idempotent)
+        # Ensure expected schema exists (idempotent): faculty.attendance_image, face_registered flags
         try:
-            cur = conn.cursor()
-            cur.execute("PRAGMA table_info(faculty)")
-            columns = [row[1] for row in cur.fetchall()]
-            if 'attendance_image' not in columns:
-                cur.execute("ALTER TABLE faculty ADD COLUMN attendance_image VARCHAR(255)")
-                conn.commit()
+            ensure_registration_schema(conn)
         except Exception:
             # Ignore if PRAGMA/ALTER not applicable; app may still function without this column
             pass
@@ -537,6 +811,7 @@ def edit_user(user_id):
                     ''', (position, user_id))
             
             conn.commit()
+            refresh_gallery_user(user_id)
             flash('User updated successfully', 'success')
             
         except Exception as e:
@@ -599,6 +874,8 @@ def toggle_user_status(user_id):
         conn.commit()
         conn.close()
         
+        refresh_gallery_user(user_id)
+        
         status_text = 'activated' if new_status else 'deactivated'
         flash(f'User {status_text} successfully', 'success')
         
@@ -867,6 +1144,8 @@ def enroll_student_to_class(class_id):
         conn.commit()
         conn.close()
         
+        invalidate_class_gallery(class_id)
+        
         flash('Student enrolled successfully', 'success')
         
     except Exception as e:
@@ -910,6 +1189,8 @@ def bulk_enroll_students(class_id):
         conn.commit()
         conn.close()
         
+        invalidate_class_gallery(class_id)
+        
         if enrolled_count > 0:
             flash(f'Successfully enrolled {enrolled_count} student(s)', 'success')
         if already_enrolled > 0:
@@ -946,6 +1227,8 @@ def bulk_unenroll_students(class_id):
         conn.commit()
         conn.close()
         
+        invalidate_class_gallery(class_id)
+        
         flash(f'Successfully removed {unenrolled_count} student(s) from the class', 'success')
         
     except Exception as e:
@@ -970,6 +1253,8 @@ def unenroll_student_from_class(class_id, student_id):
         conn.commit()
         conn.close()
         
+        invalidate_class_gallery(class_id)
+        
         flash('Student unenrolled successfully', 'success')
         
     except Exception as e:
@@ -1177,7 +1462,7 @@ def student_dashboard():
     
     # Get student info
     student = conn.execute('''
-        SELECT u.*, s.student_id, s.year_level, s.attendance_image, c.course_name, d.dept_name
+        SELECT u.*, s.student_id, s.year_level, s.attendance_image, s.face_registered, c.course_name, d.dept_name
         FROM user u
         JOIN student s ON u.user_id = s.user_id
         LEFT JOIN course c ON s.course_id = c.course_id
@@ -1237,27 +1522,8 @@ def student_dashboard():
     # Get today's attendance status (single record or None)
     today_status = today_attendance[0] if today_attendance else None
     
-    # Check if student has registered their face (check database first, then file system)
-    has_face_registered = False
-    
-    # Check if attendance_image is stored in database
-    if student['attendance_image']:
-        # Verify the file actually exists
-        if os.path.exists(student['attendance_image']):
-            has_face_registered = True
-        else:
-            # File doesn't exist, clear the database record
-            conn.execute('UPDATE student SET attendance_image = NULL WHERE user_id = ?', (session['user_id'],))
-            conn.commit()
-    
-    # Fallback: check file system directly (for backward compatibility)
-    if not has_face_registered:
-        face_image_path = f"known_faces/{student['idno']}.jpg"
-        if os.path.exists(face_image_path):
-            # Update database with the file path
-            conn.execute('UPDATE student SET attendance_image = ? WHERE user_id = ?', (face_image_path, session['user_id']))
-            conn.commit()
-            has_face_registered = True
+    # Kept current by the gallery consistency check (missing files, photos saved by older tools)
+    has_face_registered = bool(student['face_registered'])
     
     conn.close()
     return render_template('student_dashboard.html', 
@@ -1276,7 +1542,7 @@ def faculty_dashboard():
     
     # Get faculty info
     faculty = conn.execute('''
-        SELECT u.*, f.faculty_id, f.position, f.attendance_image, d.dept_name
+        SELECT u.*, f.faculty_id, f.position, f.attendance_image, f.face_registered, d.dept_name
         FROM user u
         JOIN faculty f ON u.user_id = f.user_id
         LEFT JOIN department d ON u.dept_id = d.dept_id
@@ -1334,16 +1600,8 @@ def faculty_dashboard():
             'status': record['attendance_status']
         })
     
-    # Check if faculty has registered their face
-    has_face_registered = False
-    if faculty['attendance_image']:
-        import os
-        if os.path.exists(faculty['attendance_image']):
-            has_face_registered = True
-        else:
-            # File doesn't exist, clear the database record
-            conn.execute('UPDATE faculty SET attendance_image = NULL WHERE user_id = ?', (session['user_id'],))
-            conn.commit()
+    # Kept current by the gallery consistency check
+    has_face_registered = bool(faculty['face_registered'])
     
     conn.close()
     return render_template('faculty/faculty_dashboard.html', 
@@ -1391,7 +1649,7 @@ def api_register_face():
         # Get student info
         conn = get_db_connection()
         student = conn.execute('''
-            SELECT u.idno FROM user u
+            SELECT u.idno, s.student_id FROM user u
             JOIN student s ON u.user_id = s.user_id
             WHERE u.user_id = ?
         ''', (session['user_id'],)).fetchone()
@@ -1480,10 +1738,21 @@ def api_register_face():
         try:
             conn.execute('''
                 UPDATE student 
-                SET attendance_image = ? 
+                SET attendance_image = ?, face_registered = 1 
                 WHERE user_id = ?
             ''', (face_path, session['user_id']))
             
+            # Keep the photo as a reference template and cache it as the current encoding
+            # (template first: it seeds the previously cached photo as a template)
+            if ENCODING_STORE_AVAILABLE:
+                image_hash = file_content_hash(face_path)
+                encoding_store.add_template('student', student['student_id'], face_path, face_encodings[0],
+                                            image_hash=image_hash, conn=conn,
+                                            max_templates=SecurityConfig.FACE_TEMPLATE_CAP,
+                                            policy=SecurityConfig.FACE_TEMPLATE_POLICY)
+                encoding_store.save_encoding('student', student['student_id'], face_path,
+                                             face_encodings[0], image_hash=image_hash, conn=conn)
+            
             conn.commit()
         except Exception as e:
             # Clean up the saved file if database update fails
@@ -1493,6 +1762,8 @@ def api_register_face():
         finally:
             conn.close()
         
+        refresh_gallery_user(session['user_id'])
+        
         return jsonify({'success': True, 'message': 'Face registered successfully'})
         
     except Exception as e:
@@ -1515,7 +1786,7 @@ def api_faculty_register_face():
         # Get faculty info
         conn = get_db_connection()
         faculty = conn.execute('''
-            SELECT u.idno FROM user u
+            SELECT u.idno, f.faculty_id FROM user u
             JOIN faculty f ON u.user_id = f.user_id
             WHERE u.user_id = ?
         ''', (session['user_id'],)).fetchone()
@@ -1570,12 +1841,23 @@ def api_faculty_register_face():
         # Update the faculty record with the attendance_image path
         conn.execute('''
             UPDATE faculty 
-            SET attendance_image = ? 
+            SET attendance_image = ?, face_registered = 1 
             WHERE user_id = ?
         ''', (face_path, session['user_id']))
         
+        # Keep the photo as a reference template and cache it so event recognition never re-encodes it
+        if ENCODING_STORE_AVAILABLE:
+            image_hash = file_content_hash(face_path)
+            encoding_store.add_template('faculty', faculty['faculty_id'], face_path, face_encodings[0],
+                                        image_hash=image_hash, conn=conn,
+                                        max_templates=SecurityConfig.FACE_TEMPLATE_CAP,
+                                        policy=SecurityConfig.FACE_TEMPLATE_POLICY)
+            encoding_store.save_encoding('faculty', faculty['faculty_id'], face_path,
+                                         face_encodings[0], image_hash=image_hash, conn=conn)
+        
         conn.commit()
         conn.close()
+        refresh_gallery_user(session['user_id'])
         return jsonify({'success': True, 'message': 'Face registered successfully'})
         
     except ImportError as e:
@@ -1597,31 +1879,30 @@ def api_students():
     
     return jsonify([dict(student) for student in students])
 
-def calculate_ear(eye_landmarks):
-    """Calculate Eye Aspect Ratio (EAR) for blink detection"""
-    import numpy as np 
-    
-    # Convert to numpy array
-    eye = np.array(eye_landmarks)
-    
-    # Calculate distances
-    A = np.linalg.norm(eye[1] - eye[5])  # Vertical distance 1
-    B = np.linalg.norm(eye[2] - eye[4])  # Vertical distance 2
-    C = np.linalg.norm(eye[0] - eye[3])    # Horizontal distance
-    
-    # Calculate EAR
-    ear = (A + B) / (2.0 * C)
-    return ear
-
-def process_face_recognition(image_path):
-    """Process face recognition using the same logic as face_recog_test.py"""
+def process_face_recognition(image_data, class_id=None, multi_face=False, tracking=None, gallery='student',
+                             liveness=None):
+    """Process face recognition using the same logic as face_recog_test.py
+    image_data is the uploaded frame as encoded bytes (or an already decoded
+    BGR array); it is decoded in memory, never written to disk.
+    tracking is the kiosk's TrackingSession (see face_tracking.py), if any;
+    liveness is its LivenessState (see liveness_state.py), if any.
+    Results of the pipeline carry its stage timings under 'timings' (ms).
+    When class_id is given, only students enrolled in that class are matched;
+    gallery='faculty' matches registered faculty instead (event check-in).
+    With multi_face every detected face is encoded and matched in one pass and
+    the result carries one entry per face under 'faces'"""
     try:
+        timer = StageTimer()
+        # Decode once; both the dlib pipeline and the OpenCV fallback take the array
+        with timer.stage('decode'):
+            image = decode_image(image_data) if isinstance(image_data, (bytes, bytearray)) else image_data
+        
         # Check if face recognition is available
         if not FACE_RECOGNITION_AVAILABLE:
             print("Using OpenCV fallback for face recognition")
             try:
                 from opencv_face_detector import fallback_face_recognition
-                return fallback_face_recognition(image_path)
+                return fallback_face_recognition(image)
             except ImportError as e:
                 return {
                     'success': False,
@@ -1630,30 +1911,15 @@ def process_face_recognition(image_path):
                     'student_name': 'Unknown'
                 }
         
-        print(f"Processing image: {image_path}")
-        
-        # Load known faces from database
-        conn = get_db_connection()
-        students = conn.execute('''
-            SELECT s.student_id, u.firstname, u.lastname, s.attendance_image
-            FROM student s
-            JOIN user u ON s.user_id = u.user_id
-            WHERE s.attendance_image IS NOT NULL
-        ''').fetchall()
-        conn.close()
-        
-        print(f"Found {len(students)} registered students")
-        
-        if not students:
-            return {
-                'success': False,
-                'message': 'No registered students found',
-                'student_id': 'Unknown',
-                'student_name': 'Unknown'
-            }
+        # In-memory gallery of cached encodings (loaded once, updated incrementally)
+        if gallery == 'faculty':
+            gallery = faculty_gallery.ensure_loaded()
+        else:
+            gallery = student_gallery.ensure_loaded()
+            if class_id:
+                # Only search the roster of the selected class
+                gallery = class_galleries.get(class_id)
         
-        # Load the image
-        image = cv2.imread(image_path)
         if image is None:
             print("Could not load image")
             return {
@@ -1666,210 +1932,13 @@ def process_face_recognition(image_path):
         print(f"Image loaded: {image.shape}")
         
         # Convert BGR to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Find face locations
-        print("Detecting faces...")
-        face_locations = face_recognition.face_locations(rgb_image, number_of_times_to_upsample=1, model="hog")
-        print(f"Found {len(face_locations)} face(s)")
-        
-        if not face_locations:
-            return {
-                'success': False,
-                'message': 'No face detected',
-                'student_id': 'Unknown',
-                'student_name': 'Unknown'
-            }
-        
-        # Get face encodings and landmarks
-        print("Encoding faces...")
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        face_landmarks = face_recognition.face_landmarks(rgb_image, face_locations)
-        print(f"Generated {len(face_encodings)} face encoding(s)")
-        
-        if not face_encodings:
-            return {
-                'success': False,
-                'message': 'Could not encode face',
-                'student_id': 'Unknown',
-                'student_name': 'Unknown'
-            }
-        
-        # Perform anti-spoofing check
-        anti_spoofing_result = {'is_live': True, 'confidence': 1.0, 'details': 'Anti-spoofing disabled'}
-        if ANTI_SPOOFING_AVAILABLE and face_landmarks:
-            print("Performing anti-spoofing analysis...")
-            anti_spoofing_result = anti_spoofing_detector.comprehensive_anti_spoofing_check(
-                rgb_image, face_landmarks[0], face_locations[0]
-            )
-            print(f"Anti-spoofing result: {anti_spoofing_result['details']}")
-            
-            # Check if face passes anti-spoofing
-            if not anti_spoofing_result['is_live']:
-                return {
-                    'success': False,
-                    'message': f"Spoofing attempt detected! {anti_spoofing_result['details']}",
-                    'student_id': 'SPOOFING_DETECTED',
-                    'student_name': 'Spoofing Attempt',
-                    'anti_spoofing': anti_spoofing_result
-                }
-        
-        # Calculate real liveness detection metrics
-        eye_ratio = 0.0
-        nose_motion = 0.0
-        
-        if face_landmarks:
-            landmarks = face_landmarks[0]  # Get landmarks for the first face
-            
-            # Calculate Eye Aspect Ratio (EAR) for blink detection
-            if 'left_eye' in landmarks and 'right_eye' in landmarks:
-                left_eye = landmarks['left_eye']
-                right_eye = landmarks['right_eye']
-                
-                # Calculate EAR for both eyes
-                left_ear = calculate_ear(left_eye)
-                right_ear = calculate_ear(right_eye)
-                eye_ratio = (left_ear + right_ear) / 2.0
-                
-                print(f"Eye Aspect Ratio: {eye_ratio}")
-            
-            # Calculate nose motion (simplified - using nose tip position)
-            if 'nose_tip' in landmarks:
-                nose_tip = landmarks['nose_tip']
-                if len(nose_tip) > 0:
-                    # Use nose tip position as motion indicator
-                    nose_motion = len(nose_tip) * 2.0  # Simplified motion calculation
-                    print(f"Nose motion: {nose_motion}")
-        
-        print(f"Liveness metrics - Eye ratio: {eye_ratio}, Nose motion: {nose_motion}")
-        
-        # Compare with known faces
-        print("Comparing with known faces...")
-        best_match = None
-        best_distance = float('inf')
-        
-        for student in students:
-            print(f"Checking student: {student['firstname']} {student['lastname']}")
-            if not student['attendance_image'] or not os.path.exists(student['attendance_image']):
-                print(f"  No valid image: {student['attendance_image']}")
-                continue
-                
-            # Load known face
-            known_image = cv2.imread(student['attendance_image'])
-            if known_image is None:
-                print(f"  Could not load image: {student['attendance_image']}")
-                continue
-                
-            known_rgb = cv2.cvtColor(known_image, cv2.COLOR_BGR2RGB)
-            known_encodings = face_recognition.face_encodings(known_rgb)
-            
-            if not known_encodings:
-                print(f"  Could not encode known face")
-                continue
-            
-            # Calculate distance
-            distances = face_recognition.face_distance(known_encodings, face_encodings[0])
-            min_distance = min(distances)
-            print(f"  Distance: {min_distance}")
-            
-            if min_distance < best_distance:
-                best_distance = min_distance
-                best_match = student
-        
-        # Check if match is good enough (tolerance from face_recog_test.py)
-        MATCH_TOLERANCE = 0.62
-        print(f"Best match: {best_match['firstname'] if best_match else 'None'}")
-        print(f"Best distance: {best_distance}")
-        print(f"Tolerance: {MATCH_TOLERANCE}")
-        
-        # Get face location coordinates for drawing box
-        # Use landmarks for more accurate face bounding box (like real-world systems)
-        face_box = None
-        if face_landmarks and len(face_landmarks) > 0:
-            # Calculate precise bounding box from facial landmarks
-            landmarks = face_landmarks[0]
-            all_points = []
-            
-            # Collect all landmark points
-            for feature_name in ['chin', 'left_eyebrow', 'right_eyebrow', 'nose_bridge', 
-                                 'nose_tip', 'left_eye', 'right_eye', 'top_lip', 'bottom_lip']:
-                if feature_name in landmarks:
-                    all_points.extend(landmarks[feature_name])
-            
-            if all_points:
-                # Find min and max coordinates
-                all_x = [p[0] for p in all_points]
-                all_y = [p[1] for p in all_points]
-                
-                min_x = min(all_x)
-                max_x = max(all_x)
-                min_y = min(all_y)
-                max_y = max(all_y)
-                
-                # Add small margin for better visualization (10% padding)
-                width = max_x - min_x
-                height = max_y - min_y
-                margin_x = int(width * 0.15)  # 15% horizontal margin
-                margin_y = int(height * 0.20)  # 20% vertical margin (more for forehead/hair)
-                
-                # Apply margins with boundary checking
-                min_x = max(0, min_x - margin_x)
-                min_y = max(0, min_y - margin_y)
-                max_x = min(rgb_image.shape[1], max_x + margin_x)
-                max_y = min(rgb_image.shape[0], max_y + margin_y)
-                
-                face_box = {
-                    'x': int(min_x),
-                    'y': int(min_y),
-                    'width': int(max_x - min_x),
-                    'height': int(max_y - min_y)
-                }
-        elif face_locations:
-            # Fallback to basic face_locations if landmarks not available
-            top, right, bottom, left = face_locations[0]
-            face_box = {
-                'x': int(left),
-                'y': int(top),
-                'width': int(right - left),
-                'height': int(bottom - top)
-            }
+        with timer.stage('decode'):
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
-        if best_match and best_distance <= MATCH_TOLERANCE:
-            print("Match found!")
-            confidence = int((1 - best_distance) * 100)  # Convert distance to confidence percentage
-            return {
-                'success': True,
-                'student_id': int(best_match['student_id']),
-                'student_name': f"{best_match['firstname']} {best_match['lastname']}",
-                'distance': float(best_distance),
-                'confidence': confidence,
-                'face_box': face_box,  # Add face location for drawing box
-                'eye_ratio': float(eye_ratio),  # Real eye aspect ratio
-                'nose_motion': float(nose_motion),  # Real nose motion
-                'anti_spoofing': {
-                    'is_live': bool(anti_spoofing_result.get('is_live', True)),
-                    'confidence': float(anti_spoofing_result.get('confidence', 1.0)),
-                    'details': str(anti_spoofing_result.get('details', 'Anti-spoofing disabled'))
-                }
-            }
-        else:
-            print("No match found")
-            return {
-                'success': False,
-                'message': 'No matching student found',
-                'student_id': 'Unknown',
-                'student_name': 'Unknown',
-                'distance': float(best_distance if best_match else 999.0),  # Use 999.0 instead of float('inf')
-                'confidence': 0,
-                'face_box': face_box,  # Still provide face box even if no match
-                'eye_ratio': float(eye_ratio),
-                'nose_motion': float(nose_motion),
-                'anti_spoofing': {
-                    'is_live': bool(anti_spoofing_result.get('is_live', True)),
-                    'confidence': float(anti_spoofing_result.get('confidence', 1.0)),
-                    'details': str(anti_spoofing_result.get('details', 'Anti-spoofing disabled'))
-                }
-            }
+        result = recognize_frame(rgb_image, gallery, face_detector, multi_face=multi_face, class_id=class_id,
+                                 tracking=tracking, timer=timer, liveness=liveness)
+        result['timings'] = timer.timings
+        return result
             
     except Exception as e:
         print(f"Error in process_face_recognition: {str(e)}")
@@ -1910,8 +1979,8 @@ def api_attendance_detect():
             'current_role': user_role
         }), 401
     
-    filepath = None
     try:
+        started = time.perf_counter()
         # Get the uploaded image
         if 'image' not in request.files:
             return jsonify({'success': False, 'message': 'No image provided'}), 400
@@ -1920,36 +1989,58 @@ def api_attendance_detect():
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No image selected'}), 400
         
-        # Save the image temporarily with secure filename
-        import uuid
-        safe_filename = f"temp_{session['user_id']}_{uuid.uuid4().hex[:8]}.jpg"
-        filepath = os.path.join('temp', safe_filename)
-        os.makedirs('temp', mode=0o755, exist_ok=True)
+        # Optional class scope: match only students enrolled in the selected class
+        class_id = request.form.get('class_id', type=int)
+        # Multi-face mode: recognize everyone in frame, one result per face
+        multi_face = request.form.get('multi_face', '').lower() in ('1', 'true', 'yes')
         
-        # Validate file size before saving
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > 10 * 1024 * 1024:  # 10MB limit
+        # Read the frame into memory (no temp file round trip)
+        image_bytes = file.read()
+        if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
             return jsonify({'success': False, 'message': 'File too large'}), 400
-        
-        file.save(filepath)
-        
-        # Check if face recognition is available
-        if not FACE_RECOGNITION_AVAILABLE:
-            return jsonify({
-                'success': False, 
-                'message': 'Face recognition system is not configured. Please install required packages.',
-                'student_id': 'Unknown',
-                'student_name': 'Unknown'
-            }), 503
-        
-        # Process the image for face recognition
-        print(f"Processing face recognition for image: {filepath}")
-        result = process_face_recognition(filepath)
+        debug_frames.capture(image_bytes, 'detect')
+        
+        # A near-duplicate of this kiosk's last frames reuses that result
+        kiosk_id = kiosk_id_for(request.form.get('kiosk_id'))
+        cache_context = (class_id, multi_face)
+        cache_timer = StageTimer()
+        with cache_timer.stage('cache'):
+            cached, frame_key = frame_cache.lookup(kiosk_id, image_bytes, cache_context)
+        if cached:
+            cached = recheck_cached_result(cached, image_bytes, kiosk_id, cache_timer)
+        if cached:
+            print(f"Recognition result (cached, distance {cached['cache_distance']}): {cached.get('student_name')}")
+            timings = record_timings('detect', kiosk_id, cached, started, cache_timer.timings)
+            if wants_timings():
+                cached['timings'] = timings
+            return jsonify(cached)
+        
+        if recognition_service:
+            # Hand the JPEG bytes to a recognition worker process
+            try:
+                result = recognize_for_kiosk(image_bytes, class_id, multi_face, kiosk_id)
+            except FutureTimeoutError:
+                return jsonify({'success': False, 'message': 'Recognition timed out, please try again'}), 503
+        else:
+            # Check if face recognition is available
+            if not FACE_RECOGNITION_AVAILABLE:
+                return jsonify({
+                    'success': False, 
+                    'message': 'Face recognition system is not configured. Please install required packages.',
+                    'student_id': 'Unknown',
+                    'student_name': 'Unknown'
+                }), 503
+            
+            # Process the image for face recognition
+            print(f"Processing face recognition for frame ({len(image_bytes)} bytes)")
+            result = recognize_for_kiosk(image_bytes, class_id, multi_face, kiosk_id)
         print(f"Recognition result: {result}")
         
+        timings = record_timings('detect', kiosk_id, result, started, cache_timer.timings)
+        if cacheable_result(result):
+            frame_cache.store(kiosk_id, frame_key, result, cache_context)
+        if wants_timings():
+            result = dict(result, timings=timings)
         return jsonify(result)
         
     except Exception as e:
@@ -1957,13 +2048,102 @@ def api_attendance_detect():
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
-    finally:
-        # Always clean up temp file
-        if filepath and os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Warning: Failed to clean up temp file {filepath}: {e}")
+
+def kiosk_id_for(value):
+    """Kiosks are scoped to the logged-in user; without an id the user is one kiosk"""
+    return f"{session['user_id']}:{str(value or 'default')[:64]}"
+
+@app.route('/api/attendance/detect/async', methods=['POST'])
+def api_attendance_detect_async():
+    """Queue a frame for recognition and return its job id immediately
+    A newer frame from the same kiosk supersedes one that is still queued"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Your session has expired. Please logout and login again to continue.',
+                        'expired': True, 'redirect': '/login'}), 401
+    if session.get('role') not in ['faculty', 'admin']:
+        return jsonify({'success': False, 'message': 'Only faculty and admin can access this feature.'}), 401
+    
+    if 'image' not in request.files or request.files['image'].filename == '':
+        return jsonify({'success': False, 'message': 'No image provided'}), 400
+    
+    image_bytes = request.files['image'].read()
+    if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
+        return jsonify({'success': False, 'message': 'File too large'}), 400
+    
+    debug_frames.capture(image_bytes, 'detect_async')
+    
+    class_id = request.form.get('class_id', type=int)
+    multi_face = request.form.get('multi_face', '').lower() in ('1', 'true', 'yes')
+    kiosk_id = kiosk_id_for(request.form.get('kiosk_id'))
+    
+    try:
+        job = recognition_jobs.submit(kiosk_id, session['user_id'], image_bytes,
+                                      class_id=class_id, multi_face=multi_face)
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'message': f'Recognition is busy, frame dropped ({e})'}), 503
+    
+    return jsonify({'success': True, 'job_id': job.job_id, 'seq': job.seq, 'status': job.status}), 202
+
+@app.route('/api/attendance/jobs/<job_id>')
+def api_attendance_job(job_id):
+    """Job status and result; ?wait=N long-polls up to N seconds for it to finish"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 25)
+    job = recognition_jobs.wait(job_id, timeout=wait) if wait else recognition_jobs.get(job_id)
+    if job is None or (job.owner != session['user_id'] and session.get('role') != 'admin'):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    response = job.to_dict()
+    response['success'] = True
+    response['finished'] = job.status in FINAL_STATES
+    return jsonify(response)
+
+@app.route('/api/attendance/jobs/stream')
+def api_attendance_job_stream():
+    """Server-sent events: one event per finished job of a kiosk (event name = job status)"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    kiosk_id = kiosk_id_for(request.args.get('kiosk_id'))
+    # EventSource resends the last id it saw when it reconnects
+    after = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', type=int)
+    if after is None:
+        after = recognition_jobs.latest_seq()
+    
+    def events(after):
+        yield 'retry: 2000\n\n'
+        deadline = time.time() + 300  # the browser reconnects, so threads are not held forever
+        while time.time() < deadline:
+            jobs = recognition_jobs.wait_kiosk(kiosk_id, after_seq=after, timeout=15)
+            if not jobs:
+                yield ': keep-alive\n\n'
+                continue
+            for job in jobs:
+                after = job.seq
+                if job.owner == user_id:
+                    yield f"id: {job.seq}\nevent: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+    
+    return Response(stream_with_context(events(after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def anti_spoofing_rejection(anti_spoofing_data):
+    """Error payload when client-reported anti-spoofing results fail, otherwise None"""
+    if ANTI_SPOOFING_AVAILABLE and anti_spoofing_data:
+        is_live = anti_spoofing_data.get('is_live', True)
+        confidence = anti_spoofing_data.get('confidence', 1.0)
+        
+        if not is_live or confidence < 0.5:
+            print(f"⚠️ Anti-spoofing failed: live={is_live}, confidence={confidence}")
+            return {
+                'success': False,
+                'message': f'Anti-spoofing check failed. Confidence: {confidence:.1%}',
+                'spoofing_detected': True,
+                'anti_spoofing_details': anti_spoofing_data.get('details', 'Low confidence score')
+            }
+    return None
 
 @app.route('/api/attendance/mark', methods=['POST'])
 def api_attendance_mark():
@@ -1998,18 +2178,9 @@ def api_attendance_mark():
             }), 403
         
         # Validate anti-spoofing results if available
-        if ANTI_SPOOFING_AVAILABLE and anti_spoofing_data:
-            is_live = anti_spoofing_data.get('is_live', True)
-            confidence = anti_spoofing_data.get('confidence', 1.0)
-            
-            if not is_live or confidence < 0.5:
-                print(f"⚠️ Anti-spoofing failed: live={is_live}, confidence={confidence}")
-                return jsonify({
-                    'success': False,
-                    'message': f'Anti-spoofing check failed. Confidence: {confidence:.1%}',
-                    'spoofing_detected': True,
-                    'anti_spoofing_details': anti_spoofing_data.get('details', 'Low confidence score')
-                }), 403
+        rejection = anti_spoofing_rejection(anti_spoofing_data)
+        if rejection:
+            return jsonify(rejection), 403
         
         # Mark attendance in database
         conn = get_db_connection()
@@ -2065,6 +2236,111 @@ def api_attendance_mark():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/attendance/mark/batch', methods=['POST'])
+def api_attendance_mark_batch():
+    """Mark attendance for every student recognized in a multi-face frame in one transaction"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized - Please login'}), 401
+    
+    # Allow both faculty and admin to access this endpoint
+    if session.get('role') not in ['faculty', 'admin']:
+        return jsonify({'success': False, 'message': 'Unauthorized - Faculty or Admin access required'}), 401
+    
+    conn = None
+    try:
+        data = request.get_json() or {}
+        class_id = data.get('class_id')
+        students = data.get('students') or []
+        
+        if not class_id or not students:
+            return jsonify({'success': False, 'message': 'Missing students or class information'}), 400
+        
+        # Screen each face before touching the database
+        results = []
+        candidates = {}
+        for entry in students:
+            student_id = entry.get('student_id')
+            student_name = entry.get('student_name') or ''
+            if not student_id or student_id in ('Unknown', 'SPOOFING_DETECTED'):
+                results.append({'student_id': student_id, 'student_name': student_name, 'status': 'rejected',
+                                'message': 'Spoofing attempt detected' if student_id == 'SPOOFING_DETECTED' else 'Not recognized'})
+                continue
+            rejection = anti_spoofing_rejection(entry.get('anti_spoofing') or {})
+            if rejection:
+                results.append({'student_id': student_id, 'student_name': student_name, 'status': 'rejected',
+                                'message': rejection['message'], 'spoofing_detected': True})
+                continue
+            try:
+                candidates.setdefault(int(student_id), student_name)
+            except (TypeError, ValueError):
+                results.append({'student_id': student_id, 'student_name': student_name, 'status': 'rejected',
+                                'message': 'Invalid student ID'})
+        
+        marked = []
+        if candidates:
+            conn = get_db_connection()
+            placeholders = ','.join('?' * len(candidates))
+            
+            # Enrollment rows for all candidates at once
+            enrolled = {
+                row['student_id']: row['studentclass_id']
+                for row in conn.execute(f'''
+                    SELECT student_id, studentclass_id FROM student_class
+                    WHERE class_id = ? AND student_id IN ({placeholders})
+                ''', (class_id, *candidates)).fetchall()
+            }
+            
+            # Who is already marked today
+            today = datetime.now().strftime('%Y-%m-%d')
+            already = set()
+            if enrolled:
+                sc_placeholders = ','.join('?' * len(enrolled))
+                already = {
+                    row['studentclass_id']
+                    for row in conn.execute(f'''
+                        SELECT studentclass_id FROM attendance
+                        WHERE studentclass_id IN ({sc_placeholders}) AND DATE(attendance_date) = ?
+                    ''', (*enrolled.values(), today)).fetchall()
+                }
+            
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for student_id, student_name in candidates.items():
+                studentclass_id = enrolled.get(student_id)
+                if studentclass_id is None:
+                    results.append({'student_id': student_id, 'student_name': student_name,
+                                    'status': 'not_enrolled', 'message': 'Student not enrolled in this class'})
+                elif studentclass_id in already:
+                    results.append({'student_id': student_id, 'student_name': student_name,
+                                    'status': 'already_marked', 'message': 'Already marked today'})
+                else:
+                    marked.append((studentclass_id, current_time))
+                    results.append({'student_id': student_id, 'student_name': student_name,
+                                    'status': 'marked', 'message': f'Attendance marked for {student_name}'})
+            
+            if marked:
+                conn.executemany('''
+                    INSERT INTO attendance (studentclass_id, attendance_date, attendance_status)
+                    VALUES (?, ?, 'present')
+                ''', marked)
+                conn.commit()
+            print(f"Batch attendance: {len(marked)} marked out of {len(students)} face(s)")
+        
+        return jsonify({
+            'success': bool(marked),
+            'message': f'Attendance marked for {len(marked)} student(s)',
+            'marked_count': len(marked),
+            'results': results,
+            'time': datetime.now().strftime('%H:%M:%S')
+        })
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        if conn:
+            conn.close()
+
 @app.route('/api/attendance', methods=['POST'])
 def api_mark_attendance():
     data = request.get_json()
@@ -2170,6 +2446,197 @@ def api_faculty_classes():
     conn.close()
     return jsonify([dict(record) for record in classes])
 
+@app.route('/api/faculty/events')
+def api_faculty_events():
+    """Get events assigned to the current faculty member"""
+    if 'user_id' not in session or session['role'] != 'faculty':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    
+    faculty = conn.execute('''
+        SELECT f.faculty_id FROM faculty f
+        WHERE f.user_id = ?
+    ''', (session['user_id'],)).fetchone()
+    
+    if not faculty:
+        conn.close()
+        return jsonify([])
+    
+    events = conn.execute('''
+        SELECT e.event_id, e.event_name, e.description, e.event_date, e.start_time, e.end_time, e.room, e.faculty_id
+        FROM event e
+        WHERE e.faculty_id = ?
+        ORDER BY e.event_date DESC, e.start_time
+    ''', (faculty['faculty_id'],)).fetchall()
+    
+    conn.close()
+    return jsonify([dict(record) for record in events])
+
+def session_event(conn, event_id):
+    """The event when the logged-in faculty member runs it (admins may use any event), else None"""
+    event = conn.execute('''
+        SELECT e.event_id, e.event_name, e.faculty_id, f.user_id AS owner_user_id
+        FROM event e
+        LEFT JOIN faculty f ON e.faculty_id = f.faculty_id
+        WHERE e.event_id = ?
+    ''', (event_id,)).fetchone()
+    if event and (session.get('role') == 'admin' or event['owner_user_id'] == session['user_id']):
+        return event
+    return None
+
+def event_participant(face):
+    """One face of a faculty-gallery result in the shape the event page reads (user_id, name)"""
+    participant = {key: value for key, value in face.items() if key not in ('student_id', 'student_name')}
+    if face.get('success'):
+        participant.update(faculty_id=face['student_id'], name=face['student_name'])
+    else:
+        participant.update(user_id='Unknown', name='Unknown')
+        if face.get('message') == 'No matching student found':
+            participant['message'] = 'No matching participant found'
+        if face.get('student_id') == 'SPOOFING_DETECTED':
+            participant['spoofing_detected'] = True
+    return participant
+
+def event_result(result):
+    if result.get('multi_face'):
+        return dict(result, faces=[event_participant(face) for face in result['faces']])
+    return event_participant(result)
+
+@app.route('/api/event/detect', methods=['POST'])
+def api_event_detect():
+    """Recognize faculty participants in a frame from an event check-in kiosk"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Your session has expired. Please logout and login again to continue.',
+                        'expired': True, 'redirect': '/login'}), 401
+    if session.get('role') not in ['faculty', 'admin']:
+        return jsonify({'success': False, 'message': 'Only faculty and admin can access this feature.'}), 401
+    
+    try:
+        started = time.perf_counter()
+        if 'image' not in request.files or request.files['image'].filename == '':
+            return jsonify({'success': False, 'message': 'No image provided'}), 400
+        
+        event_id = request.form.get('event_id', type=int)
+        if not event_id:
+            return jsonify({'success': False, 'message': 'No event selected'}), 400
+        conn = get_db_connection()
+        try:
+            event = session_event(conn, event_id)
+        finally:
+            conn.close()
+        if not event:
+            return jsonify({'success': False, 'message': 'Event not found'}), 404
+        
+        multi_face = request.form.get('multi_face', '').lower() in ('1', 'true', 'yes')
+        image_bytes = request.files['image'].read()
+        if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
+            return jsonify({'success': False, 'message': 'File too large'}), 400
+        debug_frames.capture(image_bytes, 'event_detect')
+        
+        if not recognition_service and not FACE_RECOGNITION_AVAILABLE:
+            return jsonify({'success': False, 'user_id': 'Unknown', 'name': 'Unknown',
+                            'message': 'Face recognition system is not configured. Please install required packages.'}), 503
+        
+        # Event kiosks keep their own tracks and cached results: they match another gallery than class mode
+        kiosk_id = kiosk_id_for(f"event-{event_id}:{request.form.get('kiosk_id') or 'default'}")
+        cache_context = ('event', multi_face)
+        cache_timer = StageTimer()
+        with cache_timer.stage('cache'):
+            cached, frame_key = frame_cache.lookup(kiosk_id, image_bytes, cache_context)
+        if cached:
+            cached = recheck_cached_result(cached, image_bytes, kiosk_id, cache_timer)
+        if cached:
+            timings = record_timings('event_detect', kiosk_id, cached, started, cache_timer.timings)
+            result = event_result(cached)
+            if wants_timings():
+                result['timings'] = timings
+            return jsonify(result)
+        
+        try:
+            result = recognize_for_kiosk(image_bytes, None, multi_face, kiosk_id, gallery='faculty')
+        except FutureTimeoutError:
+            return jsonify({'success': False, 'message': 'Recognition timed out, please try again'}), 503
+        
+        timings = record_timings('event_detect', kiosk_id, result, started, cache_timer.timings)
+        if cacheable_result(result):
+            frame_cache.store(kiosk_id, frame_key, result, cache_context)
+        result = event_result(result)
+        if wants_timings():
+            result['timings'] = timings
+        return jsonify(result)
+        
+    except Exception as e:
+        print(f"Error in api_event_detect: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/event/attendance/mark', methods=['POST'])
+def api_event_attendance_mark():
+    """Check a recognized participant in to an event
+    Check-ins are committed in batches by event_checkins; a participant who is
+    already checked in is answered with already_marked instead of a second row"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized - Please login'}), 401
+    
+    # Allow both faculty and admin to access this endpoint
+    if session.get('role') not in ['faculty', 'admin']:
+        return jsonify({'success': False, 'message': 'Unauthorized - Faculty or Admin access required'}), 401
+    
+    try:
+        data = request.get_json() or {}
+        status = data.get('status') or 'present'
+        if data.get('user_id') in ('Unknown', 'SPOOFING_DETECTED'):
+            return jsonify({'success': False, 'message': 'Participant not recognized'}), 400
+        try:
+            event_id, user_id = int(data.get('event_id')), int(data.get('user_id'))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'Missing event or participant information'}), 400
+        if status not in EVENT_STATUSES:
+            return jsonify({'success': False, 'message': f'Invalid status: {status}'}), 400
+        
+        rejection = anti_spoofing_rejection(data.get('anti_spoofing') or {})
+        if rejection:
+            return jsonify(rejection), 403
+        
+        conn = get_db_connection()
+        try:
+            event = session_event(conn, event_id)
+            participant = conn.execute('''
+                SELECT firstname, lastname FROM user WHERE user_id = ? AND is_active = 1
+            ''', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        if not event:
+            return jsonify({'success': False, 'message': 'Event not found'}), 404
+        if not participant:
+            return jsonify({'success': False, 'message': 'Participant not found'}), 404
+        name = f"{participant['firstname']} {participant['lastname']}"
+        
+        try:
+            checkin = event_checkins.check_in(event_id, user_id, status, timeout=SecurityConfig.RECOGNITION_TIMEOUT)
+        except FutureTimeoutError:
+            return jsonify({'success': False, 'message': 'Check-in timed out, please try again'}), 503
+        
+        attendance_time = checkin['attendance_time']
+        time_str = attendance_time.split(' ')[-1] if attendance_time else None
+        if checkin['status'] != MARKED:
+            return jsonify({'success': False, 'already_marked': True, 'user_id': user_id, 'name': name,
+                            'message': f'{name} is already checked in', 'time': time_str})
+        return jsonify({
+            'success': True,
+            'message': f'Event attendance marked for {name}',
+            'event_id': event_id,
+            'user_id': user_id,
+            'name': name,
+            'status': status,
+            'time': time_str
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/admin/classes/<int:class_id>/delete', methods=['POST'])
 def delete_class(class_id):
     if 'user_id' not in session or session['role'] != 'admin':
@@ -2216,6 +2683,7 @@ def delete_event(event_id):
         conn.execute('DELETE FROM event WHERE event_id = ?', (event_id,))
         
         conn.commit()
+        event_checkins.forget(event_id)
         flash('Event deleted successfully', 'success')
         
     except Exception as e:
@@ -2278,6 +2746,44 @@ def admin_reports():
     
     return render_template('admin_reports.html')
 
+@app.route('/api/admin/recognition/metrics')
+def api_recognition_metrics():
+    """Recognition worker pool status: queue depth and per-worker latency"""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    if not recognition_service:
+        return jsonify({'enabled': False, 'workers': 0, 'jobs': recognition_jobs.metrics(),
+                        'frame_cache': frame_cache.stats(), 'tracking': face_tracker.stats(),
+                        'liveness': liveness_states.stats(),
+                        'stages': stage_metrics.snapshot(),
+                        'gallery_check': gallery_maintainer.status() if gallery_maintainer else None,
+                        'event_checkins': event_checkins.stats()})
+    
+    metrics = recognition_service.metrics()
+    metrics['enabled'] = True
+    metrics['jobs'] = recognition_jobs.metrics()
+    metrics['frame_cache'] = frame_cache.stats()
+    metrics['tracking'] = face_tracker.stats()
+    metrics['liveness'] = liveness_states.stats()
+    metrics['stages'] = stage_metrics.snapshot()
+    metrics['gallery_check'] = gallery_maintainer.status() if gallery_maintainer else None
+    metrics['event_checkins'] = event_checkins.stats()
+    return jsonify(metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format
+    Scrapers send METRICS_TOKEN as a bearer token; without one configured only
+    an admin session or a local scraper may read them"""
+    token = SecurityConfig.METRICS_TOKEN
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif session.get('role') != 'admin' and request.remote_addr not in ('127.0.0.1', '::1'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(stage_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/admin/reports/<report_type>')
 def api_admin_reports(report_type):
     """Get report data for admin"""
@@ -2629,6 +3135,8 @@ def faculty_edit_student():
         conn.commit()
         conn.close()
         
+        refresh_gallery_user(user_id)
+        
         return jsonify({'success': True, 'message': 'Student updated successfully'})
         
     except Exception as e:
@@ -3478,7 +3986,6 @@ def api_anti_spoofing_analyze():
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
-    filepath = None
     try:
         # Get the uploaded image
         if 'image' not in request.files:
@@ -3488,21 +3995,11 @@ def api_anti_spoofing_analyze():
         if file.filename == '':
             return jsonify({'success': False, 'message': 'No image selected'}), 400
         
-        # Save the image temporarily
-        import uuid
-        safe_filename = f"antispoofing_{session['user_id']}_{uuid.uuid4().hex[:8]}.jpg"
-        filepath = os.path.join('temp', safe_filename)
-        os.makedirs('temp', mode=0o755, exist_ok=True)
-        
-        # Validate file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > 10 * 1024 * 1024:  # 10MB limit
+        # Read the frame into memory (no temp file round trip)
+        image_bytes = file.read()
+        if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
             return jsonify({'success': False, 'message': 'File too large'}), 400
-        
-        file.save(filepath)
+        debug_frames.capture(image_bytes, 'anti_spoofing')
         
         # Check if anti-spoofing is available
         if not ANTI_SPOOFING_AVAILABLE:
@@ -3513,56 +4010,67 @@ def api_anti_spoofing_analyze():
                 'confidence': 0.5
             })
         
-        # Load and process the image
-        image = cv2.imread(filepath)
+        # Decode and process the image
+        started = time.perf_counter()
+        timer = StageTimer()
+        with timer.stage('decode'):
+            image = decode_image(image_bytes)
         if image is None:
             return jsonify({'success': False, 'message': 'Could not load image'}), 400
         
         # Convert to RGB
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        with timer.stage('decode'):
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         
         # Detect faces
         if FACE_RECOGNITION_AVAILABLE:
-            face_locations = face_recognition.face_locations(rgb_image, model="hog")
-            face_landmarks = face_recognition.face_landmarks(rgb_image, face_locations)
+            # Landmarks only: the shared analysis never computes an encoding here
+            with timer.stage('detect'):
+                locations, detection = face_detector.detect(rgb_image)
+            with timer.stage('landmarks'):
+                frame = FrameAnalysis(rgb_image, locations[:1], detection)
         else:
             return jsonify({'success': False, 'message': 'Face detection not available'}), 400
         
-        if not face_locations or not face_landmarks:
+        if not len(frame) or not frame[0].landmarks:
             return jsonify({'success': False, 'message': 'No face detected'}), 400
         
-        # Perform anti-spoofing analysis
-        anti_spoofing_result = anti_spoofing_detector.comprehensive_anti_spoofing_check(
-            rgb_image, face_landmarks[0], face_locations[0]
-        )
+        # Perform anti-spoofing analysis (motion is compared with this kiosk's previous frames)
+        with timer.stage('anti_spoofing'):
+            anti_spoofing_result = anti_spoofing_detector.comprehensive_anti_spoofing_check(
+                rgb_image, frame[0].landmarks, frame[0].location,
+                state=liveness_states.get(kiosk_id_for(request.form.get('kiosk_id'))),
+                cascade=False  # the analysis view shows every check's score
+            )
         
-        return jsonify({
+        result = {
             'success': True,
             'is_live': anti_spoofing_result['is_live'],
             'confidence': anti_spoofing_result['confidence'],
             'details': anti_spoofing_result['details'],
             'checks': anti_spoofing_result['checks']
-        })
+        }
+        timings = record_timings('anti_spoofing_analyze', None, {'timings': timer.timings}, started)
+        if wants_timings():
+            result['timings'] = timings
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Analysis error: {str(e)}'}), 500
-    finally:
-        # Clean up temp file
-        if filepath and os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Warning: Failed to clean up temp file {filepath}: {e}")
 
 @app.route('/api/anti-spoofing/reset', methods=['POST'])
 def api_anti_spoofing_reset():
-    """Reset anti-spoofing detector state"""
+    """Reset the calling kiosk's anti-spoofing state (an admin may pass all=1 to reset every kiosk)"""
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 401
     
     try:
         if ANTI_SPOOFING_AVAILABLE:
-            anti_spoofing_detector.reset_state()
+            data = request.get_json(silent=True) or {}
+            if session.get('role') == 'admin' and str(request.values.get('all', data.get('all', ''))).lower() in ('1', 'true', 'yes'):
+                liveness_states.reset()
+                return jsonify({'success': True, 'message': 'Anti-spoofing state reset for every kiosk'})
+            liveness_states.reset(kiosk_id_for(request.values.get('kiosk_id') or data.get('kiosk_id')))
             return jsonify({'success': True, 'message': 'Anti-spoofing state reset'})
         else:
             return jsonify({'success': False, 'message': 'Anti-spoofing not available'})
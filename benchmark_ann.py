@@ -0,0 +1,101 @@
+"""
+Benchmark: IVF approximate search vs exact gallery search
+Builds synthetic galleries of 1k/10k/100k identities and compares per-query
+latency and recall@1 for several nprobe settings
+
+Run: python benchmark_ann.py [sizes...] [--json results.json]
+     python benchmark_ann.py 1000 10000
+"""
+
+import sys
+import json
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+from face_gallery import FaceGallery
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+NPROBE_SETTINGS = [1, 4, 8, 16, 32]
+N_QUERIES = 200
+PROBE_NOISE = 0.03  # per-dimension noise: a re-captured face of an enrolled identity
+
+
+def synthetic_gallery(n, dim=128, n_groups=64, seed=0):
+    """
+    Random identities with some group structure (real dlib encodings are not
+    uniformly spread), scaled like dlib vectors (norm ~ 1)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_groups, dim))
+    vectors = centers[rng.integers(0, n_groups, n)] * 0.5 + rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def time_per_query(fn, queries):
+    start = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return (time.perf_counter() - start) / len(queries) * 1000.0, results
+
+
+def run(sizes):
+    rows = []
+    rng = np.random.default_rng(42)
+    for n in sizes:
+        vectors = synthetic_gallery(n)
+        ids = np.arange(1, n + 1)
+        truth_rows = rng.integers(0, n, N_QUERIES)
+        queries = vectors[truth_rows] + rng.normal(scale=PROBE_NOISE, size=(N_QUERIES, 128)).astype(np.float32)
+
+        gallery = FaceGallery(initial_capacity=n)
+        gallery.load((int(i), v, None) for i, v in zip(ids, vectors))
+        exact_ms, exact = time_per_query(gallery.match, queries)
+        exact_ids = np.array([r[0] for r in exact])
+
+        start = time.perf_counter()
+        index = IVFIndex()
+        index.train(vectors)
+        index.add(ids, vectors)
+        build_s = time.perf_counter() - start
+
+        print(f"\n📊 {n:,} identities - exact scan {exact_ms:.3f} ms/query, "
+              f"IVF build {build_s:.2f}s ({index.n_lists} lists)")
+        print(f"   {'nprobe':>6} {'ms/query':>10} {'speedup':>8} {'recall@1':>9}")
+        for nprobe in NPROBE_SETTINGS:
+            if nprobe > index.n_lists:
+                continue
+            ann_ms, approx = time_per_query(lambda q: index.search(q, k=1, nprobe=nprobe), queries)
+            approx_ids = np.array([r[0][0] if len(r[0]) else -1 for r in approx])
+            recall = float(np.mean(approx_ids == exact_ids))
+            print(f"   {nprobe:>6} {ann_ms:>10.3f} {exact_ms / ann_ms:>7.1f}x {recall:>9.3f}")
+            rows.append({
+                'identities': n,
+                'n_lists': index.n_lists,
+                'nprobe': nprobe,
+                'exact_ms': round(exact_ms, 4),
+                'ann_ms': round(ann_ms, 4),
+                'recall_at_1': recall,
+                'build_seconds': round(build_s, 3)
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    json_path = None
+    if "--json" in args:
+        pos = args.index("--json")
+        json_path = args[pos + 1]
+        del args[pos:pos + 2]
+    sizes = [int(a) for a in args] or DEFAULT_SIZES
+
+    print("🏁 ANN vs exact face gallery search")
+    print("=" * 50)
+    results = run(sizes)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {json_path}")
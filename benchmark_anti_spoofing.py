@@ -0,0 +1,186 @@
+"""
+Benchmark: anti-spoofing checks, full evaluation vs cheap-first cascade
+Detects the face in each sample frame (plus blurred, re-printed and
+over-exposed copies of the frame, standing in for spoofs) and
+  costs   - times every check on its own: the per-check cost table behind
+            AntiSpoofingDetector.CHECK_COST_MS and the cascade order
+  cascade - runs comprehensive_anti_spoofing_check() with and without the
+            cascade on the same frame sequence (each with its own motion
+            history) and reports latency, checks skipped and whether any
+            result (decision or confidence) differs (it must not)
+
+Run: python benchmark_anti_spoofing.py [--frames DIR] [--limit N] [--repeat 5]
+                                       [--analysis-size 128] [--no-variants] [--json results.json]
+     (--analysis-size 0 runs the checks on native-size crops)
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import cv2
+import numpy as np
+
+from security_config import SecurityConfig
+from face_detection import create_detector, parse_upsample_tiers
+from frame_analysis import FrameAnalysis
+from recognition_service import decode_frame
+from anti_spoofing import AntiSpoofingDetector
+from liveness_state import LivenessState
+from benchmark_recognition import SAMPLE_FRAMES_DIR, load_frames, percentiles, git_commit
+
+
+def spoof_variants(rgb):
+    """Copies of a frame that look like common attacks (same face position)"""
+    h, w = rgb.shape[:2]
+    reprint = cv2.resize(cv2.resize(rgb, (w // 4, h // 4), interpolation=cv2.INTER_AREA), (w, h))
+    return {
+        'blur': cv2.GaussianBlur(rgb, (21, 21), 0),
+        'print': cv2.addWeighted(reprint, 0.7, np.full_like(reprint, 128), 0.3, 0),
+        'glare': cv2.convertScaleAbs(rgb, alpha=1.4, beta=70)
+    }
+
+
+def load_faces(frames, detector, variants=True):
+    """(label, rgb image, landmarks, location) of the first face in every frame and its variants"""
+    faces = []
+    for n, image_bytes in enumerate(frames):
+        rgb = decode_frame(image_bytes)
+        if rgb is None:
+            continue
+        locations, detection = detector.detect(rgb)
+        frame = FrameAnalysis(rgb, locations[:1], detection)
+        if not len(frame) or not frame[0].landmarks:
+            continue
+        faces.append((f'frame{n}', rgb, frame[0].landmarks, frame[0].location))
+        if variants:
+            for name, image in spoof_variants(rgb).items():
+                faces.append((f'frame{n}:{name}', image, frame[0].landmarks, frame[0].location))
+    return faces
+
+
+def measure_costs(detector, faces, repeat):
+    """Per-check latency over every face crop"""
+    samples = {}
+    state = LivenessState()
+    for _ in range(repeat):
+        for _, rgb, landmarks, location in faces:
+            crop = detector.preprocessor.prepare(rgb, location, detector.ANALYSIS_SIZE)
+            for name, _, _, run in detector.check_table(crop, landmarks, state):
+                start = time.perf_counter()
+                run()
+                samples.setdefault(name, []).append(time.perf_counter() - start)
+    return {name: percentiles(times) for name, times in samples.items()}
+
+
+def compare_cascade(detector, faces, repeat):
+    """Full vs cascade evaluation of the same frame sequence"""
+    timings = {'full': [], 'cascade': []}
+    states = {'full': LivenessState(), 'cascade': LivenessState()}
+    mismatches, skipped = [], {}
+    for _ in range(repeat):
+        for label, rgb, landmarks, location in faces:
+            results = {}
+            for mode in ('full', 'cascade'):
+                start = time.perf_counter()
+                results[mode] = detector.comprehensive_anti_spoofing_check(
+                    rgb, landmarks, location, state=states[mode], cascade=(mode == 'cascade'))
+                timings[mode].append(time.perf_counter() - start)
+            full, cascade = results['full'], results['cascade']
+            if (full['is_live'], full['confidence']) != (cascade['is_live'], cascade['confidence']):
+                mismatches.append(label)
+            for name in cascade['skipped']:
+                skipped[name] = skipped.get(name, 0) + 1
+    return {
+        'full': percentiles(timings['full']),
+        'cascade': percentiles(timings['cascade']),
+        'evaluations': len(timings['full']),
+        'result_mismatches': mismatches,
+        'skipped': skipped,
+        'live': sum(1 for _, rgb, landmarks, location in faces
+                    if detector.comprehensive_anti_spoofing_check(rgb, landmarks, location, state=LivenessState(),
+                                                                  cascade=False)['is_live'])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anti-spoofing check cost and cascade benchmark")
+    parser.add_argument('--frames', default=SAMPLE_FRAMES_DIR, help="directory of sample frames")
+    parser.add_argument('--limit', type=int, default=None, help="use at most this many frames")
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes over the faces")
+    parser.add_argument('--analysis-size', type=int, default=None,
+                        help="face crop size for the checks (default: the detector's, 0: native)")
+    parser.add_argument('--no-variants', action='store_true', help="only the recorded frames, no spoof copies")
+    parser.add_argument('--json', dest='json_path', help="write results to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.limit)
+    if not frames:
+        print(f"❌ No frames found in {args.frames} (pass --frames)")
+        sys.exit(1)
+
+    face_detector = create_detector(
+        SecurityConfig.DETECTOR_BACKEND,
+        scale=SecurityConfig.DETECTION_SCALE,
+        upsample_tiers=parse_upsample_tiers(SecurityConfig.DETECTION_UPSAMPLE_TIERS),
+        cascade_scale=SecurityConfig.DETECTOR_CASCADE_SCALE,
+        cascade_path=SecurityConfig.DETECTOR_CASCADE_PATH or None
+    )
+    detector = AntiSpoofingDetector()
+    if args.analysis_size is not None:
+        detector.ANALYSIS_SIZE = args.analysis_size or None
+
+    print("🏁 Anti-spoofing checks")
+    print("=" * 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        faces = load_faces(frames, face_detector, variants=not args.no_variants)
+    if not faces:
+        print("❌ No face found in the sample frames")
+        sys.exit(1)
+    sizes = [(bottom - top, right - left) for _, _, _, (top, right, bottom, left) in faces]
+    print(f"{len(faces)} face(s) from {len(frames)} frame(s), crops {min(sizes)}..{max(sizes)} "
+          f"analyzed at {detector.ANALYSIS_SIZE or 'native size'}, {args.repeat} pass(es)")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        costs = measure_costs(detector, faces, args.repeat)
+    weights = {name: weight for name, weight, _, _ in detector.check_table(np.zeros((1, 1, 3), np.uint8), {})}
+    print(f"\n   {'check':>20} {'weight':>7} {'p50 ms':>9} {'mean ms':>9} {'ms/weight':>10}")
+    for name, row in sorted(costs.items(), key=lambda item: item[1]['mean_ms'] / weights[item[0]]):
+        print(f"   {name:>20} {weights[name]:>7.2f} {row['p50_ms']:>9.3f} {row['mean_ms']:>9.3f} "
+              f"{row['mean_ms'] / weights[name]:>10.3f}")
+    print("\n   CHECK_COST_MS = " + json.dumps({name: round(row['mean_ms'], 2) for name, row in costs.items()}))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        comparison = compare_cascade(detector, faces, args.repeat)
+    print(f"\n   {'mode':>8} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for mode in ('full', 'cascade'):
+        row = comparison[mode]
+        print(f"   {mode:>8} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['mean_ms']:>9.3f}")
+    evaluations = comparison['evaluations']
+    print(f"\n   live {comparison['live']}/{len(faces)} face(s); skipped per evaluation: " +
+          ", ".join(f"{name} {count / evaluations:.0%}" for name, count in sorted(comparison['skipped'].items())))
+    if comparison['result_mismatches']:
+        print(f"❌ Results differ on {len(comparison['result_mismatches'])} evaluation(s): "
+              f"{comparison['result_mismatches'][:5]}")
+    else:
+        print(f"✅ Cascade results match the full evaluation on all {evaluations} evaluation(s)")
+
+    if args.json_path:
+        meta = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'frames': len(frames),
+            'faces': len(faces),
+            'repeat': args.repeat,
+            'analysis_size': detector.ANALYSIS_SIZE
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'costs': costs, 'cascade': comparison}, f, indent=2)
+        print(f"\n✅ Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: face detector backends on recorded frames
+Times every DETECTOR_BACKEND (hog, haar, lbp, haar+hog, lbp+hog) on the
+sample frames and scores its boxes against a reference: full-resolution
+HOG with one upsample, the most thorough search the app can run. A reference
+face counts as found when a detected box overlaps it by IoU >= 0.3; boxes
+matching no reference face are counted as false positives. Backends whose
+cascade is not installed (LBP with pip's opencv) are skipped
+
+Run: python benchmark_detectors.py [--frames DIR] [--limit N] [--repeat 3]
+                                   [--backends hog,haar+hog] [--json results.json]
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+from security_config import SecurityConfig
+from face_detection import (FaceDetectionPipeline, DETECTOR_BACKENDS, create_detector, load_cascade,
+                            parse_upsample_tiers, box_iou)
+from recognition_service import decode_frame
+from benchmark_recognition import SAMPLE_FRAMES_DIR, load_frames, percentiles, git_commit
+
+MIN_IOU = 0.3
+
+
+def reference_faces(images):
+    """Boxes from full-resolution HOG with one upsample, per frame"""
+    reference = FaceDetectionPipeline(scale=1.0, upsample_tiers=(1,))
+    return [reference.detect(rgb)[0] for rgb in images]
+
+
+def score(found, expected):
+    """(matched reference faces, false positives, IoU of each match)"""
+    unused = list(found)
+    ious = []
+    for face in expected:
+        best = max(unused, key=lambda box: box_iou(box, face), default=None)
+        if best is not None and box_iou(best, face) >= MIN_IOU:
+            ious.append(box_iou(best, face))
+            unused.remove(best)
+    return len(ious), len(unused), ious
+
+
+def run(images, expected, backends, repeat, warmup):
+    rows = []
+    tiers = parse_upsample_tiers(SecurityConfig.DETECTION_UPSAMPLE_TIERS)
+    for backend in backends:
+        if backend != 'hog' and load_cascade(backend.split('+')[0], SecurityConfig.DETECTOR_CASCADE_PATH or None) is None:
+            print(f"   {backend:>9}  skipped (cascade not installed)")
+            continue
+        detector = create_detector(backend, scale=SecurityConfig.DETECTION_SCALE, upsample_tiers=tiers,
+                                   cascade_scale=SecurityConfig.DETECTOR_CASCADE_SCALE,
+                                   cascade_path=SecurityConfig.DETECTOR_CASCADE_PATH or None)
+        samples = []
+        found = []
+        for iteration in range(warmup + repeat):
+            for rgb in images:
+                start = time.perf_counter()
+                locations, _ = detector.detect(rgb)
+                elapsed = time.perf_counter() - start
+                if iteration >= warmup:
+                    samples.append(elapsed)
+                if iteration == warmup:
+                    found.append(locations)
+
+        matched, false_positives, ious = 0, 0, []
+        for boxes, faces in zip(found, expected):
+            m, fp, i = score(boxes, faces)
+            matched += m
+            false_positives += fp
+            ious.extend(i)
+        total = sum(len(faces) for faces in expected)
+        row = dict(backend=backend, **percentiles(samples))
+        row.update(
+            recall=round(matched / total, 3) if total else None,
+            false_positives=false_positives,
+            mean_iou=round(float(np.mean(ious)), 3) if ious else None
+        )
+        print(f"   {backend:>9} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['fps']:>8.2f} "
+              f"{row['recall'] or 0:>7.3f} {false_positives:>5} {row['mean_iou'] or 0:>8.3f}")
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face detector backend benchmark")
+    parser.add_argument('--frames', default=SAMPLE_FRAMES_DIR, help="directory of sample frames")
+    parser.add_argument('--limit', type=int, default=None, help="use at most this many frames")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes over the frames")
+    parser.add_argument('--warmup', type=int, default=1, help="unmeasured passes first")
+    parser.add_argument('--backends', default=','.join(DETECTOR_BACKENDS), help="comma-separated backends")
+    parser.add_argument('--json', dest='json_path', help="write results to this file")
+    args = parser.parse_args()
+
+    images = [rgb for rgb in (decode_frame(b) for b in load_frames(args.frames, args.limit)) if rgb is not None]
+    if not images:
+        print(f"❌ No frames found in {args.frames} (pass --frames)")
+        sys.exit(1)
+
+    print("🏁 Face detector backends")
+    print("=" * 50)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = reference_faces(images)
+    faces = sum(len(f) for f in expected)
+    print(f"{len(images)} frame(s) from {args.frames}, {faces} reference face(s) "
+          f"(full-resolution HOG), {args.repeat} pass(es)")
+    print(f"\n   {'backend':>9} {'p50 ms':>9} {'p95 ms':>9} {'fps':>8} {'recall':>7} {'FP':>5} {'mean IoU':>8}")
+    backends = [b.strip().lower() for b in args.backends.split(',') if b.strip()]
+    rows = run(images, expected, backends, args.repeat, args.warmup)
+
+    if args.json_path:
+        meta = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'frames': len(images),
+            'reference_faces': faces,
+            'detection_scale': SecurityConfig.DETECTION_SCALE,
+            'cascade_scale': SecurityConfig.DETECTOR_CASCADE_SCALE
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': rows}, f, indent=2)
+        print(f"\n✅ Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
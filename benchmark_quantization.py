@@ -0,0 +1,97 @@
+"""
+Benchmark: float32 vs float16 vs int8 gallery rows
+Builds synthetic galleries and compares memory, per-query latency and
+agreement with exact float64 matching, with and without the exact re-rank
+of the closest candidates. Half of the probes sit near the match tolerance,
+where a quantization error could flip an accept/reject decision
+
+Run: python benchmark_quantization.py [sizes...] [--json results.json]
+     python benchmark_quantization.py 10000 100000
+"""
+
+import sys
+import json
+import time
+
+import numpy as np
+
+from benchmark_ann import synthetic_gallery, time_per_query
+from face_gallery import FaceGallery, PRECISIONS
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+RERANK_SETTINGS = [0, 16]
+N_QUERIES = 200
+PROBE_NOISE = (0.03, 0.053)  # re-captured face (~0.34 away) and a hard one (~0.6, at the tolerance)
+TOLERANCE = 0.6
+
+
+def run(sizes):
+    rows = []
+    rng = np.random.default_rng(42)
+    for n in sizes:
+        vectors = synthetic_gallery(n).astype(np.float64)
+        ids = np.arange(1, n + 1)
+        exact_templates = {int(i): v[None, :] for i, v in zip(ids, vectors)}
+        truth_rows = rng.integers(0, n, N_QUERIES)
+        noise = np.repeat(PROBE_NOISE, N_QUERIES // 2)[:, None]
+        queries = vectors[truth_rows] + rng.normal(size=(N_QUERIES, 128)) * noise
+
+        # Reference: float64 brute force
+        all_dists = np.linalg.norm(vectors[None, :, :] - queries[:, None, :], axis=2) if n <= 10000 else \
+            np.stack([np.linalg.norm(vectors - q, axis=1) for q in queries])
+        ref_ids = ids[np.argmin(all_dists, axis=1)]
+        ref_dists = all_dists.min(axis=1)
+
+        print(f"\n📊 {n:,} identities")
+        print(f"   {'rows':>7} {'rerank':>6} {'MB':>8} {'load s':>7} {'ms/query':>9} "
+              f"{'recall@1':>9} {'max |d err|':>11} {'decisions':>9}")
+        for precision in PRECISIONS:
+            for rerank in RERANK_SETTINGS:
+                if precision == 'float32' and rerank:
+                    continue  # float32 scans are already exact
+                gallery = FaceGallery(initial_capacity=n, precision=precision, rerank=rerank,
+                                      exact_source=lambda owners: {o: exact_templates[o] for o in owners})
+                start = time.perf_counter()
+                gallery.load((int(i), v, None) for i, v in zip(ids, vectors))
+                load_s = time.perf_counter() - start
+
+                ms, results = time_per_query(gallery.match, queries)
+                got_ids = np.array([r[0] for r in results])
+                got_dists = np.array([r[1] for r in results])
+                recall = float(np.mean(got_ids == ref_ids))
+                error = float(np.max(np.abs(got_dists - ref_dists)))
+                decisions = float(np.mean((got_dists <= TOLERANCE) == (ref_dists <= TOLERANCE)))
+                mb = gallery.nbytes / 1e6
+                print(f"   {precision:>7} {rerank:>6} {mb:>8.2f} {load_s:>7.2f} {ms:>9.3f} "
+                      f"{recall:>9.3f} {error:>11.2e} {decisions:>9.3f}")
+                rows.append({
+                    'identities': n,
+                    'precision': precision,
+                    'rerank': rerank,
+                    'row_megabytes': round(mb, 3),
+                    'load_seconds': round(load_s, 3),
+                    'ms_per_query': round(ms, 4),
+                    'recall_at_1': recall,
+                    'max_distance_error': error,
+                    'decision_agreement': decisions
+                })
+    return rows
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    json_path = None
+    if "--json" in args:
+        pos = args.index("--json")
+        json_path = args[pos + 1]
+        del args[pos:pos + 2]
+    sizes = [int(a) for a in args] or DEFAULT_SIZES
+
+    print("🏁 Quantized face gallery rows")
+    print("=" * 50)
+    results = run(sizes)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {json_path}")
@@ -0,0 +1,297 @@
+"""
+Benchmark: recognition latency and throughput on recorded frames
+Builds synthetic galleries (random unit encodings, plus one identity
+enrolled from the first sample frame so later frames take the match path)
+and drives the detect path over the sample frames:
+  direct - each pipeline stage timed on its own (decode, detect, landmarks,
+           encode, match, checks = liveness + anti-spoofing) and the whole
+           recognize_frame() call
+  client - POST /api/attendance/detect through the Flask test client
+Reports p50/p95/p99 and frames/sec per stage; --json writes the results
+(with the commit they were measured on) and --compare prints the change
+against an earlier results file
+
+Frames come from the recorded kiosk frames in samples/ by default, or any
+directory of JPEG/PNG files (e.g. frames sampled with DEBUG_CAPTURE_FRAMES)
+
+Run: python benchmark_recognition.py [--gallery 0,1000,10000] [--frames DIR] [--repeat 3]
+                                     [--mode direct|client|both] [--precision float32]
+                                     [--json results.json] [--compare old.json]
+"""
+
+import io
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+
+# Measure full pipeline runs: no result cache, no tracking, no worker processes
+# (set these in the environment to benchmark them instead)
+os.environ.setdefault('FRAME_CACHE_TTL', '0')
+os.environ.setdefault('TRACK_REVERIFY_EVERY', '1')
+os.environ.setdefault('RECOGNITION_WORKERS', '0')
+
+SAMPLE_FRAMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+
+import numpy as np
+
+from security_config import SecurityConfig
+from face_detection import create_detector, parse_upsample_tiers
+from face_gallery import FaceGallery
+from frame_analysis import FrameAnalysis
+from recognition_service import recognize_frame, recognize_face, decode_frame
+
+DEFAULT_GALLERY_SIZES = [0, 1000, 10000]
+STAGES = ('decode', 'detect', 'landmarks', 'encode', 'match', 'checks', 'pipeline', 'request')
+FRAME_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+ENROLLED_ID = 1  # identity enrolled from the sample frames; synthetic ones follow
+
+
+def load_frames(directory, limit=None):
+    """Encoded bytes of every image under directory, in name order"""
+    paths = sorted(p for pattern in FRAME_PATTERNS
+                   for p in glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+    frames = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    return frames
+
+
+def synthetic_entries(size, enrolled_encoding=None, seed=0):
+    """Gallery entries: optionally the sample person, then random unit encodings"""
+    rng = np.random.default_rng(seed)
+    entries = []
+    if enrolled_encoding is not None:
+        entries.append((ENROLLED_ID, enrolled_encoding,
+                        {'student_id': ENROLLED_ID, 'user_id': 0, 'firstname': 'Sample', 'lastname': 'Person'}))
+    count = max(size - len(entries), 0)
+    vectors = rng.normal(size=(count, 128))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for n, vector in enumerate(vectors, start=ENROLLED_ID + 1):
+        entries.append((n, vector, {'student_id': n, 'user_id': 0, 'firstname': 'Synthetic', 'lastname': str(n)}))
+    return entries
+
+
+def enrollment_encoding(frames, detector):
+    """Encoding of the first face found in the sample frames (None when there is none)"""
+    for image_bytes in frames:
+        rgb = decode_frame(image_bytes)
+        if rgb is None:
+            continue
+        frame = FrameAnalysis.from_image(rgb, detector, max_faces=1)
+        if len(frame):
+            return frame.encodings()[0]
+    return None
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000.0
+    mean = float(ms.mean())
+    return {
+        'samples': len(ms),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(mean, 3),
+        'fps': round(1000.0 / mean, 2) if mean > 0 else None
+    }
+
+
+class Timer:
+    """Collects seconds per stage"""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - start)
+
+
+def run_direct(frames, gallery, detector, repeat, warmup):
+    """Time every stage separately, then the whole recognize_frame() call"""
+    timer = Timer()
+    for iteration in range(warmup + repeat):
+        measure = iteration >= warmup
+        for image_bytes in frames:
+            stages = Timer()
+            with stages.stage('decode'):
+                rgb = decode_frame(image_bytes)
+            if rgb is None:
+                continue
+            with stages.stage('detect'):
+                locations, detection = detector.detect(rgb)
+            with stages.stage('landmarks'):
+                frame = FrameAnalysis(rgb, locations[:1], detection)
+            if len(frame):
+                with stages.stage('encode'):
+                    encodings = frame.encodings()
+                with stages.stage('match'):
+                    matches = gallery.match_many(encodings)
+                with stages.stage('checks'):
+                    for match, face in zip(matches, frame):
+                        recognize_face(gallery, match, face)
+            with stages.stage('pipeline'):
+                recognize_frame(decode_frame(image_bytes), gallery, detector)
+            if measure:
+                for name, values in stages.samples.items():
+                    timer.samples.setdefault(name, []).extend(values)
+    return timer.samples
+
+
+def run_client(frames, entries, repeat, warmup):
+    """POST every frame to /api/attendance/detect (inline recognition in this process)"""
+    import app as facecheck
+
+    gallery = facecheck.student_gallery.ensure_loaded()
+    gallery.sync_interval = float('inf')  # keep the synthetic gallery (sync would drop unknown ids)
+    gallery.load(entries)
+    facecheck.frame_cache.clear()
+    if facecheck.recognition_service:
+        print("⚠️ RECOGNITION_WORKERS > 0: workers match against the database gallery, not the synthetic one")
+
+    client = facecheck.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 0
+        session['role'] = 'admin'
+
+    timer = Timer()
+    for iteration in range(warmup + repeat):
+        for image_bytes in frames:
+            start = time.perf_counter()
+            response = client.post('/api/attendance/detect', content_type='multipart/form-data',
+                                   data={'image': (io.BytesIO(image_bytes), 'frame.jpg'), 'kiosk_id': 'benchmark'})
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"detect returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            if iteration >= warmup:
+                timer.samples.setdefault('request', []).append(elapsed)
+    if facecheck.recognition_service:
+        facecheck.recognition_service.shutdown()
+    return timer.samples
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(rows):
+    print(f"   {'mode':>6} {'stage':>9} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'fps':>8}")
+    for row in rows:
+        print(f"   {row['mode']:>6} {row['stage']:>9} {row['samples']:>5} {row['p50_ms']:>9.2f} "
+              f"{row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['fps'] or 0:>8.2f}")
+
+
+def compare(rows, path):
+    """Print p50/p95 changes against an earlier --json file"""
+    with open(path, encoding='utf-8') as f:
+        previous = json.load(f)
+    before = {(r['gallery_size'], r['mode'], r['stage']): r for r in previous['results']}
+    print(f"\n📈 Change vs {path} (commit {previous['meta'].get('commit')})")
+    print(f"   {'gallery':>8} {'mode':>6} {'stage':>9} {'p50':>20} {'p95':>20}")
+    for row in rows:
+        old = before.get((row['gallery_size'], row['mode'], row['stage']))
+        if not old:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (row[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:.1f}->{row[key]:.1f} {change:+.0f}%")
+        print(f"   {row['gallery_size']:>8} {row['mode']:>6} {row['stage']:>9} {cells[0]:>20} {cells[1]:>20}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognition latency benchmark")
+    parser.add_argument('--gallery', default=','.join(str(s) for s in DEFAULT_GALLERY_SIZES),
+                        help="comma-separated gallery sizes")
+    parser.add_argument('--frames', default=SAMPLE_FRAMES_DIR, help="directory of sample frames")
+    parser.add_argument('--limit', type=int, default=None, help="use at most this many frames")
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the frames per gallery size")
+    parser.add_argument('--warmup', type=int, default=1, help="unmeasured passes first")
+    parser.add_argument('--mode', choices=('direct', 'client', 'both'), default='both')
+    parser.add_argument('--precision', default='float32', help="gallery row precision (float32|float16|int8)")
+    parser.add_argument('--json', dest='json_path', help="write results to this file")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's own logging")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.limit)
+    if not frames:
+        print(f"❌ No frames found in {args.frames} (pass --frames)")
+        sys.exit(1)
+
+    detector = create_detector(
+        SecurityConfig.DETECTOR_BACKEND,
+        scale=SecurityConfig.DETECTION_SCALE,
+        upsample_tiers=parse_upsample_tiers(SecurityConfig.DETECTION_UPSAMPLE_TIERS),
+        cascade_scale=SecurityConfig.DETECTOR_CASCADE_SCALE,
+        cascade_path=SecurityConfig.DETECTOR_CASCADE_PATH or None
+    )
+    sizes = [int(s) for s in args.gallery.split(',') if s.strip()]
+
+    print("🏁 Recognition benchmark")
+    print("=" * 50)
+    print(f"{len(frames)} frame(s) from {args.frames}, {args.repeat} pass(es) after {args.warmup} warm-up")
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    rows = []
+    with quiet:
+        enrolled = enrollment_encoding(frames, detector)
+    for size in sizes:
+        entries = synthetic_entries(size, enrolled)
+        exact = {owner_id: encoding for owner_id, encoding, _ in entries}
+        gallery = FaceGallery(initial_capacity=max(len(entries), 1), precision=args.precision,
+                              exact_source=lambda owners: {o: exact[o] for o in owners if o in exact})
+        gallery.load(entries)
+
+        results = {}
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            if args.mode in ('direct', 'both'):
+                results['direct'] = run_direct(frames, gallery, detector, args.repeat, args.warmup)
+            if args.mode in ('client', 'both'):
+                results['client'] = run_client(frames, entries, args.repeat, args.warmup)
+
+        size_rows = [
+            dict(gallery_size=len(entries), mode=mode, stage=stage, **percentiles(samples[stage]))
+            for mode, samples in results.items() for stage in STAGES if samples.get(stage)
+        ]
+        print(f"\n📊 Gallery of {len(entries):,} identities ({args.precision})")
+        print_table(size_rows)
+        rows.extend(size_rows)
+
+    if args.json_path:
+        meta = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'frames': len(frames),
+            'frames_dir': args.frames,
+            'repeat': args.repeat,
+            'precision': args.precision,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count()
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': rows}, f, indent=2)
+        print(f"\n✅ Results written to {args.json_path}")
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
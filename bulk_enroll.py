@@ -0,0 +1,393 @@
+"""
+Bulk face enrollment
+Encodes a folder or ZIP of registration photos named <idno>.jpg (the naming
+student_register.py and SimpleFaceDetector.register_face use) and registers
+them the way api_register_face does: the photo is saved to known_faces/, the
+student's attendance_image is updated and the encoding is cached as the
+current encoding and as a reference template
+
+Detection and encoding run in a pool of worker processes (one per core by
+default); results are written in batched transactions. Every processed file
+is appended to a journal next to the input, so an interrupted run picks up
+where it stopped, and a CSV report lists every file that could not be
+enrolled (unreadable, no face, multiple faces, unknown idno, ...); a file
+whose processing raised is reported as 'error' and the run goes on
+
+Usage:
+    python bulk_enroll.py photos/                  # or photos.zip
+    python bulk_enroll.py photos.zip --workers 8 --batch 100
+    python bulk_enroll.py photos/ --retry-failed   # re-run files that failed before
+    python bulk_enroll.py photos/ --force          # re-enroll everything
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import zipfile
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from security_config import SecurityConfig
+from face_encoding_store import (FaceEncodingStore, compute_face_encoding, image_content_hash,
+                                 FACE_RECOGNITION_AVAILABLE)
+from gallery_maintenance import ensure_registration_schema
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MIN_PHOTO_SIZE = 100   # px, same limits as api_register_face
+MAX_STORED_SIZE = 800  # stored photos are downscaled to this (longest side)
+
+# compute_face_encoding message -> report status
+FAILURE_STATUS = {
+    "Could not read image": 'unreadable',
+    "No face detected": 'no_face',
+    "Multiple faces detected": 'multiple_faces',
+    "Could not encode face": 'encode_failed'
+}
+
+
+class PhotoSource:
+    """Registration photos in a directory (searched recursively) or a ZIP archive"""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else None
+        if self._zip is None and not os.path.isdir(path):
+            raise ValueError(f"Not a directory or ZIP archive: {path}")
+
+    def names(self):
+        """Photo names in a stable order (archive members or paths relative to the directory)"""
+        if self._zip is not None:
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            names = [os.path.relpath(os.path.join(root, f), self.path).replace(os.sep, '/')
+                     for root, _, files in os.walk(self.path) for f in files]
+        return sorted(n for n in names if is_photo_name(n))
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_photo_name(name):
+    """Image files only; hidden files and macOS archive metadata are skipped"""
+    base = os.path.basename(name)
+    return (base.lower().endswith(PHOTO_EXTENSIONS) and not base.startswith('.')
+            and '__MACOSX/' not in name)
+
+
+def idno_from_name(name):
+    """'photos/2021-00123.jpg' -> '2021-00123'"""
+    return os.path.splitext(os.path.basename(name))[0].strip()
+
+
+def encode_photo(task):
+    """
+    Worker: decode, detect and encode one photo
+    task is (name, image bytes); returns a result dict whose status is
+    'ok' (with 'encoding' and the downscaled 'jpeg' to store) or a failure
+    ('error' when processing raised, so one bad file never stops the run)
+    """
+    try:
+        return _encode_photo(*task)
+    except Exception as e:
+        return error_result(task[0], e)
+
+
+def error_result(name, error):
+    return {'file': name, 'status': 'error', 'message': f"{type(error).__name__}: {error}"}
+
+
+def _encode_photo(name, data):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+    if image is None:
+        return {'file': name, 'status': 'unreadable', 'message': "Could not read image"}
+    height, width = image.shape[:2]
+    if min(height, width) < MIN_PHOTO_SIZE:
+        return {'file': name, 'status': 'too_small', 'message': f"Image is {width}x{height}, minimum is 100x100"}
+
+    encoding, message = compute_face_encoding(image)
+    if encoding is None:
+        return {'file': name, 'status': FAILURE_STATUS.get(message, 'encode_failed'), 'message': message}
+
+    if max(height, width) > MAX_STORED_SIZE:
+        scale = MAX_STORED_SIZE / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode('.jpg', image)
+    if not ok:
+        return {'file': name, 'status': 'encode_failed', 'message': "Could not re-encode image"}
+    return {'file': name, 'status': 'ok', 'message': "ok", 'encoding': encoding, 'jpeg': jpeg.tobytes()}
+
+
+def default_journal_path(source_path):
+    """photos/ -> photos.enroll.jsonl, photos.zip -> photos.zip.enroll.jsonl"""
+    return os.path.normpath(source_path) + '.enroll.jsonl'
+
+
+def load_journal(path):
+    """file name -> its latest journal entry"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            entries[entry['file']] = entry
+    return entries
+
+
+def write_report(journal, path):
+    """CSV of every file whose latest attempt did not enroll; returns the row count"""
+    failures = [e for e in journal.values() if e['status'] != 'enrolled']
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['file', 'idno', 'status', 'message'], extrasaction='ignore')
+        writer.writeheader()
+        for entry in sorted(failures, key=lambda e: e['file']):
+            writer.writerow(entry)
+    return len(failures)
+
+
+class BulkEnroller:
+    """Feeds photos through the worker pool and writes enrolled faces in batches"""
+
+    def __init__(self, db_path='facecheck.db', faces_dir='known_faces', journal_path=None,
+                 workers=None, batch_size=50, retry_failed=False, force=False):
+        self.db_path = db_path
+        self.store = FaceEncodingStore(db_path)
+        self.faces_dir = faces_dir
+        self.journal_path = journal_path
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = max(int(batch_size), 1)
+        self.retry_failed = retry_failed
+        self.force = force
+        self.journal = {}
+        self.stats = {'enrolled': 0, 'failed': 0, 'skipped': 0}
+
+    def student_ids(self):
+        """idno -> student_id for every student account"""
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            ensure_registration_schema(conn)
+            rows = conn.execute('''
+                SELECT u.idno, s.student_id FROM user u
+                JOIN student s ON u.user_id = s.user_id
+            ''').fetchall()
+            return {str(idno).strip(): student_id for idno, student_id in rows}
+        finally:
+            conn.close()
+
+    def already_done(self, name, source_hash):
+        """Whether a previous run already handled this exact file"""
+        entry = self.journal.get(name)
+        if self.force or not entry or entry.get('source_hash') != source_hash:
+            return False
+        if entry['status'] == 'enrolled':
+            return True
+        # Unknown idnos are re-checked every run (the account may exist now)
+        return entry['status'] != 'unknown_student' and not self.retry_failed
+
+    def _record(self, entries):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                entry['at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                f.write(json.dumps(entry) + '\n')
+                self.journal[entry['file']] = entry
+
+    def _fail(self, pending_entries, entry):
+        print(f"❌ {entry['file']}: {entry['message']}")
+        self.stats['failed'] += 1
+        pending_entries.append(entry)
+
+    def _write_batch(self, batch):
+        """Save the photos and register them in one transaction; returns journal entries"""
+        os.makedirs(self.faces_dir, mode=0o755, exist_ok=True)
+        written = []
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            for result in batch:
+                image_hash = image_content_hash(result['jpeg'])
+                face_path = os.path.join(self.faces_dir, f"{result['idno']}_{image_hash[:8]}.jpg")
+                with open(face_path, 'wb') as f:
+                    f.write(result['jpeg'])
+                written.append(face_path)
+                conn.execute('UPDATE student SET attendance_image = ?, face_registered = 1 WHERE student_id = ?',
+                             (face_path, result['student_id']))
+                # Template first: it seeds the previously cached photo as a template
+                self.store.add_template('student', result['student_id'], face_path, result['encoding'],
+                                        image_hash=image_hash, conn=conn,
+                                        max_templates=SecurityConfig.FACE_TEMPLATE_CAP,
+                                        policy=SecurityConfig.FACE_TEMPLATE_POLICY)
+                self.store.save_encoding('student', result['student_id'], face_path, result['encoding'],
+                                         image_hash=image_hash, conn=conn)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for path in written:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            conn.close()
+
+        self.stats['enrolled'] += len(batch)
+        return [{'file': r['file'], 'idno': r['idno'], 'source_hash': r['source_hash'], 'status': 'enrolled',
+                 'message': "ok", 'student_id': r['student_id'], 'image_path': path}
+                for r, path in zip(batch, written)]
+
+    def _tasks(self, source, students, pending_entries):
+        """(name, bytes) for every photo that still needs encoding, with its bookkeeping"""
+        for name in source.names():
+            data = source.read(name)
+            source_hash = image_content_hash(data)
+            if self.already_done(name, source_hash):
+                self.stats['skipped'] += 1
+                continue
+            idno = idno_from_name(name)
+            meta = {'file': name, 'idno': idno, 'source_hash': source_hash}
+            if idno not in students:
+                self._fail(pending_entries, dict(meta, status='unknown_student',
+                                                 message=f"No student with ID number '{idno}'"))
+                continue
+            yield (name, data), dict(meta, student_id=students[idno])
+
+    def _handle(self, result, meta, batch, pending_entries):
+        result.update(meta)
+        if result['status'] == 'ok':
+            batch.append(result)
+        else:
+            self._fail(pending_entries, {k: result[k] for k in ('file', 'idno', 'source_hash', 'status', 'message')})
+        if len(batch) >= self.batch_size:
+            self._flush(batch, pending_entries)
+
+    def _flush(self, batch, pending_entries):
+        ready, entries = list(batch), list(pending_entries)
+        batch.clear()
+        pending_entries.clear()
+        if ready:
+            entries.extend(self._write_batch(ready))
+            print(f"💾 {self.stats['enrolled']} enrolled, {self.stats['failed']} failed, "
+                  f"{self.stats['skipped']} skipped")
+        if entries:
+            self._record(entries)
+
+    def run(self, source_path):
+        """Enroll every photo under source_path; returns the stats counters"""
+        if self.journal_path is None:
+            self.journal_path = default_journal_path(source_path)
+        self.journal = load_journal(self.journal_path)
+        self.store.ensure_table()
+        students = self.student_ids()
+
+        batch, pending_entries = [], []
+        with PhotoSource(source_path) as source:
+            tasks = self._tasks(source, students, pending_entries)
+            try:
+                if self.workers <= 0:
+                    for task, meta in tasks:
+                        self._handle(encode_photo(task), meta, batch, pending_entries)
+                else:
+                    self._run_pool(tasks, batch, pending_entries)
+            finally:
+                # Keep everything that finished, even when interrupted
+                self._flush(batch, pending_entries)
+        return self.stats
+
+    @staticmethod
+    def _outcome(future, meta):
+        """A worker's result; one that raised (e.g. a crashed worker) is that file's 'error'"""
+        try:
+            return future.result()
+        except Exception as e:
+            return error_result(meta['file'], e)
+
+    def _run_pool(self, tasks, batch, pending_entries):
+        """Keep a few photos per worker in flight (the images are not all read into memory)"""
+        ctx = multiprocessing.get_context('spawn')  # dlib/OpenCV state must not be forked
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as pool:
+            in_flight = {}
+            try:
+                for task, meta in tasks:
+                    in_flight[pool.submit(encode_photo, task)] = meta
+                    if len(in_flight) >= self.workers * 4:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            meta = in_flight.pop(future)
+                            self._handle(self._outcome(future, meta), meta, batch, pending_entries)
+                for future in list(in_flight):
+                    meta = in_flight.pop(future)
+                    self._handle(self._outcome(future, meta), meta, batch, pending_entries)
+            except KeyboardInterrupt:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll a folder or ZIP of <idno>.jpg photos")
+    parser.add_argument('source', help="directory or ZIP archive of registration photos")
+    parser.add_argument('--db', default='facecheck.db', help="database path")
+    parser.add_argument('--faces-dir', default='known_faces', help="where enrolled photos are stored")
+    parser.add_argument('--workers', type=int, default=None, help="encoding processes (default: CPU count, 0 = inline)")
+    parser.add_argument('--batch', type=int, default=50, help="enrolled photos per database transaction")
+    parser.add_argument('--journal', default=None, help="progress journal (default: <source>.enroll.jsonl)")
+    parser.add_argument('--report', default=None, help="failure report CSV (default: <source>.failures.csv)")
+    parser.add_argument('--retry-failed', action='store_true', help="re-run files that failed in an earlier run")
+    parser.add_argument('--force', action='store_true', help="re-enroll files that were already enrolled")
+    args = parser.parse_args()
+
+    if not FACE_RECOGNITION_AVAILABLE:
+        print("❌ face_recognition is not installed. Run: pip install face-recognition")
+        sys.exit(1)
+
+    enroller = BulkEnroller(args.db, args.faces_dir, args.journal, args.workers, args.batch,
+                            retry_failed=args.retry_failed, force=args.force)
+    print(f"🔄 Enrolling photos from {args.source} ({enroller.workers} worker(s))...")
+    start = time.time()
+    interrupted = False
+    try:
+        stats = enroller.run(args.source)
+    except KeyboardInterrupt:
+        stats, interrupted = enroller.stats, True
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    report_path = args.report or os.path.normpath(args.source) + '.failures.csv'
+    failures = write_report(enroller.journal, report_path)
+    elapsed = time.time() - start
+    print(f"\n{'⏸️ Interrupted' if interrupted else '🎉 Done'}: {stats['enrolled']} enrolled, "
+          f"{stats['failed']} failed, {stats['skipped']} already handled ({elapsed:.1f}s)")
+    print(f"📄 {failures} file(s) not enrolled, listed in {report_path}")
+    if interrupted:
+        print(f"   Run the same command again to resume (progress is in {enroller.journal_path})")
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
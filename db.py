@@ -38,6 +38,8 @@ def create_database():
             CREATE TABLE IF NOT EXISTS faculty (
                 faculty_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 position VARCHAR(30) NOT NULL,
+                attendance_image VARCHAR(255),
+                face_registered BOOLEAN DEFAULT 0,
                 user_id INTEGER NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES user(user_id)
             )
@@ -57,6 +59,7 @@ def create_database():
                 student_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 year_level VARCHAR(20) NOT NULL,
                 attendance_image VARCHAR(255),
+                face_registered BOOLEAN DEFAULT 0,
                 course_id INTEGER,
                 user_id INTEGER NOT NULL,
                 FOREIGN KEY (course_id) REFERENCES course(course_id),
@@ -147,6 +150,38 @@ def create_database():
                 FOREIGN KEY (user_id) REFERENCES user(user_id)
             )
         """)
+        # Event check-ins look up (event, user) before inserting
+        c.execute('CREATE INDEX IF NOT EXISTS idx_event_attendance_event_user ON event_attendance(event_id, user_id)')
+        
+        # FACE_ENCODING table (cached 128-d encodings of registered photos)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS face_encoding (
+                encoding_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner_type VARCHAR(10) NOT NULL CHECK (owner_type IN ('student', 'faculty')),
+                owner_id INTEGER NOT NULL,
+                image_path VARCHAR(255) NOT NULL,
+                image_hash VARCHAR(64) NOT NULL,
+                encoding BLOB NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                image_mtime REAL,
+                UNIQUE(owner_type, owner_id)
+            )
+        """)
+        
+        # FACE_TEMPLATE table (every reference photo encoding, several per person)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS face_template (
+                template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner_type VARCHAR(10) NOT NULL CHECK (owner_type IN ('student', 'faculty')),
+                owner_id INTEGER NOT NULL,
+                image_path VARCHAR(255) NOT NULL,
+                image_hash VARCHAR(64) NOT NULL,
+                encoding BLOB NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(owner_type, owner_id, image_hash)
+            )
+        """)
+        c.execute('CREATE INDEX IF NOT EXISTS idx_face_template_owner ON face_template(owner_type, owner_id)')
         
         # Insert default data
         insert_default_data(c)
@@ -0,0 +1,64 @@
+"""
+Debug frame capture
+Recognition no longer writes uploaded frames to temp/, so when the frames a
+kiosk sends need inspecting, every Nth frame can be kept in a fixed-size ring
+on disk: slot files are overwritten in turn, so the directory never grows
+past `capacity` images. Off unless DEBUG_CAPTURE_FRAMES > 0
+"""
+
+import os
+import threading
+
+
+class FrameCaptureRing:
+    """Keeps the last `capacity` sampled frames as frame_000.jpg ... frame_NNN.jpg"""
+
+    def __init__(self, directory='temp/debug_frames', capacity=0, every=1):
+        self.directory = directory
+        self.capacity = max(0, int(capacity))
+        self.every = max(1, int(every))
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._written = 0
+        self._slots = {}    # slot -> (source tag, path) of the frame it holds
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def capture(self, image_bytes, source='frame'):
+        """Store one encoded frame if it is sampled; returns the path written, or None"""
+        if not self.enabled or not image_bytes:
+            return None
+        with self._lock:
+            self._seen += 1
+            if (self._seen - 1) % self.every:
+                return None
+            slot = self._written % self.capacity
+            self._written += 1
+
+        path = os.path.join(self.directory, f"frame_{slot:03d}.jpg")
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, mode=0o755, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Failed to capture debug frame: {e}")
+            return None
+
+        with self._lock:
+            self._slots[slot] = (source, path)
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'capacity': self.capacity,
+                'every': self.every,
+                'frames_seen': self._seen,
+                'frames_written': self._written,
+                'slots': {slot: {'source': source, 'path': path} for slot, (source, path) in self._slots.items()}
+            }
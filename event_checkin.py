@@ -0,0 +1,208 @@
+"""
+Event check-in writer
+Check-ins at an event door arrive in bursts from several kiosks at once.
+Written one request at a time, each is a connection, a duplicate lookup and
+a commit of its own, and the commits serialize on SQLite's write lock.
+EventCheckinWriter queues them instead: one writer thread takes whatever
+has queued up while the previous batch was committing and writes it in a
+single transaction with one executemany
+
+Duplicates are suppressed twice: the (event, user) pairs already checked in
+are remembered in memory (seeded from event_attendance the first time an
+event is seen), so a kiosk that keeps seeing the same face never reaches the
+database; and each batch re-checks event_attendance under the write lock,
+so another process cannot make a second row for the same person
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+MARKED = 'marked'
+DUPLICATE = 'duplicate'
+EVENT_STATUSES = ('present', 'absent', 'late')
+
+
+def ensure_event_attendance_index(conn):
+    """Index the duplicate check (event_id, user_id) when missing"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_attendance_event_user '
+                 'ON event_attendance(event_id, user_id)')
+    conn.commit()
+
+
+class _Checkin:
+    __slots__ = ('event_id', 'user_id', 'status', 'attendance_time', 'future')
+
+    def __init__(self, event_id, user_id, status, attendance_time):
+        self.event_id = event_id
+        self.user_id = user_id
+        self.status = status
+        self.attendance_time = attendance_time
+        self.future = Future()
+
+
+class EventCheckinWriter:
+    """Batched, de-duplicated inserts into event_attendance from one writer thread"""
+
+    def __init__(self, db_path='facecheck.db', max_batch=200, max_events=64):
+        self.db_path = db_path
+        self.max_batch = max_batch      # check-ins per transaction
+        self.max_events = max_events    # events whose checked-in users are remembered
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._seen = OrderedDict()      # event id -> {user id: attendance time, None while in flight}
+        self._thread = None
+        self._indexed = False
+        self._stats = {'submitted': 0, 'marked': 0, 'duplicates': 0, 'batches': 0, 'written': 0,
+                       'errors': 0, 'largest_batch': 0, 'write_ms': 0.0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _checked_in(self, event_id):
+        """The event's {user id: attendance time}, loaded from the database the first time"""
+        with self._lock:
+            seen = self._seen.get(event_id)
+            if seen is not None:
+                self._seen.move_to_end(event_id)
+                return seen
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT user_id, MIN(attendance_time) AS attendance_time FROM event_attendance
+                WHERE event_id = ? GROUP BY user_id
+            ''', (event_id,)).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            seen = self._seen.get(event_id)
+            if seen is None:  # another request may have loaded it meanwhile
+                seen = self._seen[event_id] = {row['user_id']: row['attendance_time'] for row in rows}
+                while len(self._seen) > self.max_events:
+                    self._seen.popitem(last=False)
+            return seen
+
+    def submit(self, event_id, user_id, status='present'):
+        """
+        Queue one check-in; returns a Future resolving to
+        {'status': 'marked' | 'duplicate', 'attendance_time': ...}
+        A user already checked in (or in flight) resolves at once as a duplicate
+        """
+        if status not in EVENT_STATUSES:
+            raise ValueError(f"Unknown attendance status: {status}")
+        event_id, user_id = int(event_id), int(user_id)
+        seen = self._checked_in(event_id)
+        with self._lock:
+            self._stats['submitted'] += 1
+            if user_id in seen:
+                self._stats['duplicates'] += 1
+                future = Future()
+                future.set_result({'status': DUPLICATE, 'attendance_time': seen[user_id]})
+                return future
+            seen[user_id] = None  # reserved until the batch commits
+            checkin = _Checkin(event_id, user_id, status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            self._queue.put(checkin)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-checkin-writer', daemon=True)
+                self._thread.start()
+        return checkin.future
+
+    def check_in(self, event_id, user_id, status='present', timeout=30.0):
+        """Blocking submit(): returns once the check-in is committed (or found to be a duplicate)"""
+        return self.submit(event_id, user_id, status).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Whatever queued up during the last commit goes into this one
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._connect()
+            if not self._indexed:
+                ensure_event_attendance_index(conn)
+                self._indexed = True
+            conn.execute('BEGIN IMMEDIATE')  # the duplicate re-check and the inserts hold the write lock
+
+            existing = {}
+            by_event = {}
+            for checkin in batch:
+                by_event.setdefault(checkin.event_id, []).append(checkin.user_id)
+            for event_id, user_ids in by_event.items():
+                for start in range(0, len(user_ids), 500):
+                    chunk = user_ids[start:start + 500]
+                    for row in conn.execute(f'''
+                        SELECT user_id, MIN(attendance_time) AS attendance_time FROM event_attendance
+                        WHERE event_id = ? AND user_id IN ({','.join('?' * len(chunk))})
+                        GROUP BY user_id
+                    ''', (event_id, *chunk)).fetchall():
+                        existing[(event_id, row['user_id'])] = row['attendance_time']
+
+            rows = [(c.attendance_time, c.status, c.event_id, c.user_id)
+                    for c in batch if (c.event_id, c.user_id) not in existing]
+            conn.executemany('''
+                INSERT INTO event_attendance (attendance_time, status, event_id, user_id)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            with self._lock:
+                self._stats['errors'] += 1
+                for checkin in batch:
+                    self._seen.get(checkin.event_id, {}).pop(checkin.user_id, None)  # a retry may write it
+            for checkin in batch:
+                checkin.future.set_exception(e)
+            print(f"❌ Event check-in batch of {len(batch)} failed: {e}")
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+
+        with self._lock:
+            stats = self._stats
+            stats['batches'] += 1
+            stats['written'] += len(batch)
+            stats['largest_batch'] = max(stats['largest_batch'], len(batch))
+            stats['write_ms'] += (time.perf_counter() - started) * 1000.0
+            for checkin in batch:
+                key = (checkin.event_id, checkin.user_id)
+                result = ({'status': DUPLICATE, 'attendance_time': existing[key]} if key in existing
+                          else {'status': MARKED, 'attendance_time': checkin.attendance_time})
+                stats['marked' if result['status'] == MARKED else 'duplicates'] += 1
+                seen = self._seen.get(checkin.event_id)
+                if seen is not None:
+                    seen[checkin.user_id] = result['attendance_time']
+                checkin.future.set_result(result)
+
+    def forget(self, event_id=None):
+        """Drop the remembered check-ins of one event (or all), e.g. after rows were deleted"""
+        with self._lock:
+            if event_id is None:
+                self._seen.clear()
+            else:
+                self._seen.pop(int(event_id), None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queue.qsize()
+            stats['events'] = len(self._seen)
+        stats['avg_batch'] = round(stats.pop('written') / stats['batches'], 2) if stats['batches'] else None
+        stats['write_ms'] = round(stats.pop('write_ms'), 2)
+        return stats
@@ -0,0 +1,92 @@
+"""
+Face-crop preprocessing for the anti-spoofing checks
+Every check used to convert the raw face region to gray (or HSV/LAB) on its
+own, at whatever size the camera produced, so the cost of a check grew with
+webcam resolution and the print check ran its FFT on an arbitrary size.
+FaceCropPreprocessor cuts the face out once, resizes it to a fixed square
+analysis size (a power of two by default, which suits the FFT) and converts
+it to gray once; HSV and LAB are converted on first use, as only the colour
+check needs them. The arrays are written into scratch buffers kept per thread
+(one set per worker process or request thread), so a frame allocates nothing
+
+A FaceCrop is only valid until the same thread prepares the next one; the
+checks read it during one comprehensive_anti_spoofing_check() call
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+
+class FaceCrop:
+    """One face region at the analysis size, with its colour conversions"""
+
+    def __init__(self, image, gray, buffers=None):
+        self.image = image  # 3-channel crop, same channel order as the frame
+        self.gray = gray
+        self._buffers = buffers if buffers is not None else {}
+        self._hsv = None
+        self._lab = None
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def hsv(self):
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV, dst=self._buffers.get('hsv'))
+        return self._hsv
+
+    @property
+    def lab(self):
+        if self._lab is None:
+            self._lab = cv2.cvtColor(self.image, cv2.COLOR_BGR2LAB, dst=self._buffers.get('lab'))
+        return self._lab
+
+
+class FaceCropPreprocessor:
+    """Cuts, resizes and converts face regions into per-thread scratch buffers"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffers(self, size):
+        """This thread's buffers for one analysis size"""
+        by_size = getattr(self._local, 'buffers', None)
+        if by_size is None:
+            by_size = self._local.buffers = {}
+        buffers = by_size.get(size)
+        if buffers is None:
+            buffers = by_size[size] = {
+                'image': np.empty((size, size, 3), dtype=np.uint8),
+                'gray': np.empty((size, size), dtype=np.uint8),
+                'hsv': np.empty((size, size, 3), dtype=np.uint8),
+                'lab': np.empty((size, size, 3), dtype=np.uint8)
+            }
+        return buffers
+
+    def prepare(self, image, face_location, size=128):
+        """
+        FaceCrop of the (top, right, bottom, left) box of an 8-bit colour
+        frame, resized to size x size (None or 0 keeps the native size);
+        None when the box is empty
+        """
+        top, right, bottom, left = face_location
+        region = image[top:bottom, left:right]
+        if region.size == 0:
+            return None
+        if not size:
+            return FaceCrop(region, cv2.cvtColor(region, cv2.COLOR_BGR2GRAY))
+
+        buffers = self._buffers(size)
+        # Area averaging when shrinking (no aliasing), bilinear when enlarging
+        interpolation = cv2.INTER_AREA if region.shape[0] > size or region.shape[1] > size else cv2.INTER_LINEAR
+        resized = cv2.resize(region, (size, size), dst=buffers['image'], interpolation=interpolation)
+        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY, dst=buffers['gray'])
+        return FaceCrop(resized, gray, buffers)
@@ -0,0 +1,303 @@
+"""
+Resolution-aware face detection
+HOG detection cost grows with pixel count, so webcam frames are searched on a
+downscaled copy and the boxes are mapped back to full resolution, where the
+encodings and landmarks are computed. Upsampling is only escalated when a
+tier finds nothing (the same retry face_recog_test.load_known_faces does by hand)
+
+Detector backends share one interface - detect(rgb) -> (locations, info) and
+for_face_width(width) - and are picked with DETECTOR_BACKEND:
+  hog       - dlib HOG (FaceDetectionPipeline)
+  haar/lbp  - OpenCV cascade on a small grayscale copy (CascadeDetector)
+  haar+hog  - cascade proposes, HOG confirms inside each candidate box
+  lbp+hog     (CascadeThenVerifyDetector), full-frame HOG when nothing is confirmed
+"""
+
+import os
+import copy
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = CV2_AVAILABLE
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+DETECTOR_BACKENDS = ('hog', 'haar', 'lbp', 'haar+hog', 'lbp+hog')
+
+CASCADE_FILES = {
+    'haar': ('haarcascade_frontalface_default.xml',),
+    'lbp': ('lbpcascade_frontalface_improved.xml', 'lbpcascade_frontalface.xml')
+}
+# pip's opencv wheels only ship the Haar cascades; LBP ones come with a system OpenCV
+CASCADE_DIRS = (
+    '/usr/share/opencv4/lbpcascades',
+    '/usr/share/opencv/lbpcascades',
+    '/usr/local/share/opencv4/lbpcascades'
+)
+
+# Cascade boxes sit higher and are a little larger than dlib's box for the same
+# face; (left, top, width, height) of the HOG box as fractions of the cascade
+# box, measured on recorded kiosk frames so landmarks and encodings line up
+CASCADE_BOX_ADJUST = (-0.006, 0.084, 0.925, 0.924)
+
+
+def parse_upsample_tiers(value, default=(1, 2)):
+    """'1,2' -> (1, 2); invalid or empty values fall back to the default"""
+    try:
+        tiers = tuple(int(v) for v in str(value).split(',') if v.strip())
+    except ValueError:
+        return default
+    return tuple(t for t in tiers if t >= 0) or default
+
+
+def scale_location(location, factor, image_shape):
+    """Map a (top, right, bottom, left) box by factor and clip it to the image"""
+    top, right, bottom, left = location
+    height, width = image_shape[:2]
+    return (
+        max(0, int(round(top * factor))),
+        min(width, int(round(right * factor))),
+        min(height, int(round(bottom * factor))),
+        max(0, int(round(left * factor)))
+    )
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / float(union) if union > 0 else 0.0
+
+
+def expand_box(location, margin, image_shape):
+    """Grow a box by margin x its size on every side, clipped to the image"""
+    top, right, bottom, left = location
+    dy, dx = int((bottom - top) * margin), int((right - left) * margin)
+    height, width = image_shape[:2]
+    return max(0, top - dy), min(width, right + dx), min(height, bottom + dy), max(0, left - dx)
+
+
+def effective_scale(scale, min_width, image_shape):
+    """Downscale factor for a frame, never shrinking it narrower than min_width"""
+    width = image_shape[1]
+    if scale >= 1.0 or width * scale >= min_width:
+        return scale
+    return min(1.0, min_width / float(width))
+
+
+def cascade_box_to_location(box, factor, image_shape, adjust=CASCADE_BOX_ADJUST):
+    """Cascade (x, y, w, h) on a downscaled image -> HOG-like full-resolution (top, right, bottom, left)"""
+    x, y, w, h = (float(v) for v in box)
+    left, top = x + adjust[0] * w, y + adjust[1] * h
+    right, bottom = left + adjust[2] * w, top + adjust[3] * h
+    return scale_location((top, right, bottom, left), factor, image_shape)
+
+
+def cascade_path(kind, path=None):
+    """Location of the cascade file for 'haar' or 'lbp' (path: file or directory to try first)"""
+    names = CASCADE_FILES.get(kind)
+    if not names:
+        raise ValueError(f"unknown cascade: {kind}")
+    if path and os.path.isfile(path):
+        return path
+    directories = [path] if path else []
+    if CV2_AVAILABLE and hasattr(cv2, 'data'):
+        directories.append(cv2.data.haarcascades)
+        directories.append(os.path.join(os.path.dirname(os.path.normpath(cv2.data.haarcascades)), 'lbpcascades'))
+    directories.extend(CASCADE_DIRS)
+    for directory in directories:
+        for name in names:
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def load_cascade(kind, path=None):
+    """cv2.CascadeClassifier for 'haar' or 'lbp', or None when it is unavailable"""
+    if not CV2_AVAILABLE:
+        return None
+    location = cascade_path(kind, path)
+    if location is None:
+        return None
+    classifier = cv2.CascadeClassifier(location)
+    return None if classifier.empty() else classifier
+
+
+class FaceDetectionPipeline:
+    """
+    Tiered HOG detection: each tier is one upsample level run on the frame
+    downscaled by `scale`; the first tier that finds a face wins
+    """
+
+    def __init__(self, scale=0.5, upsample_tiers=(1, 2), model="hog", min_width=320):
+        self.scale = min(max(float(scale), 0.05), 1.0)
+        self.upsample_tiers = tuple(upsample_tiers) or (1,)
+        self.model = model
+        self.min_width = min_width  # never shrink a frame narrower than this
+
+    def for_face_width(self, face_width, target_width=100):
+        """
+        Pipeline for searching a crop around a face already known to be
+        face_width px wide: shrink it until the face is about target_width px
+        (comfortably above HOG's 80 px window) and try without upsampling first
+        """
+        scale = min(1.0, target_width / float(max(face_width, 1)))
+        return FaceDetectionPipeline(scale=scale, upsample_tiers=(0, 1), model=self.model, min_width=0)
+
+    def effective_scale(self, image_shape):
+        """Downscale factor for a frame (1.0 when the frame is already small)"""
+        return effective_scale(self.scale, self.min_width, image_shape)
+
+    def detect(self, rgb_image):
+        """
+        Find faces in a full-resolution RGB frame
+        Returns: (face_locations, tier) - locations are in full-resolution
+        coordinates; tier describes what found them, or is None when no tier did
+        """
+        if not FACE_RECOGNITION_AVAILABLE:
+            raise RuntimeError("face_recognition library not available")
+
+        scale = self.effective_scale(rgb_image.shape)
+        if scale < 1.0:
+            small = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = rgb_image
+
+        for index, upsample in enumerate(self.upsample_tiers):
+            locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample,
+                                                        model=self.model)
+            if locations:
+                if small is not rgb_image:
+                    factor = rgb_image.shape[1] / float(small.shape[1])
+                    locations = [scale_location(loc, factor, rgb_image.shape) for loc in locations]
+                return locations, {
+                    'backend': 'hog',
+                    'tier': index,
+                    'scale': round(scale, 3),
+                    'upsample': upsample,
+                    'detect_size': [int(small.shape[1]), int(small.shape[0])]
+                }
+
+        return [], None
+
+
+class CascadeDetector:
+    """
+    OpenCV cascade detection ('haar' or 'lbp') on a downscaled, equalized
+    grayscale copy of the frame; boxes are mapped to full resolution and
+    adjusted to HOG's framing, largest face first
+    """
+
+    def __init__(self, kind='haar', scale=0.25, min_width=160, min_size=32, min_neighbors=5,
+                 scale_factor=1.1, path=None):
+        self.kind = kind
+        self.classifier = load_cascade(kind, path)
+        if self.classifier is None:
+            raise RuntimeError(f"{kind} cascade not available (set DETECTOR_CASCADE_PATH)")
+        self.scale = min(max(float(scale), 0.05), 1.0)
+        self.min_width = min_width
+        self.min_size = min_size          # smallest face in the downscaled image, px
+        self.min_neighbors = min_neighbors
+        self.scale_factor = scale_factor
+
+    def for_face_width(self, face_width, target_width=48):
+        """Same cascade, scaled so a face_width px face is about target_width px"""
+        detector = copy.copy(self)
+        detector.scale = min(1.0, target_width / float(max(face_width, 1)))
+        detector.min_width = 0
+        return detector
+
+    def detect(self, rgb_image):
+        """Same contract as FaceDetectionPipeline.detect"""
+        scale = effective_scale(self.scale, self.min_width, rgb_image.shape)
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes = self.classifier.detectMultiScale(cv2.equalizeHist(gray), scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors,
+                                                 minSize=(self.min_size, self.min_size))
+        if len(boxes) == 0:
+            return [], None
+        factor = rgb_image.shape[1] / float(gray.shape[1])
+        boxes = sorted(boxes, key=lambda box: box[2] * box[3], reverse=True)
+        return [cascade_box_to_location(box, factor, rgb_image.shape) for box in boxes], {
+            'backend': self.kind,
+            'tier': 0,
+            'scale': round(scale, 3),
+            'detect_size': [int(gray.shape[1]), int(gray.shape[0])]
+        }
+
+
+class CascadeThenVerifyDetector:
+    """
+    A cheap cascade proposes face boxes and the (HOG) verifier only searches
+    a window around each of them, which drops cascade false positives and
+    gives dlib-framed boxes. When nothing is confirmed the verifier searches
+    the whole frame, so recall stays that of the verifier alone
+    """
+
+    def __init__(self, cascade, verifier, margin=0.3, fallback=True):
+        self.cascade = cascade
+        self.verifier = verifier
+        self.margin = margin
+        self.fallback = fallback
+
+    def for_face_width(self, face_width):
+        return self.verifier.for_face_width(face_width)
+
+    def detect(self, rgb_image):
+        candidates, _ = self.cascade.detect(rgb_image)
+        locations = []
+        for candidate in candidates:
+            top, right, bottom, left = expand_box(candidate, self.margin, rgb_image.shape)
+            crop = rgb_image[top:bottom, left:right]
+            if crop.size == 0:
+                continue
+            found, _ = self.verifier.for_face_width(candidate[1] - candidate[3]).detect(crop)
+            for t, r, b, l in found:
+                location = (t + top, r + left, b + top, l + left)
+                if all(box_iou(location, kept) < 0.5 for kept in locations):
+                    locations.append(location)
+        if locations:
+            return locations, {
+                'backend': f"{self.cascade.kind}+hog",
+                'tier': 0,
+                'candidates': len(candidates),
+                'verified': len(locations)
+            }
+        if not self.fallback:
+            return [], None
+        locations, detection = self.verifier.detect(rgb_image)
+        if not locations:
+            return [], None
+        return locations, dict(detection, backend=f"{self.cascade.kind}+hog", fallback=True,
+                               candidates=len(candidates))
+
+
+def create_detector(backend='hog', scale=0.5, upsample_tiers=(1, 2), cascade_scale=0.25, cascade_path=None):
+    """Detector for a DETECTOR_BACKEND name; unknown or unavailable backends fall back to HOG"""
+    backend = (backend or 'hog').strip().lower()
+    hog = FaceDetectionPipeline(scale=scale, upsample_tiers=upsample_tiers)
+    if backend == 'hog':
+        return hog
+    if backend not in DETECTOR_BACKENDS:
+        print(f"⚠️ Unknown detector backend '{backend}', using HOG")
+        return hog
+    kind, _, verify = backend.partition('+')
+    try:
+        cascade = CascadeDetector(kind, scale=cascade_scale, path=cascade_path)
+    except RuntimeError as e:
+        print(f"⚠️ {e}, using HOG")
+        return hog
+    return CascadeThenVerifyDetector(cascade, hog) if verify else cascade
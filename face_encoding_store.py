@@ -0,0 +1,666 @@
+"""
+Persistent face encoding store
+Caches the 128-d face encodings of registered photos in the database so that
+recognition only has to encode the probe frame instead of every known face.
+Each registration is also kept as a reference template (face_template), so a
+person can be matched against several photos instead of only the latest one
+
+Usage:
+    python face_encoding_store.py backfill          # encode missing/changed images
+    python face_encoding_store.py backfill --force  # re-encode every image
+    python face_encoding_store.py stats             # show cache statistics
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+from face_detection import FaceDetectionPipeline
+
+try:
+    import cv2
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+# Registration photos are small and must not miss a face: full resolution, upsample 1 then 2
+REGISTRATION_DETECTOR = FaceDetectionPipeline(scale=1.0, upsample_tiers=(1, 2))
+
+ENCODING_DIM = 128
+ENCODING_DTYPE = np.float64  # dlib returns float64 vectors
+TEMPLATE_POLICIES = ('oldest', 'redundant')
+OWNER_ID_COLUMNS = {'student': 'student_id', 'faculty': 'faculty_id'}
+SQL_IN_CHUNK = 500  # ids per IN (...) list, within SQLite's 999-variable limit on older builds
+
+
+def image_content_hash(data):
+    """SHA-256 of raw image bytes (used to detect replaced photos)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_content_hash(path):
+    """SHA-256 of an image file on disk"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def encoding_to_blob(encoding):
+    """Serialize an encoding vector for storage in a BLOB column"""
+    return np.asarray(encoding, dtype=ENCODING_DTYPE).tobytes()
+
+
+def blob_to_encoding(blob):
+    """Deserialize a BLOB column back into an encoding vector"""
+    return np.frombuffer(blob, dtype=ENCODING_DTYPE)
+
+
+def compute_face_encoding(image_bgr):
+    """
+    Encode the single face in a registration photo
+    Returns: (encoding, message) - encoding is None when no usable face was found
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        return None, "face_recognition library not available"
+    if image_bgr is None:
+        return None, "Could not read image"
+
+    rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+
+    # Same escalation as face_recog_test.load_known_faces: retry with more upsampling
+    locations, _ = REGISTRATION_DETECTOR.detect(rgb)
+
+    if not locations:
+        return None, "No face detected"
+    if len(locations) > 1:
+        return None, "Multiple faces detected"
+
+    encodings = face_recognition.face_encodings(rgb, locations)
+    if not encodings:
+        return None, "Could not encode face"
+
+    return encodings[0], "ok"
+
+
+class FaceEncodingStore:
+    """Database-backed cache of face encodings keyed by owner and image hash"""
+
+    OWNER_TYPES = ('student', 'faculty')
+
+    def __init__(self, db_path='facecheck.db'):
+        self.db_path = db_path
+        self._table_ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_table(self, conn=None):
+        """Create the face_encoding table if it does not exist (idempotent)"""
+        if self._table_ready:
+            return
+
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS face_encoding (
+                    encoding_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner_type VARCHAR(10) NOT NULL CHECK (owner_type IN ('student', 'faculty')),
+                    owner_id INTEGER NOT NULL,
+                    image_path VARCHAR(255) NOT NULL,
+                    image_hash VARCHAR(64) NOT NULL,
+                    encoding BLOB NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    image_mtime REAL,
+                    UNIQUE(owner_type, owner_id)
+                )
+            """)
+            # image_mtime: file mtime when image_hash was last verified (gallery_maintenance)
+            columns = [r[1] for r in conn.execute('PRAGMA table_info(face_encoding)').fetchall()]
+            if 'image_mtime' not in columns:
+                conn.execute('ALTER TABLE face_encoding ADD COLUMN image_mtime REAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS face_template (
+                    template_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner_type VARCHAR(10) NOT NULL CHECK (owner_type IN ('student', 'faculty')),
+                    owner_id INTEGER NOT NULL,
+                    image_path VARCHAR(255) NOT NULL,
+                    image_hash VARCHAR(64) NOT NULL,
+                    encoding BLOB NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(owner_type, owner_id, image_hash)
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_face_template_owner ON face_template(owner_type, owner_id)')
+            if own_conn:
+                conn.commit()
+            self._table_ready = True
+        finally:
+            if own_conn:
+                conn.close()
+
+    def save_encoding(self, owner_type, owner_id, image_path, encoding, image_hash=None, conn=None,
+                      image_mtime=None):
+        """
+        Insert or replace the cached encoding for one person
+        image_mtime is the file mtime the hash was taken at (None: unknown, verified on the next check)
+        When a connection is passed the caller owns the transaction (no commit here)
+        """
+        if owner_type not in self.OWNER_TYPES:
+            raise ValueError(f"Invalid owner type: {owner_type}")
+
+        encoding = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        if encoding.shape != (ENCODING_DIM,):
+            raise ValueError(f"Expected a {ENCODING_DIM}-d encoding, got shape {encoding.shape}")
+
+        if image_hash is None:
+            image_hash = file_content_hash(image_path)
+
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            conn.execute("""
+                INSERT INTO face_encoding (owner_type, owner_id, image_path, image_hash, encoding, updated_at,
+                                           image_mtime)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
+                ON CONFLICT(owner_type, owner_id) DO UPDATE SET
+                    image_path = excluded.image_path,
+                    image_hash = excluded.image_hash,
+                    encoding = excluded.encoding,
+                    updated_at = CURRENT_TIMESTAMP,
+                    image_mtime = excluded.image_mtime
+            """, (owner_type, int(owner_id), image_path, image_hash, encoding_to_blob(encoding), image_mtime))
+            if own_conn:
+                conn.commit()
+        finally:
+            if own_conn:
+                conn.close()
+
+    def delete_encoding(self, owner_type, owner_id, conn=None):
+        """Remove the cached encoding for one person"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            conn.execute('DELETE FROM face_encoding WHERE owner_type = ? AND owner_id = ?',
+                         (owner_type, int(owner_id)))
+            if own_conn:
+                conn.commit()
+        finally:
+            if own_conn:
+                conn.close()
+
+    def mark_verified(self, owner_type, owner_id, image_mtime, conn=None):
+        """Record that the cached image_hash still matches the file as of image_mtime"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            conn.execute('UPDATE face_encoding SET image_mtime = ? WHERE owner_type = ? AND owner_id = ?',
+                         (image_mtime, owner_type, int(owner_id)))
+            if own_conn:
+                conn.commit()
+        finally:
+            if own_conn:
+                conn.close()
+
+    def get_encoding(self, owner_type, owner_id):
+        """Return the cached encoding row for one person, or None"""
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            row = conn.execute('''
+                SELECT owner_id, image_path, image_hash, encoding
+                FROM face_encoding
+                WHERE owner_type = ? AND owner_id = ?
+            ''', (owner_type, int(owner_id))).fetchone()
+            if not row:
+                return None
+            return {
+                'owner_id': row['owner_id'],
+                'image_path': row['image_path'],
+                'image_hash': row['image_hash'],
+                'encoding': blob_to_encoding(row['encoding'])
+            }
+        finally:
+            conn.close()
+
+    def add_template(self, owner_type, owner_id, image_path, encoding, image_hash=None, conn=None,
+                     max_templates=5, policy='oldest'):
+        """
+        Append a reference template for one person, keeping at most max_templates
+        When the cap is exceeded one older template is replaced:
+          'oldest'    - drop the earliest registration
+          'redundant' - drop the template closest to another one (keeps the set diverse)
+        The person's previously cached photo is seeded as a template first, so
+        moving from a single photo to templates never loses it
+        When a connection is passed the caller owns the transaction (no commit here)
+        Returns: number of templates now stored for the person
+        """
+        if owner_type not in self.OWNER_TYPES:
+            raise ValueError(f"Invalid owner type: {owner_type}")
+        if policy not in TEMPLATE_POLICIES:
+            raise ValueError(f"Invalid template replacement policy: {policy}")
+
+        encoding = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        if encoding.shape != (ENCODING_DIM,):
+            raise ValueError(f"Expected a {ENCODING_DIM}-d encoding, got shape {encoding.shape}")
+
+        if image_hash is None:
+            image_hash = file_content_hash(image_path)
+
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            owner_id = int(owner_id)
+            has_templates = conn.execute(
+                'SELECT 1 FROM face_template WHERE owner_type = ? AND owner_id = ? LIMIT 1',
+                (owner_type, owner_id)
+            ).fetchone()
+            if not has_templates:
+                conn.execute("""
+                    INSERT OR IGNORE INTO face_template (owner_type, owner_id, image_path, image_hash, encoding, created_at)
+                    SELECT owner_type, owner_id, image_path, image_hash, encoding, updated_at
+                    FROM face_encoding
+                    WHERE owner_type = ? AND owner_id = ? AND image_hash != ?
+                """, (owner_type, owner_id, image_hash))
+
+            conn.execute("""
+                INSERT OR IGNORE INTO face_template (owner_type, owner_id, image_path, image_hash, encoding, created_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (owner_type, owner_id, image_path, image_hash, encoding_to_blob(encoding)))
+
+            rows = conn.execute("""
+                SELECT template_id, image_hash, encoding FROM face_template
+                WHERE owner_type = ? AND owner_id = ?
+                ORDER BY created_at, template_id
+            """, (owner_type, owner_id)).fetchall()
+
+            max_templates = max(int(max_templates), 1)
+            while len(rows) > max_templates:
+                # The template just registered is never the one replaced
+                candidates = [i for i, row in enumerate(rows) if row['image_hash'] != image_hash]
+                if policy == 'redundant':
+                    vectors = np.stack([blob_to_encoding(row['encoding']) for row in rows])
+                    dists = np.linalg.norm(vectors[:, None, :] - vectors[None, :, :], axis=2)
+                    np.fill_diagonal(dists, np.inf)
+                    victim = min(candidates, key=lambda i: dists[i].min())
+                else:
+                    victim = candidates[0]
+                conn.execute('DELETE FROM face_template WHERE template_id = ?', (rows[victim]['template_id'],))
+                rows = rows[:victim] + rows[victim + 1:]
+
+            if own_conn:
+                conn.commit()
+            return len(rows)
+        finally:
+            if own_conn:
+                conn.close()
+
+    def replace_template(self, owner_type, owner_id, old_hash, image_path, encoding, image_hash, conn=None):
+        """
+        Swap the template registered from a photo (old_hash) for the photo's new
+        content, so a replaced photo no longer matches; nothing when the person
+        has no template for old_hash
+        When a connection is passed the caller owns the transaction (no commit here)
+        Returns: whether a template was replaced
+        """
+        encoding = np.asarray(encoding, dtype=ENCODING_DTYPE)
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            replaced = conn.execute("""
+                UPDATE OR REPLACE face_template
+                SET image_path = ?, image_hash = ?, encoding = ?, created_at = CURRENT_TIMESTAMP
+                WHERE owner_type = ? AND owner_id = ? AND image_hash = ?
+            """, (image_path, image_hash, encoding_to_blob(encoding), owner_type, int(owner_id), old_hash)).rowcount
+            if own_conn:
+                conn.commit()
+            return replaced > 0
+        finally:
+            if own_conn:
+                conn.close()
+
+    def get_templates(self, owner_type, owner_id):
+        """All template encodings of one person, oldest first, as a (k x 128) array"""
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            rows = conn.execute("""
+                SELECT encoding FROM face_template
+                WHERE owner_type = ? AND owner_id = ?
+                ORDER BY created_at, template_id
+            """, (owner_type, int(owner_id))).fetchall()
+            if not rows:
+                return np.zeros((0, ENCODING_DIM), dtype=ENCODING_DTYPE)
+            return np.stack([blob_to_encoding(row['encoding']) for row in rows])
+        finally:
+            conn.close()
+
+    def delete_templates(self, owner_type, owner_id, conn=None):
+        """Remove every template of one person"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            conn.execute('DELETE FROM face_template WHERE owner_type = ? AND owner_id = ?',
+                         (owner_type, int(owner_id)))
+            if own_conn:
+                conn.commit()
+        finally:
+            if own_conn:
+                conn.close()
+
+    def _load_templates(self, conn, owner_type, owner_ids=None):
+        """owner id -> list of (image_hash, encoding) for the given owners (or everyone)"""
+        query = """
+            SELECT owner_id, image_hash, encoding FROM face_template
+            WHERE owner_type = ?
+        """
+        params = [owner_type]
+        if owner_ids is not None and len(owner_ids) > SQL_IN_CHUNK:
+            owner_ids = None  # cheaper (and within SQLite's variable limit) to read them all
+        if owner_ids is not None:
+            if not owner_ids:
+                return {}
+            query += f" AND owner_id IN ({','.join('?' * len(owner_ids))})"
+            params.extend(int(o) for o in owner_ids)
+        query += " ORDER BY owner_id, created_at, template_id"
+
+        templates = {}
+        for row in conn.execute(query, params).fetchall():
+            templates.setdefault(row['owner_id'], []).append((row['image_hash'], blob_to_encoding(row['encoding'])))
+        return templates
+
+    def load_student_gallery(self, user_ids=None, changed_since=None):
+        """
+        Load cached encodings for every active student with a registered face
+        Students whose photo has no (or a stale) cache entry are encoded once
+        and written back, so later calls never touch the image files
+        user_ids / changed_since narrow the query for incremental refreshes
+        Returns: list of dicts with student_id, user_id, firstname, lastname,
+        encoding (current photo) and encodings (every reference template)
+        """
+        return self._load_gallery('student', user_ids, changed_since)
+
+    def load_faculty_gallery(self, user_ids=None, changed_since=None):
+        """load_student_gallery() for faculty (event check-in); dicts carry faculty_id"""
+        return self._load_gallery('faculty', user_ids, changed_since)
+
+    def _load_gallery(self, owner_type, user_ids=None, changed_since=None):
+        id_column = OWNER_ID_COLUMNS[owner_type]
+        query = f'''
+            SELECT o.{id_column} AS owner_id, o.user_id, u.firstname, u.lastname, o.attendance_image,
+                   fe.image_path AS cached_path, fe.image_hash, fe.encoding
+            FROM {owner_type} o
+            JOIN user u ON o.user_id = u.user_id
+            LEFT JOIN face_encoding fe
+                ON fe.owner_type = '{owner_type}' AND fe.owner_id = o.{id_column}
+            WHERE o.attendance_image IS NOT NULL AND u.is_active = 1
+        '''
+        params = []
+        if changed_since is not None:
+            query += f'''
+                AND (fe.updated_at >= ? OR EXISTS (
+                    SELECT 1 FROM face_template ft
+                    WHERE ft.owner_type = '{owner_type}' AND ft.owner_id = o.{id_column} AND ft.created_at >= ?
+                ))
+            '''
+            params.extend([changed_since, changed_since])
+        if user_ids is None:
+            batches = [(query, params)]
+        else:
+            # One query per chunk of ids keeps each IN list within SQLite's variable limit
+            user_ids = [int(uid) for uid in user_ids]
+            batches = [(query + f" AND o.user_id IN ({','.join('?' * len(chunk))})", params + chunk)
+                       for chunk in (user_ids[start:start + SQL_IN_CHUNK]
+                                     for start in range(0, len(user_ids), SQL_IN_CHUNK))]
+
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            rows = [row for batch_query, batch_params in batches
+                    for row in conn.execute(batch_query, batch_params).fetchall()]
+            narrowed = user_ids is not None or changed_since is not None
+            templates = self._load_templates(
+                conn, owner_type, [row['owner_id'] for row in rows] if narrowed else None
+            )
+
+            gallery = []
+            for row in rows:
+                image_hash = row['image_hash']
+                if row['encoding'] is not None and row['cached_path'] == row['attendance_image']:
+                    encoding = blob_to_encoding(row['encoding'])
+                else:
+                    encoding = self._encode_and_cache(conn, owner_type, row['owner_id'], row['attendance_image'])
+                    image_hash = None
+
+                encodings = self._reference_encodings(templates.get(row['owner_id'], []), encoding, image_hash)
+                if not encodings:
+                    continue
+                gallery.append({
+                    id_column: row['owner_id'],
+                    'user_id': row['user_id'],
+                    'firstname': row['firstname'],
+                    'lastname': row['lastname'],
+                    'encoding': encoding if encoding is not None else encodings[-1],
+                    'encodings': np.stack(encodings)
+                })
+            return gallery
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _reference_encodings(owned, encoding, image_hash):
+        """Every reference template, plus the current photo if it predates templates"""
+        encodings = [enc for _, enc in owned]
+        if encoding is not None and image_hash not in {h for h, _ in owned}:
+            encodings.append(encoding)
+        return encodings
+
+    def load_student_templates(self, student_ids):
+        """
+        Full-precision reference encodings of some students, in the same order
+        as load_student_gallery() (compact galleries re-rank their closest
+        matches with these). Never encodes images
+        Returns: dict of student_id -> (k x 128) array
+        """
+        return self._load_exact_templates('student', student_ids)
+
+    def load_faculty_templates(self, faculty_ids):
+        """load_student_templates() for faculty"""
+        return self._load_exact_templates('faculty', faculty_ids)
+
+    def _load_exact_templates(self, owner_type, owner_ids):
+        owner_ids = [int(i) for i in owner_ids]
+        if not owner_ids:
+            return {}
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            current = {}
+            for start in range(0, len(owner_ids), SQL_IN_CHUNK):
+                chunk = owner_ids[start:start + SQL_IN_CHUNK]
+                for row in conn.execute(f"""
+                    SELECT owner_id, image_hash, encoding FROM face_encoding
+                    WHERE owner_type = ? AND owner_id IN ({','.join('?' * len(chunk))})
+                """, [owner_type, *chunk]).fetchall():
+                    current[row['owner_id']] = (row['image_hash'], blob_to_encoding(row['encoding']))
+            templates = self._load_templates(conn, owner_type, owner_ids)
+
+            result = {}
+            for owner_id in owner_ids:
+                image_hash, encoding = current.get(owner_id, (None, None))
+                encodings = self._reference_encodings(templates.get(owner_id, []), encoding, image_hash)
+                if encodings:
+                    result[owner_id] = np.stack(encodings)
+            return result
+        finally:
+            conn.close()
+
+    def registered_student_ids(self):
+        """IDs of active students that have a registered face (cheap, no blobs)"""
+        return self._registered_ids('student')
+
+    def registered_faculty_ids(self):
+        """IDs of active faculty that have a registered face"""
+        return self._registered_ids('faculty')
+
+    def _registered_ids(self, owner_type):
+        id_column = OWNER_ID_COLUMNS[owner_type]
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'''
+                SELECT o.{id_column} FROM {owner_type} o
+                JOIN user u ON o.user_id = u.user_id
+                WHERE o.attendance_image IS NOT NULL AND u.is_active = 1
+            ''').fetchall()
+            return {row[0] for row in rows}
+        finally:
+            conn.close()
+
+    def latest_update(self):
+        """Most recent updated_at in the cache (used as an incremental sync cursor)"""
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            return conn.execute('''
+                SELECT MAX(latest) FROM (
+                    SELECT MAX(updated_at) AS latest FROM face_encoding
+                    UNION ALL
+                    SELECT MAX(created_at) FROM face_template
+                )
+            ''').fetchone()[0]
+        finally:
+            conn.close()
+
+    def _encode_and_cache(self, conn, owner_type, owner_id, image_path):
+        """Encode an image file and write it to the cache; returns the encoding or None"""
+        if not image_path or not os.path.exists(image_path):
+            print(f"  No valid image for {owner_type} {owner_id}: {image_path}")
+            return None
+
+        image = cv2.imread(image_path) if FACE_RECOGNITION_AVAILABLE else None
+        encoding, message = compute_face_encoding(image)
+        if encoding is None:
+            print(f"  Could not encode {image_path}: {message}")
+            return None
+
+        with self._lock:
+            self.save_encoding(owner_type, owner_id, image_path, encoding, conn=conn)
+            conn.commit()
+        return encoding
+
+    def backfill(self, force=False):
+        """
+        Encode every registered student/faculty photo that is missing from the
+        cache or whose file content changed since it was cached
+        Returns: dict of counters
+        """
+        stats = {'encoded': 0, 'unchanged': 0, 'missing_file': 0, 'failed': 0}
+
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            owners = [
+                ('student', row['owner_id'], row['attendance_image'])
+                for row in conn.execute(
+                    'SELECT student_id AS owner_id, attendance_image FROM student WHERE attendance_image IS NOT NULL'
+                ).fetchall()
+            ]
+            faculty_columns = [r[1] for r in conn.execute('PRAGMA table_info(faculty)').fetchall()]
+            if 'attendance_image' in faculty_columns:
+                owners += [
+                    ('faculty', row['owner_id'], row['attendance_image'])
+                    for row in conn.execute(
+                        'SELECT faculty_id AS owner_id, attendance_image FROM faculty WHERE attendance_image IS NOT NULL'
+                    ).fetchall()
+                ]
+
+            for owner_type, owner_id, image_path in owners:
+                if not os.path.exists(image_path):
+                    print(f"⚠️ Missing file for {owner_type} {owner_id}: {image_path}")
+                    stats['missing_file'] += 1
+                    continue
+
+                image_hash = file_content_hash(image_path)
+                if not force:
+                    cached = conn.execute('''
+                        SELECT image_hash FROM face_encoding
+                        WHERE owner_type = ? AND owner_id = ?
+                    ''', (owner_type, owner_id)).fetchone()
+                    if cached and cached['image_hash'] == image_hash:
+                        stats['unchanged'] += 1
+                        continue
+
+                encoding, message = compute_face_encoding(cv2.imread(image_path))
+                if encoding is None:
+                    print(f"❌ {owner_type} {owner_id} ({image_path}): {message}")
+                    stats['failed'] += 1
+                    continue
+
+                self.save_encoding(owner_type, owner_id, image_path, encoding, image_hash=image_hash, conn=conn)
+                conn.commit()
+                stats['encoded'] += 1
+                print(f"✅ Encoded {owner_type} {owner_id}: {image_path}")
+        finally:
+            conn.close()
+
+        return stats
+
+    def stats(self, table='face_encoding'):
+        """Count cached encodings (or templates, table='face_template') per owner type"""
+        if table not in ('face_encoding', 'face_template'):
+            raise ValueError(f"Unknown table: {table}")
+        conn = self._connect()
+        try:
+            self.ensure_table(conn)
+            rows = conn.execute(f'''
+                SELECT owner_type, COUNT(*) AS total FROM {table} GROUP BY owner_type
+            ''').fetchall()
+            return {row['owner_type']: row['total'] for row in rows}
+        finally:
+            conn.close()
+
+
+# Global encoding store instance
+encoding_store = FaceEncodingStore()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else "backfill"
+
+    if command == "backfill":
+        if not FACE_RECOGNITION_AVAILABLE:
+            print("❌ face_recognition is not installed. Run: pip install face-recognition")
+            sys.exit(1)
+        print("🔄 Backfilling face encodings...")
+        result = encoding_store.backfill(force="--force" in sys.argv)
+        print(f"\n🎉 Done: {result['encoded']} encoded, {result['unchanged']} unchanged, "
+              f"{result['missing_file']} missing file(s), {result['failed']} failed")
+    elif command == "stats":
+        counts = encoding_store.stats()
+        print(f"📊 Cached encodings: {counts or 'none'}")
+        print(f"📊 Reference templates: {encoding_store.stats('face_template') or 'none'}")
+    else:
+        print("Usage: python face_encoding_store.py [backfill [--force] | stats]")
@@ -0,0 +1,717 @@
+"""
+In-memory face gallery for vectorized recognition matching
+Keeps every known encoding (all reference templates of every person) in one
+contiguous float32 N x 128 matrix with a parallel owner-id array, so a probe
+is matched with a single matrix operation and reduced per identity
+
+The matrix can also be held as float16 (half the memory) or per-dimension
+int8 codes (a quarter). The scan then runs on the compact codes and, when an
+exact source is configured, the closest candidates are re-ranked with their
+full-precision encodings so the reported distance is exact
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import cv2
+    FAST_FP16 = hasattr(cv2, 'convertFp16')  # several times faster than numpy's float16 cast
+except ImportError:
+    FAST_FP16 = False
+
+ENCODING_DIM = 128
+MAX_TEMPLATES_PER_IDENTITY = 64   # also the stride of per-template keys in the ANN index
+REDUCTIONS = ('min', 'mean_k')
+PRECISIONS = ('float32', 'float16', 'int8')
+SCAN_CHUNK_ROWS = 16384           # compact rows widened to float32 per block during a scan
+
+
+def aggregate_distances(owner_ids, dists, reduction='min', k=2):
+    """
+    Reduce per-template distances to one score per identity
+    'min' keeps the closest template; 'mean_k' averages the k closest
+    templates (all of them when a person has fewer than k)
+    Returns: (unique owner ids, scores)
+    """
+    owner_ids = np.asarray(owner_ids)
+    dists = np.asarray(dists)
+    if len(owner_ids) == 0:
+        return owner_ids, dists
+
+    order = np.lexsort((dists, owner_ids))
+    owners, d = owner_ids[order], dists[order]
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    if reduction == 'min':
+        return owners[starts], d[starts]
+
+    group = np.cumsum(np.r_[True, owners[1:] != owners[:-1]]) - 1
+    rank = np.arange(len(d)) - starts[group]
+    keep = rank < max(int(k), 1)
+    sums = np.bincount(group[keep], weights=d[keep], minlength=len(starts))
+    counts = np.bincount(group[keep], minlength=len(starts))
+    return owners[starts], (sums / counts).astype(dists.dtype)
+
+
+class EncodingQuantizer:
+    """
+    Maps float encodings to the gallery's row representation and back
+    float32 and float16 are plain casts; int8 stores each dimension as an
+    unsigned byte over that dimension's range in the gallery (fit())
+    """
+
+    DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.uint8}
+    RANGE_MARGIN = 0.1  # headroom past the fitted range for encodings added later (clipped beyond)
+
+    def __init__(self, precision='float32', dim=ENCODING_DIM, offset=None, scale=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown gallery precision: {precision}")
+        self.precision = precision
+        self.dtype = self.DTYPES[precision]
+        self.offset = np.zeros(dim, dtype=np.float32) if offset is None else offset
+        self.scale = np.full(dim, 1.0 / 255, dtype=np.float32) if scale is None else scale
+
+    @property
+    def exact(self):
+        return self.precision == 'float32'
+
+    def fitted(self, vectors):
+        """A quantizer whose int8 range covers these vectors (a new object: existing codes stay valid)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.precision != 'int8' or len(vectors) == 0:
+            return self
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        margin = (high - low) * self.RANGE_MARGIN + 1e-6
+        low, high = low - margin, high + margin
+        return EncodingQuantizer('int8', len(low), low.astype(np.float32),
+                                 ((high - low) / 255.0).astype(np.float32))
+
+    def encode(self, vectors):
+        if self.precision != 'int8':
+            return np.asarray(vectors).astype(self.dtype, copy=False)
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def widen(self, codes):
+        """Codes as float32 values (int8: the raw byte values, before scale/offset)"""
+        if self.precision == 'float16' and FAST_FP16 and codes.ndim == 2 and len(codes):
+            return cv2.convertFp16(np.ascontiguousarray(codes).view(np.int16))
+        return np.asarray(codes).astype(np.float32, copy=False)
+
+    def decode(self, codes):
+        if self.precision != 'int8':
+            return self.widen(codes)
+        return codes.astype(np.float32) * self.scale + self.offset
+
+
+class FaceGallery:
+    """
+    Contiguous template matrix with incremental insert/replace/remove
+    One identity may own several rows (templates); matching reduces the
+    per-row distances per identity with reduction='min' or 'mean_k'
+    With precision 'float16'/'int8' the rows are compact codes; exact_source
+    (owner ids -> {owner id: full-precision templates}) lets match() re-rank
+    the `rerank` closest rows exactly
+    """
+
+    def __init__(self, dim=ENCODING_DIM, initial_capacity=64, reduction='min', k=2,
+                 precision='float32', rerank=16, exact_source=None):
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown template reduction: {reduction}")
+        self.dim = dim
+        self.reduction = reduction
+        self.k = k
+        self.quantizer = EncodingQuantizer(precision, dim)
+        self.rerank = rerank
+        self.exact_source = exact_source
+        self._matrix = np.zeros((initial_capacity, dim), dtype=self.quantizer.dtype)
+        self._sq_norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._size = 0
+        self._rows_of = {}  # owner id -> list of row indexes (one per template)
+        self._info = {}     # owner id -> display info (names etc.)
+        self._lock = threading.RLock()
+        self.version = 0    # bumped on every change (lets callers cache derived views)
+
+    def __len__(self):
+        return len(self._rows_of)
+
+    def __contains__(self, owner_id):
+        return int(owner_id) in self._rows_of
+
+    @property
+    def template_count(self):
+        """Number of rows (templates) across all identities"""
+        return self._size
+
+    @property
+    def precision(self):
+        return self.quantizer.precision
+
+    @property
+    def matrix(self):
+        """Populated rows as float32 (a view for float32 galleries: do not mutate)"""
+        return self.quantizer.decode(self._matrix[:self._size])
+
+    @property
+    def nbytes(self):
+        """Memory held by the populated template rows"""
+        return self._matrix[:self._size].nbytes
+
+    @property
+    def row_ids(self):
+        """View of the owner ids parallel to matrix rows (do not mutate)"""
+        return self._ids[:self._size]
+
+    @property
+    def ids(self):
+        """Owner ids of every identity in the gallery"""
+        return np.fromiter(self._rows_of.keys(), dtype=np.int64, count=len(self._rows_of))
+
+    def info(self, owner_id):
+        """Display info stored alongside an identity"""
+        return self._info.get(int(owner_id))
+
+    def templates(self, owner_id):
+        """Copy of one identity's template rows"""
+        with self._lock:
+            rows = self._rows_of.get(int(owner_id), [])
+            return self.quantizer.decode(self._matrix[rows]).copy()
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        matrix = np.zeros((new_capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.zeros(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        ids = np.zeros(new_capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._sq_norms, self._ids = matrix, sq_norms, ids
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._rows_of.clear()
+            self._info.clear()
+            self.version += 1
+
+    def load(self, entries):
+        """
+        Full rebuild from an iterable of (owner_id, encodings, info) tuples
+        encodings is one 128-d vector or a (templates x 128) array
+        """
+        entries = list(entries)
+        with self._lock:
+            self.clear()
+            if not self.quantizer.exact and entries:
+                self.quantizer = self.quantizer.fitted(np.concatenate([self._as_templates(e[1]) for e in entries]))
+            self._grow(sum(len(self._as_templates(e[1])) for e in entries))
+            for owner_id, encodings, info in entries:
+                self._put(int(owner_id), encodings, info)
+            self.version += 1
+
+    def upsert(self, owner_id, encodings, info=None):
+        """Insert a new identity or replace all templates of an existing one"""
+        with self._lock:
+            self._put(int(owner_id), encodings, info)
+            self.version += 1
+
+    def _as_templates(self, encodings):
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        return vectors[:MAX_TEMPLATES_PER_IDENTITY]
+
+    def _put(self, owner_id, encodings, info):
+        vectors = self._as_templates(encodings)
+        self._drop_rows(owner_id)
+        self._grow(self._size + len(vectors))
+        start = self._size
+        end = start + len(vectors)
+        codes = self.quantizer.encode(vectors)
+        self._matrix[start:end] = codes
+        # Norms of what is stored, so scan distances are consistent with the codes
+        stored = self.quantizer.decode(codes)
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', stored, stored)
+        self._ids[start:end] = owner_id
+        self._size = end
+        self._rows_of[owner_id] = list(range(start, end))
+        if info is not None:
+            self._info[owner_id] = info
+
+    def _drop_rows(self, owner_id):
+        """Remove an identity's rows by moving the last rows into their slots"""
+        rows = self._rows_of.pop(owner_id, None)
+        if rows is None:
+            return False
+        # Descending order: a row about to be filled is never one still to be removed
+        for row in sorted(rows, reverse=True):
+            last = self._size - 1
+            if row != last:
+                moved_id = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._ids[row] = moved_id
+                moved_rows = self._rows_of[moved_id]
+                moved_rows[moved_rows.index(last)] = row
+            self._size = last
+        return True
+
+    def remove(self, owner_id):
+        """Remove an identity and all of its templates"""
+        owner_id = int(owner_id)
+        with self._lock:
+            if not self._drop_rows(owner_id):
+                return False
+            self._info.pop(owner_id, None)
+            self.version += 1
+            return True
+
+    def subset(self, owner_ids):
+        """
+        Copy the rows of the given identities into a new, independent gallery
+        Unknown ids are ignored; display info is shared with this gallery
+        """
+        with self._lock:
+            owners = [i for i in (int(o) for o in owner_ids) if i in self._rows_of]
+            rows = [r for owner_id in owners for r in self._rows_of[owner_id]]
+            sub = FaceGallery(dim=self.dim, initial_capacity=max(len(rows), 1),
+                              reduction=self.reduction, k=self.k, precision=self.precision,
+                              rerank=self.rerank, exact_source=self.exact_source)
+            sub.quantizer = self.quantizer
+            if rows:
+                rows = np.asarray(rows, dtype=np.int64)
+                n = len(rows)
+                sub._matrix[:n] = self._matrix[rows]
+                sub._sq_norms[:n] = self._sq_norms[rows]
+                sub._ids[:n] = self._ids[rows]
+                sub._size = n
+                for r, owner_id in enumerate(sub._ids[:n].tolist()):
+                    sub._rows_of.setdefault(owner_id, []).append(r)
+                sub._info = {owner_id: self._info[owner_id] for owner_id in sub._rows_of if owner_id in self._info}
+            return sub
+
+    def _compact_dots(self, P):
+        """(M x N) probe-to-row dot products over compact rows, widened block by block"""
+        n = self._size
+        q = self.quantizer
+        scaled = P * q.scale if q.precision == 'int8' else P
+        dots = np.empty((len(P), n), dtype=np.float32)
+        for start in range(0, n, SCAN_CHUNK_ROWS):
+            end = min(start + SCAN_CHUNK_ROWS, n)
+            dots[:, start:end] = scaled @ q.widen(self._matrix[start:end]).T
+        if q.precision == 'int8':
+            dots += (P @ q.offset)[:, None]  # g = offset + scale * code
+        return dots
+
+    def distances(self, probe):
+        """
+        Euclidean distance from one probe to every gallery row (template)
+        Uses ||g||^2 + ||p||^2 - 2 g.p so the whole gallery is one matrix-vector product
+        (distances to the stored codes for float16/int8 galleries)
+        Returns: (row owner ids, distances) arrays - an owner id repeats once per template
+        """
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            p = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+            if self.quantizer.exact:
+                dots = self._matrix[:n] @ p
+            else:
+                dots = self._compact_dots(p[None, :])[0]
+            sq = self._sq_norms[:n] + np.dot(p, p) - 2.0 * dots
+            np.maximum(sq, 0.0, out=sq)
+            return self._ids[:n].copy(), np.sqrt(sq)
+
+    def _best(self, row_ids, dists):
+        """Best identity from per-row distances under the configured reduction"""
+        if len(row_ids) == 0:
+            return None, float('inf')
+        if self.reduction == 'min' or self.k <= 1 or len(self._rows_of) == self._size:
+            # Min over templates is simply the closest row
+            best = int(np.argmin(dists))
+            return int(row_ids[best]), float(dists[best])
+        owners, scores = aggregate_distances(row_ids, dists, self.reduction, self.k)
+        best = int(np.argmin(scores))
+        return int(owners[best]), float(scores[best])
+
+    def _exact_best(self, probe, row_ids, dists):
+        """
+        Best identity after re-ranking: the owners of the `rerank` closest rows
+        are scored again on their full-precision templates from exact_source
+        (owners missing there keep their scan distances)
+        """
+        if self.quantizer.exact or self.exact_source is None or self.rerank <= 0 or len(row_ids) == 0:
+            return self._best(row_ids, dists)
+        count = min(self.rerank, len(dists))
+        nearest = np.argpartition(dists, count - 1)[:count]
+        owners = sorted({int(o) for o in row_ids[nearest]})
+        exact = self.exact_source(owners)
+
+        p = np.asarray(probe, dtype=np.float32).reshape(self.dim)
+        candidate_ids, candidate_dists = [], []
+        for owner_id in owners:
+            templates = exact.get(owner_id)
+            if templates is None or len(templates) == 0:
+                mask = row_ids == owner_id
+                candidate_ids.append(row_ids[mask])
+                candidate_dists.append(dists[mask])
+                continue
+            vectors = np.asarray(templates, dtype=np.float32).reshape(-1, self.dim)[:MAX_TEMPLATES_PER_IDENTITY]
+            candidate_ids.append(np.full(len(vectors), owner_id, dtype=np.int64))
+            candidate_dists.append(np.linalg.norm(vectors - p, axis=1))
+        return self._best(np.concatenate(candidate_ids), np.concatenate(candidate_dists))
+
+    def match(self, probe):
+        """
+        Find the nearest identity to a probe encoding
+        Returns: (owner_id, distance) - owner_id is None for an empty gallery
+        """
+        ids, dists = self.distances(probe)
+        return self._exact_best(probe, ids, dists)
+
+    def match_many(self, probes):
+        """
+        Nearest identity for each of several probes (every face in a frame)
+        All probe-to-template distances come from one (M x N) matrix product
+        Returns: list of (owner_id, distance) in probe order
+        """
+        P = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return [(None, float('inf'))] * len(P)
+            dots = P @ self._matrix[:n].T if self.quantizer.exact else self._compact_dots(P)
+            sq = (self._sq_norms[:n][None, :] + np.einsum('ij,ij->i', P, P)[:, None]
+                  - 2.0 * dots)
+            ids = self._ids[:n].copy()
+        dists = np.sqrt(np.maximum(sq, 0.0))
+        return [self._exact_best(p, ids, row) for p, row in zip(P, dists)]
+
+
+class ClassGalleryCache:
+    """
+    Per-class sub-galleries built from a parent gallery and a class roster
+    Rosters are cached until invalidate() is called for the class (enroll/unenroll)
+    or roster_ttl expires (covers changes made by other processes); the
+    sub-gallery itself is re-sliced whenever the parent gallery changes
+    """
+
+    def __init__(self, gallery, roster_loader, max_classes=256, roster_ttl=60.0):
+        self.gallery = gallery
+        self.roster_loader = roster_loader  # class_id -> iterable of student ids
+        self.max_classes = max_classes
+        self.roster_ttl = roster_ttl
+        self._rosters = OrderedDict()       # class_id -> (loaded_at, frozenset of student ids)
+        self._views = {}                    # class_id -> (parent version, FaceGallery)
+        self._lock = threading.Lock()
+
+    def invalidate(self, class_id=None):
+        """Drop the cached roster of one class (or every class)"""
+        with self._lock:
+            if class_id is None:
+                self._rosters.clear()
+                self._views.clear()
+            else:
+                self._rosters.pop(int(class_id), None)
+                self._views.pop(int(class_id), None)
+
+    def get(self, class_id):
+        """Sub-gallery of the students enrolled in a class"""
+        class_id = int(class_id)
+        with self._lock:
+            cached_roster = self._rosters.get(class_id)
+            if cached_roster is None or time.time() - cached_roster[0] >= self.roster_ttl:
+                roster = frozenset(int(i) for i in self.roster_loader(class_id))
+                if cached_roster is None or cached_roster[1] != roster:
+                    self._views.pop(class_id, None)
+                self._rosters[class_id] = (time.time(), roster)
+                self._rosters.move_to_end(class_id)
+                while len(self._rosters) > self.max_classes:
+                    evicted, _ = self._rosters.popitem(last=False)
+                    self._views.pop(evicted, None)
+            else:
+                roster = cached_roster[1]
+                self._rosters.move_to_end(class_id)
+
+            version = self.gallery.version
+            cached = self._views.get(class_id)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            view = self.gallery.subset(roster)
+            self._views[class_id] = (version, view)
+            return view
+
+
+class StudentGallery(FaceGallery):
+    """
+    Process-wide gallery of active students backed by the encoding store
+    Loaded lazily on first use, then kept current with incremental updates:
+    registration/edits call refresh_user(), and sync() periodically picks up
+    changes made by other processes without rebuilding the matrix
+    """
+
+    ANN_CANDIDATES = 32  # templates fetched from the IVF index before per-identity reduction
+    EXACT_CACHE_SIZE = 1024  # students whose full-precision templates are kept for re-ranking
+
+    def __init__(self, store, sync_interval=30.0, ann_min_size=None, ann_path=None, ann_nprobe=8,
+                 reduction='min', k=2, precision='float32', rerank=16):
+        super().__init__(reduction=reduction, k=k, precision=precision, rerank=rerank,
+                         exact_source=None if precision == 'float32' else self._exact_templates)
+        self.store = store
+        self._exact_cache = OrderedDict()  # student id -> float64 templates, most recently used last
+        self._exact_lock = threading.Lock()
+        self.sync_interval = sync_interval
+        self._loaded = False
+        self._last_sync = 0.0
+        self._sync_cursor = None
+        self._sync_seen = {}  # owner id -> digest of the entry the last sync applied
+
+        # Optional IVF index for campus-wide matching once the gallery is large
+        self.ann_min_size = ann_min_size
+        self.ann_path = ann_path
+        self.ann_nprobe = ann_nprobe
+        self.ann_index = None
+        self._ann_dirty = False
+
+    @staticmethod
+    def _entry(student):
+        return (
+            student['student_id'],
+            student.get('encodings', student['encoding']),
+            {
+                'student_id': student['student_id'],
+                'user_id': student['user_id'],
+                'firstname': student['firstname'],
+                'lastname': student['lastname']
+            }
+        )
+
+    # Store queries behind the gallery (FacultyGallery reads the faculty rows instead)
+    def _load_entries(self, user_ids=None, changed_since=None):
+        return self.store.load_student_gallery(user_ids=user_ids, changed_since=changed_since)
+
+    def _load_exact(self, owner_ids):
+        return self.store.load_student_templates(owner_ids)
+
+    def _registered_ids(self):
+        return self.store.registered_student_ids()
+
+    def ensure_loaded(self):
+        """Load on first use; afterwards run an incremental sync when one is due"""
+        with self._lock:
+            if not self._loaded:
+                self._sync_cursor = self.store.latest_update()
+                self.load(self._entry(s) for s in self._load_entries())
+                self._loaded = True
+                self._last_sync = time.time()
+                self._maybe_build_ann()
+            elif time.time() - self._last_sync >= self.sync_interval:
+                self.sync()
+        return self
+
+    @staticmethod
+    def _template_keys(owner_id, count):
+        """IVF index keys of one identity's templates (owner id = key // stride)"""
+        base = int(owner_id) * MAX_TEMPLATES_PER_IDENTITY
+        return np.arange(base, base + count, dtype=np.int64)
+
+    def _ann_rows(self):
+        """(template keys, vectors) of every row, as stored in the IVF index"""
+        keys = np.zeros(self._size, dtype=np.int64)
+        for owner_id, rows in self._rows_of.items():
+            keys[rows] = self._template_keys(owner_id, len(rows))
+        return keys, self.matrix
+
+    def _exact_templates(self, owner_ids):
+        """Full-precision templates of some students (re-ranking), read through a small LRU cache"""
+        with self._exact_lock:
+            found = {}
+            for owner_id in owner_ids:
+                if owner_id in self._exact_cache:
+                    self._exact_cache.move_to_end(owner_id)
+                    found[owner_id] = self._exact_cache[owner_id]
+            missing = [o for o in owner_ids if o not in found]
+        if missing:
+            loaded = self._load_exact(missing)
+            with self._exact_lock:
+                for owner_id, templates in loaded.items():
+                    self._exact_cache[int(owner_id)] = templates
+                    found[int(owner_id)] = templates
+                while len(self._exact_cache) > self.EXACT_CACHE_SIZE:
+                    self._exact_cache.popitem(last=False)
+        return found
+
+    def _forget_exact(self, owner_id):
+        with self._exact_lock:
+            self._exact_cache.pop(int(owner_id), None)
+
+    def _ann_discard(self, owner_id, count):
+        for key in self._template_keys(owner_id, count):
+            self.ann_index.remove(key)
+
+    def upsert(self, owner_id, encodings, info=None):
+        with self._lock:
+            previous = len(self._rows_of.get(int(owner_id), ()))
+            super().upsert(owner_id, encodings, info)
+            self._forget_exact(owner_id)
+            if self.ann_index is not None:
+                self._ann_discard(owner_id, previous)
+                rows = self._rows_of[int(owner_id)]
+                self.ann_index.add(self._template_keys(owner_id, len(rows)), self.quantizer.decode(self._matrix[rows]))
+                self._ann_dirty = True
+
+    def remove(self, owner_id):
+        with self._lock:
+            previous = len(self._rows_of.get(int(owner_id), ()))
+            removed = super().remove(owner_id)
+            self._forget_exact(owner_id)
+            if removed and self.ann_index is not None:
+                self._ann_discard(owner_id, previous)
+                self._ann_dirty = True
+            return removed
+
+    def _maybe_build_ann(self):
+        """Build (or load and reconcile) the IVF index once the gallery is large enough"""
+        if self.ann_index is not None or not self.ann_min_size or len(self) < self.ann_min_size:
+            return
+        from ann_index import IVFIndex
+
+        index = None
+        if self.ann_path and os.path.exists(self.ann_path):
+            try:
+                index = IVFIndex.load(self.ann_path)
+                index.nprobe = self.ann_nprobe
+                changed = index.reconcile(*self._ann_rows())
+                print(f"Loaded ANN index ({index.n_lists} lists, {changed} vector(s) refreshed)")
+            except Exception as e:
+                print(f"Warning: Could not load ANN index {self.ann_path}: {e}")
+                index = None
+
+        if index is None:
+            index = IVFIndex(dim=self.dim, nprobe=self.ann_nprobe)
+            index.train(self.matrix)
+            index.add(*self._ann_rows())
+            print(f"Built ANN index ({index.n_lists} lists over {len(index)} templates)")
+
+        self.ann_index = index
+        self._ann_dirty = True
+        self.save_ann()
+
+    def save_ann(self):
+        """Persist the IVF index if it changed since the last save"""
+        if self.ann_index is None or not self._ann_dirty or not self.ann_path:
+            return
+        try:
+            self.ann_index.save(self.ann_path)
+            self._ann_dirty = False
+        except Exception as e:
+            print(f"Warning: Could not save ANN index {self.ann_path}: {e}")
+
+    def match(self, probe, nprobe=None, exact=False):
+        """
+        Nearest student to a probe; uses the IVF index when one is built
+        nprobe overrides the recall/latency knob, exact=True forces a full scan
+        """
+        if self.ann_index is None or exact:
+            return super().match(probe)
+        k = 1 if self.reduction == 'min' and self.quantizer.exact else self.ANN_CANDIDATES
+        keys, dists = self.ann_index.search(probe, k=k, nprobe=nprobe)
+        if len(keys) == 0:
+            return super().match(probe)
+        return self._exact_best(probe, keys // MAX_TEMPLATES_PER_IDENTITY, dists)
+
+    def match_many(self, probes, nprobe=None, exact=False):
+        """Batched match(); with an IVF index each probe scans only its own partitions"""
+        if self.ann_index is None or exact:
+            return super().match_many(probes)
+        return [self.match(p, nprobe=nprobe) for p in np.asarray(probes).reshape(-1, self.dim)]
+
+    @staticmethod
+    def _entry_digest(entry):
+        owner_id, encodings, info = entry
+        digest = hashlib.sha1(np.ascontiguousarray(encodings, dtype=np.float64).tobytes())
+        digest.update(repr(sorted(info.items())).encode())
+        return digest.hexdigest()
+
+    def sync(self):
+        """
+        Apply encodings changed since the last sync and drop students no longer registered/active
+        The cursor is a second-resolution timestamp, so rows written later in the
+        cursor's own second are only found by reading that second again (>=);
+        entries the previous sync already applied unchanged are skipped
+        """
+        with self._lock:
+            cursor = self.store.latest_update()
+            if cursor is not None:
+                seen = {}
+                for student in self._load_entries(changed_since=self._sync_cursor):
+                    entry = self._entry(student)
+                    digest = seen[int(entry[0])] = self._entry_digest(entry)
+                    if self._sync_seen.get(int(entry[0])) != digest:
+                        self.upsert(*entry)
+                self._sync_cursor = cursor
+                self._sync_seen = seen
+
+            registered = self._registered_ids()
+            for owner_id in [int(i) for i in self.ids if int(i) not in registered]:
+                self.remove(owner_id)
+
+            self._maybe_build_ann()
+            self.save_ann()
+            self._last_sync = time.time()
+
+    def refresh_user(self, user_id):
+        """Re-read one user's cached encoding (registration, edit, activation, deactivation)"""
+        if not self._loaded:
+            return  # the first ensure_loaded() will pick the change up
+        with self._lock:
+            entries = self._load_entries(user_ids=[user_id])
+            if entries:
+                for student in entries:
+                    self.upsert(*self._entry(student))
+            else:
+                for owner_id, info in list(self._info.items()):
+                    if info.get('user_id') == int(user_id):
+                        self.remove(owner_id)
+
+
+class FacultyGallery(StudentGallery):
+    """
+    Process-wide gallery of active faculty with a registered face (event
+    check-in), keyed by faculty_id; same lazy load, refresh_user() and sync()
+    as the student gallery. Small enough that it never builds an IVF index
+    """
+
+    def __init__(self, store, sync_interval=30.0, reduction='min', k=2, precision='float32', rerank=16):
+        super().__init__(store, sync_interval=sync_interval, reduction=reduction, k=k, precision=precision,
+                         rerank=rerank)
+
+    @staticmethod
+    def _entry(faculty):
+        return (
+            faculty['faculty_id'],
+            faculty.get('encodings', faculty['encoding']),
+            {
+                'faculty_id': faculty['faculty_id'],
+                'user_id': faculty['user_id'],
+                'firstname': faculty['firstname'],
+                'lastname': faculty['lastname']
+            }
+        )
+
+    def _load_entries(self, user_ids=None, changed_since=None):
+        return self.store.load_faculty_gallery(user_ids=user_ids, changed_since=changed_since)
+
+    def _load_exact(self, owner_ids):
+        return self.store.load_faculty_templates(owner_ids)
+
+    def _registered_ids(self):
+        return self.store.registered_faculty_ids()
@@ -0,0 +1,203 @@
+"""
+Server-side face tracking per kiosk
+The desktop loop (face_recog_test.py) only re-identifies every RECOGNIZE_EVERY
+frames and follows the face with a tracker in between. The web path gets the
+same treatment: each kiosk has a TrackingSession holding its last face boxes
+and identities. A new frame first looks for each tracked face in a window
+around its previous box (HOG on a small, downscaled crop instead of the
+whole frame); if every track is found, identities are carried over and the
+encoding and gallery search are skipped. The full pipeline runs when a track
+is new, lost, unrecognized, or due for re-verification every `reverify_every`
+frames. Landmarks, liveness and anti-spoofing still run on every frame
+
+Sessions are plain data (snapshot()/restore()), so a worker process can run
+one kiosk's frame and hand the updated tracks back to the web process; the
+tracks are only adopted when the session did not change since the snapshot
+(compare-and-set on version), so of two frames of one kiosk in flight at
+once the slower one cannot roll the tracks back
+"""
+
+import time
+import threading
+
+from face_detection import scale_location, box_iou, expand_box
+
+
+class TrackingSession:
+    """Tracked faces of one kiosk (not thread-safe: hold .lock while recognizing)"""
+
+    def __init__(self, reverify_every=5, roi_margin=0.6, min_iou=0.2, tolerance=0.62):
+        self.reverify_every = reverify_every  # frames between full re-identifications
+        self.roi_margin = roi_margin          # search window around the previous box
+        self.min_iou = min_iou                # overlap needed to keep a track id
+        self.tolerance = tolerance            # tracks farther than this are unrecognized
+        self.lock = threading.Lock()
+        self.frame_index = 0
+        self.context = None
+        self.tracks = []      # dicts: track_id, location, student_id, distance, verified_at
+        self.next_track_id = 1
+        self.tracked_frames = 0
+        self.full_frames = 0
+        self.version = 0      # bumped on every change (compare-and-set for worker results)
+        self.updated_at = time.time()
+
+    def snapshot(self):
+        return {
+            'params': {
+                'reverify_every': self.reverify_every,
+                'roi_margin': self.roi_margin,
+                'min_iou': self.min_iou,
+                'tolerance': self.tolerance
+            },
+            'frame_index': self.frame_index,
+            'context': list(self.context) if self.context is not None else None,
+            'tracks': [dict(track) for track in self.tracks],
+            'next_track_id': self.next_track_id,
+            'tracked_frames': self.tracked_frames,
+            'full_frames': self.full_frames,
+            'version': self.version
+        }
+
+    def restore(self, snapshot, expected_version=None):
+        """
+        Adopt the state a worker returned (ignored when missing); with
+        expected_version (the version of the snapshot the job was sent) only
+        if nothing changed this session since. Returns whether it was adopted
+        """
+        if not snapshot:
+            return False
+        if expected_version is not None and self.version != expected_version:
+            return False
+        self.frame_index = snapshot['frame_index']
+        self.context = tuple(snapshot['context']) if snapshot['context'] is not None else None
+        self.tracks = [dict(track, location=tuple(track['location'])) for track in snapshot['tracks']]
+        self.next_track_id = snapshot['next_track_id']
+        self.tracked_frames = snapshot['tracked_frames']
+        self.full_frames = snapshot['full_frames']
+        self.version += 1
+        self.updated_at = time.time()
+        return True
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        session = cls(**snapshot['params'])
+        session.restore(snapshot)
+        session.version = snapshot['version']
+        return session
+
+    def reset(self):
+        self.tracks = []
+        self.context = None
+        self.version += 1
+
+    def follow(self, rgb_image, detector, context):
+        """
+        Find every tracked face again near its previous box
+        Returns [(track, location)] when all tracks are found and none needs
+        re-identification, otherwise None (the caller runs the full pipeline)
+        """
+        self.frame_index += 1
+        if not self.tracks or context != self.context:
+            return None
+        for track in self.tracks:
+            if track['student_id'] is None or track['distance'] > self.tolerance:
+                return None
+            if self.frame_index - track['verified_at'] >= self.reverify_every:
+                return None
+
+        followed = []
+        for track in self.tracks:
+            top, right, bottom, left = expand_box(track['location'], self.roi_margin, rgb_image.shape)
+            crop = rgb_image[top:bottom, left:right]
+            if crop.size == 0:
+                return None
+            face_width = track['location'][1] - track['location'][3]
+            locations, _ = detector.for_face_width(face_width).detect(crop)
+            candidates = [scale_location((t + top, r + left, b + top, l + left), 1.0, rgb_image.shape)
+                          for t, r, b, l in locations]
+            best = max(candidates, key=lambda loc: box_iou(loc, track['location']), default=None)
+            if best is None or box_iou(best, track['location']) < self.min_iou:
+                return None  # lost
+            followed.append((track, best))
+        return followed
+
+    def update(self, locations, matches, context, verified):
+        """Record this frame's faces; verified frames re-identify and may re-number tracks"""
+        self.updated_at = time.time()
+        self.version += 1
+        self.context = context
+        if not verified:
+            self.tracked_frames += 1
+            for track, location in zip(self.tracks, locations):
+                track['location'] = tuple(location)
+            return [track['track_id'] for track in self.tracks]
+
+        self.full_frames += 1
+        tracks = []
+        unused = list(self.tracks)
+        for location, (student_id, distance) in zip(locations, matches):
+            previous = max(unused, key=lambda t: box_iou(t['location'], location), default=None)
+            if previous is not None and box_iou(previous['location'], location) >= self.min_iou:
+                unused.remove(previous)
+                track_id = previous['track_id']
+            else:
+                track_id = self.next_track_id
+                self.next_track_id += 1
+            tracks.append({
+                'track_id': track_id,
+                'location': tuple(int(v) for v in location),
+                'student_id': int(student_id) if student_id is not None else None,
+                'distance': float(distance) if student_id is not None else 999.0,
+                'verified_at': self.frame_index
+            })
+        self.tracks = tracks
+        return [track['track_id'] for track in tracks]
+
+
+class FaceTracker:
+    """Tracking sessions by kiosk id; idle sessions are dropped"""
+
+    def __init__(self, reverify_every=5, idle_timeout=60.0, tolerance=0.62):
+        self.reverify_every = reverify_every
+        self.idle_timeout = idle_timeout
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    @property
+    def enabled(self):
+        return self.reverify_every > 1
+
+    def session(self, kiosk_id):
+        """The kiosk's session (created on first use), or None when tracking is off"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            for stale in [k for k, s in self._sessions.items() if now - s.updated_at > self.idle_timeout]:
+                del self._sessions[stale]
+            session = self._sessions.get(kiosk_id)
+            if session is None:
+                session = TrackingSession(reverify_every=self.reverify_every, tolerance=self.tolerance)
+                self._sessions[kiosk_id] = session
+            return session
+
+    def reset_all(self):
+        """Forget every identity (the gallery changed)"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.reset()
+
+    def stats(self):
+        with self._lock:
+            tracked = sum(s.tracked_frames for s in self._sessions.values())
+            full = sum(s.full_frames for s in self._sessions.values())
+            return {
+                'enabled': self.enabled,
+                'reverify_every': self.reverify_every,
+                'sessions': len(self._sessions),
+                'tracks': sum(len(s.tracks) for s in self._sessions.values()),
+                'tracked_frames': tracked,
+                'full_frames': full,
+                'tracked_ratio': round(tracked / (tracked + full), 3) if tracked + full else None
+            }
@@ -0,0 +1,150 @@
+"""
+Near-duplicate frame cache
+A kiosk facing an empty hallway (or the same student) posts nearly identical
+frames every few seconds. Each frame gets a 64-bit perceptual hash computed
+from a small grayscale decode; when it is within max_distance bits of a frame
+the same kiosk sent less than ttl seconds ago, the earlier recognition
+result is returned instead of running HOG and encoding again (the app runs
+the anti-spoofing checks on the new frame again, see
+recognition_service.recheck_anti_spoofing)
+"""
+
+import time
+import threading
+
+import numpy as np
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+HASH_METHODS = ('phash', 'ahash')
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def perceptual_hash(gray, method='phash'):
+    """
+    64-bit hash of a grayscale image
+    phash: sign of the 8x8 lowest DCT frequencies of a 32x32 thumbnail against
+    their median; ahash: 8x8 thumbnail against its mean
+    """
+    if method == 'ahash':
+        small = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+        return _bits_to_int(small > small.mean())
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    return _bits_to_int(low > np.median(low))
+
+
+def frame_hash(image_bytes, method='phash'):
+    """Hash encoded JPEG/PNG bytes, decoding at 1/4 size in gray (cheap); None if undecodable"""
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    return perceptual_hash(gray, method)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class FrameResultCache:
+    """
+    Per-kiosk cache of recent (frame hash, context) -> recognition result
+    context is whatever else the result depends on (class scope, multi-face)
+    """
+
+    def __init__(self, ttl=10.0, max_distance=6, method='phash', per_kiosk=4, max_kiosks=256):
+        if method not in HASH_METHODS:
+            raise ValueError(f"Unknown hash method: {method}")
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.method = method
+        self.per_kiosk = per_kiosk
+        self.max_kiosks = max_kiosks
+        self._lock = threading.Lock()
+        self._entries = {}      # kiosk id -> [(stored_at, hash, context, result)], newest last
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @property
+    def enabled(self):
+        return OPENCV_AVAILABLE and self.ttl > 0
+
+    def lookup(self, kiosk_id, image_bytes, context=None):
+        """
+        Returns (cached result or None, frame hash); pass the hash on to store()
+        A hit is a copy of the earlier result marked 'cached' with its bit distance
+        """
+        if not self.enabled:
+            return None, None
+        value = frame_hash(image_bytes, self.method)
+        if value is None:
+            return None, None
+
+        now = time.time()
+        with self._lock:
+            entries = [e for e in self._entries.get(kiosk_id, []) if now - e[0] <= self.ttl]
+            best = None
+            for stored_at, stored_hash, stored_context, result in entries:
+                if stored_context != context:
+                    continue
+                distance = hamming(value, stored_hash)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, result)
+            if entries:
+                self._entries[kiosk_id] = entries
+            else:
+                self._entries.pop(kiosk_id, None)
+
+            if best is None:
+                self.misses += 1
+                return None, value
+            self.hits += 1
+
+        hit = dict(best[1])
+        hit['cached'] = True
+        hit['cache_distance'] = best[0]
+        return hit, value
+
+    def store(self, kiosk_id, value, result, context=None):
+        """Remember a fresh result for this kiosk (value is the hash from lookup())"""
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            entries = self._entries.pop(kiosk_id, [])  # re-inserted last: most recently used kiosk
+            entries.append((time.time(), value, context, result))
+            self._entries[kiosk_id] = entries[-self.per_kiosk:]
+            while len(self._entries) > self.max_kiosks:
+                del self._entries[next(iter(self._entries))]
+            self.stores += 1
+
+    def clear(self):
+        """Forget every cached result (the gallery changed, so old answers may be wrong)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'ttl': self.ttl,
+                'max_distance': self.max_distance,
+                'method': self.method,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'stores': self.stores,
+                'kiosks': len(self._entries),
+                'entries': sum(len(e) for e in self._entries.values())
+            }
@@ -0,0 +1,215 @@
+"""
+Gallery consistency checker
+Keeps the registered photos, the cached encodings and a persistent
+face_registered flag in step, so the dashboards read one column instead of
+checking the filesystem (and patching the database) on every page view
+
+A pass walks every student and faculty photo path:
+  - file gone             -> attendance_image cleared, cached encoding dropped
+  - no path, but known_faces/<idno>.jpg exists (photos saved by older tools)
+                          -> adopted as the student's photo
+  - mtime unchanged since the last verified pass -> nothing to do
+  - mtime changed         -> content hash compared; only a changed or new
+                             photo is re-encoded (a changed photo's template
+                             is replaced with it)
+and face_registered is set from the result. The app runs a pass every
+GALLERY_CHECK_INTERVAL seconds on a background thread
+
+Usage:
+    python gallery_maintenance.py           # one pass, print what changed
+    python gallery_maintenance.py --force   # re-hash every photo
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+from face_encoding_store import FaceEncodingStore, compute_face_encoding, file_content_hash
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+OWNER_TABLES = {'student': 'student_id', 'faculty': 'faculty_id'}
+
+
+def ensure_registration_schema(conn):
+    """
+    Add the face_registered flag to student/faculty (and faculty.attendance_image)
+    when missing; a new flag starts as 'has a photo path' until the first pass
+    """
+    altered = False
+    for table in OWNER_TABLES:
+        columns = [r[1] for r in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+        if not columns:
+            continue
+        if 'attendance_image' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN attendance_image VARCHAR(255)')
+            altered = True
+        if 'face_registered' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN face_registered BOOLEAN DEFAULT 0')
+            conn.execute(f'UPDATE {table} SET face_registered = (attendance_image IS NOT NULL)')
+            altered = True
+    if altered:
+        conn.commit()
+
+
+class GalleryMaintainer:
+    """Incremental photo/encoding consistency passes, on demand or on a background thread"""
+
+    def __init__(self, db_path='facecheck.db', store=None, faces_dir='known_faces', on_change=None):
+        self.db_path = db_path
+        self.store = store or FaceEncodingStore(db_path)
+        self.faces_dir = faces_dir
+        self.on_change = on_change      # called with the user ids whose registration changed
+        self._unencodable = {}          # path -> mtime of photos that failed to encode
+        self._lock = threading.Lock()   # one pass at a time
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run = None
+        self.last_stats = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _owners(self, conn, owner_type):
+        id_column = OWNER_TABLES[owner_type]
+        return conn.execute(f'''
+            SELECT o.{id_column} AS owner_id, o.user_id, u.idno, o.attendance_image, o.face_registered,
+                   fe.image_path AS cached_path, fe.image_hash, fe.image_mtime
+            FROM {owner_type} o
+            JOIN user u ON o.user_id = u.user_id
+            LEFT JOIN face_encoding fe ON fe.owner_type = ? AND fe.owner_id = o.{id_column}
+        ''', (owner_type,)).fetchall()
+
+    def _check_photo(self, conn, owner_type, row, path, stats, force):
+        """Verify an existing photo against its cached encoding, re-encoding it only when it changed"""
+        mtime = os.path.getmtime(path)
+        cached = row['cached_path'] == path and row['image_hash'] is not None
+        if cached and row['image_mtime'] == mtime and not force:
+            stats['unchanged'] += 1
+            return
+
+        image_hash = file_content_hash(path)
+        if cached and row['image_hash'] == image_hash:
+            self.store.mark_verified(owner_type, row['owner_id'], mtime, conn=conn)
+            stats['verified'] += 1
+            return
+
+        if self._unencodable.get(path) == mtime:
+            stats['failed'] += 1  # unchanged since it last failed; not retried every pass
+            return
+        encoding, message = compute_face_encoding(cv2.imread(path) if CV2_AVAILABLE else None)
+        if encoding is None:
+            print(f"⚠️ {owner_type} {row['owner_id']} ({path}): {message}")
+            self._unencodable[path] = mtime
+            stats['failed'] += 1
+            return
+        self._unencodable.pop(path, None)
+        self.store.save_encoding(owner_type, row['owner_id'], path, encoding, image_hash=image_hash,
+                                 conn=conn, image_mtime=mtime)
+        if cached:
+            # The photo changed in place: its template goes too, or the old face would still match
+            self.store.replace_template(owner_type, row['owner_id'], row['image_hash'], path, encoding,
+                                        image_hash, conn=conn)
+        stats['encoded'] += 1
+
+    def check(self, force=False):
+        """
+        One consistency pass over every student/faculty photo
+        Returns: dict of counters plus 'changed_users' (registration or encoding changed)
+        """
+        with self._lock:
+            started = time.time()
+            stats = {'checked': 0, 'unchanged': 0, 'verified': 0, 'encoded': 0, 'adopted': 0,
+                     'missing': 0, 'failed': 0}
+            changed_users = set()
+            conn = self._connect()
+            try:
+                self.store.ensure_table(conn)
+                ensure_registration_schema(conn)
+                for owner_type in OWNER_TABLES:
+                    for row in self._owners(conn, owner_type):
+                        stats['checked'] += 1
+                        path = row['attendance_image']
+                        if not path and owner_type == 'student':
+                            legacy = os.path.join(self.faces_dir, f"{row['idno']}.jpg")
+                            if os.path.exists(legacy):
+                                path = legacy
+                                conn.execute('UPDATE student SET attendance_image = ? WHERE student_id = ?',
+                                             (path, row['owner_id']))
+                                stats['adopted'] += 1
+                                changed_users.add(row['user_id'])
+                        if path and not os.path.exists(path):
+                            print(f"⚠️ Missing photo for {owner_type} {row['owner_id']}: {path}")
+                            conn.execute(f'UPDATE {owner_type} SET attendance_image = NULL '
+                                         f'WHERE {OWNER_TABLES[owner_type]} = ?', (row['owner_id'],))
+                            stats['missing'] += 1
+                            path = None
+
+                        registered = bool(path)
+                        if registered:
+                            encoded = stats['encoded']
+                            self._check_photo(conn, owner_type, row, path, stats, force)
+                            if stats['encoded'] != encoded:
+                                changed_users.add(row['user_id'])
+                        elif row['cached_path'] is not None:
+                            self.store.delete_encoding(owner_type, row['owner_id'], conn=conn)
+                            changed_users.add(row['user_id'])
+
+                        if bool(row['face_registered']) != registered:
+                            conn.execute(f'UPDATE {owner_type} SET face_registered = ? '
+                                         f'WHERE {OWNER_TABLES[owner_type]} = ?', (int(registered), row['owner_id']))
+                            changed_users.add(row['user_id'])
+                    conn.commit()
+            finally:
+                conn.close()
+
+            stats['seconds'] = round(time.time() - started, 3)
+            self.last_run = started
+            self.last_stats = stats
+        if changed_users and self.on_change:
+            self.on_change(sorted(changed_users))
+        return dict(stats, changed_users=sorted(changed_users))
+
+    def start(self, interval):
+        """Run a pass every interval seconds on a daemon thread (idempotent; 0 = off)"""
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name='gallery-maintenance',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Warning: Gallery consistency check failed: {e}")
+            self._stop.wait(interval)
+
+    def status(self):
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'last_run': self.last_run,
+            'last_stats': self.last_stats
+        }
+
+
+if __name__ == "__main__":
+    maintainer = GalleryMaintainer()
+    print("🔄 Checking registered photos...")
+    result = maintainer.check(force="--force" in sys.argv)
+    print(f"\n🎉 Done in {result['seconds']}s: {result['checked']} checked, {result['unchanged']} unchanged, "
+          f"{result['verified']} re-hashed, {result['encoded']} encoded, {result['adopted']} adopted, "
+          f"{result['missing']} missing, {result['failed']} failed")
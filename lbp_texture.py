@@ -0,0 +1,101 @@
+"""
+Local Binary Pattern (LBP) texture codes, vectorized
+Each pixel's code has one bit per neighbour: set when the neighbour is >= the
+centre pixel. Instead of visiting pixels one by one, the whole interior is
+compared with eight shifted views of the image (one array comparison per
+bit). With radius 1 and the 'default' method the codes, and therefore the
+histogram, are identical to the 3x3 loop AntiSpoofingDetector used before,
+border pixels included (they stay 0)
+
+Variants:
+  radius    neighbours at distance r on the same 3x3 grid directions
+            (square neighbourhood, no interpolation); several radii give a
+            multi-scale texture score
+  method    'default'     raw 8-bit codes (256 bins)
+            'ror'         rotation-invariant: the smallest rotation of the code (36 bins)
+            'uniform'     rotation-invariant uniform: number of set bits for
+                          patterns with <= 2 bit transitions, one bin for the rest (10 bins)
+            'nri_uniform' one bin per uniform pattern plus one for the rest (59 bins)
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# (dy, dx) of bits 0..7, clockwise from the top-left neighbour
+NEIGHBOUR_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+LBP_METHODS = ('default', 'ror', 'uniform', 'nri_uniform')
+
+
+def _rotations(code):
+    return [((code >> k) | (code << (8 - k))) & 0xFF for k in range(8)]
+
+
+def _transitions(code):
+    return sum(((code >> k) & 1) != ((code >> ((k + 1) % 8)) & 1) for k in range(8))
+
+
+def _build_tables():
+    """method -> (256-entry code -> bin lookup table, or None for the identity; bin count)"""
+    codes = range(256)
+    ror = [min(_rotations(c)) for c in codes]
+    ror_bins = sorted(set(ror))
+    uniform = sorted(c for c in codes if _transitions(c) <= 2)
+    tables = {
+        'default': (None, 256),
+        'ror': (np.array([ror_bins.index(r) for r in ror], dtype=np.uint8), len(ror_bins)),
+        'uniform': (np.array([bin(c).count('1') if _transitions(c) <= 2 else 9 for c in codes], dtype=np.uint8), 10),
+        'nri_uniform': (np.array([uniform.index(c) if c in uniform else len(uniform) for c in codes],
+                                 dtype=np.uint8), len(uniform) + 1)
+    }
+    return tables
+
+
+LBP_TABLES = _build_tables()
+
+
+def lbp_codes(gray, radius=1, method='default'):
+    """
+    LBP code of every pixel of a 2-D grayscale image (uint8 array, same shape)
+    Pixels closer than radius to the border have no full neighbourhood and get code 0
+    """
+    if method not in LBP_TABLES:
+        raise ValueError(f"Unknown LBP method: {method}")
+    gray = np.asarray(gray)
+    h, w = gray.shape
+    r = int(radius)
+    codes = np.zeros((h, w), dtype=np.uint8)
+    if r < 1 or h <= 2 * r or w <= 2 * r:
+        return codes
+
+    center = gray[r:h - r, r:w - r]
+    inner = codes[r:h - r, r:w - r]
+    for bit, (dy, dx) in enumerate(NEIGHBOUR_OFFSETS):
+        neighbour = gray[r + dy * r:h - r + dy * r, r + dx * r:w - r + dx * r]
+        inner |= (neighbour >= center).view(np.uint8) << bit
+
+    table, _ = LBP_TABLES[method]
+    return codes if table is None else table[codes]
+
+
+def lbp_histogram(gray, radius=1, method='default'):
+    """Normalized histogram of the LBP codes (float32, one bin per code of the method)"""
+    codes = lbp_codes(gray, radius, method)
+    bins = LBP_TABLES[method][1]
+    hist = cv2.calcHist([codes], [0], None, [bins], [0, bins])
+    return hist / (codes.shape[0] * codes.shape[1])
+
+
+def lbp_texture_score(gray, radii=(1,), method='default'):
+    """
+    Entropy of the LBP histogram divided by its maximum (log2 of the bin
+    count), averaged over radii and capped at 1.0; flat, printed or
+    re-photographed surfaces score low
+    """
+    scores = []
+    for radius in radii:
+        hist_norm = lbp_histogram(gray, radius, method)
+        entropy = -np.sum(hist_norm * np.log2(hist_norm + 1e-7))
+        scores.append(entropy / math.log2(LBP_TABLES[method][1]))
+    return min(sum(scores) / len(scores), 1.0)
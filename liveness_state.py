@@ -0,0 +1,207 @@
+"""
+Per-kiosk liveness state
+The motion and blink checks of AntiSpoofingDetector compare a face with the
+frames before it, so they need memory between requests. One detector-wide
+history mixed frames from every classroom and request thread, and a reset
+from one kiosk wiped everyone's. LivenessState holds one kiosk's history;
+LivenessStateStore keeps them by kiosk id with a size bound, idle-TTL
+eviction and an account of the memory they hold (a few hundred bytes per
+kiosk with the default 5-frame history)
+
+Worker processes get a snapshot of the kiosk's state with each job and send
+the updated one back, like tracking sessions, so the history stays whole no
+matter which worker runs the frame. Two frames of one kiosk can be in
+flight at once; a returned state is only adopted if the kiosk's state has
+not changed since its snapshot was taken (compare-and-set on version), so
+the slower frame is dropped instead of rolling the history back
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LivenessState:
+    """
+    One kiosk's motion history and blink counters
+    The history is a fixed ring of the last max_history frames: timestamp,
+    nose tip and the nose's movement from the frame before (computed once,
+    when the frame arrives). Only the nose tip is ever compared, so neither
+    the landmarks nor the face crop are kept. It follows one face: subject is
+    the track id of that face (None when tracking is off)
+    """
+
+    def __init__(self, max_history=5):
+        self.max_history = max_history
+        self.count = 0      # frames in the ring
+        self._next = 0      # slot of the next frame
+        self.timestamps = np.zeros(max_history)
+        self.nose = np.zeros((max_history, 2))
+        self.has_nose = np.zeros(max_history, dtype=bool)
+        self.steps = np.zeros(max_history)  # nose movement (px) from the previous frame
+        self.has_step = np.zeros(max_history, dtype=bool)
+        self.blink_counter = 0
+        self.blink_detected = False
+        self.subject = None
+        self.version = 0    # bumped on every change (compare-and-set for worker results)
+        self.lock = threading.Lock()  # one frame at a time updates the history
+        self.updated_at = time.time()
+
+    def add_frame(self, landmarks, timestamp=None):
+        """Record one frame's nose tip (callers hold the lock)"""
+        slot = self._next
+        previous = (slot - 1) % self.max_history
+        nose = landmarks.get('nose_tip') if landmarks else None
+        step = None
+        if nose and self.count and self.has_nose[previous]:
+            step = np.linalg.norm(np.array(nose[0]) - self.nose[previous])
+
+        self.timestamps[slot] = time.time() if timestamp is None else timestamp
+        self.has_nose[slot] = bool(nose)
+        if nose:
+            self.nose[slot] = nose[0]
+        self.has_step[slot] = step is not None
+        self.steps[slot] = step or 0.0
+        if self.count == self.max_history:
+            # The oldest frame was overwritten; the next one's step led from it
+            self.has_step[(slot + 1) % self.max_history] = False
+        else:
+            self.count += 1
+        self._next = (slot + 1) % self.max_history
+        self.version += 1
+
+    def motion_steps(self):
+        """Nose movements between consecutive frames in the ring, oldest first"""
+        order = (self._next - self.count + np.arange(self.count)) % self.max_history
+        return self.steps[order][self.has_step[order]]
+
+    def follow(self, subject):
+        """Follow the face on track subject; another face's history is dropped"""
+        with self.lock:
+            if subject != self.subject and self.subject is not None:
+                self._clear()
+            if subject != self.subject:
+                self.subject = subject
+                self.version += 1
+
+    def _clear(self):
+        self.count = 0
+        self._next = 0
+        self.has_nose[:] = False
+        self.has_step[:] = False
+        self.blink_counter = 0
+        self.blink_detected = False
+        self.version += 1
+
+    def reset(self):
+        with self.lock:
+            self._clear()
+            self.subject = None
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'max_history': self.max_history,
+                'count': self.count,
+                'next': self._next,
+                'timestamps': self.timestamps.copy(),
+                'nose': self.nose.copy(),
+                'has_nose': self.has_nose.copy(),
+                'steps': self.steps.copy(),
+                'has_step': self.has_step.copy(),
+                'blink_counter': self.blink_counter,
+                'blink_detected': self.blink_detected,
+                'subject': self.subject,
+                'version': self.version
+            }
+
+    def restore(self, snapshot, expected_version=None):
+        """
+        Adopt the state a worker returned (ignored when missing); with
+        expected_version (the version of the snapshot the job was sent) only
+        if nothing changed this state since. Returns whether it was adopted
+        """
+        if not snapshot:
+            return False
+        with self.lock:
+            if expected_version is not None and self.version != expected_version:
+                return False
+            self.count = snapshot['count']
+            self._next = snapshot['next']
+            for name in ('timestamps', 'nose', 'has_nose', 'steps', 'has_step'):
+                getattr(self, name)[:] = snapshot[name]
+            self.blink_counter = snapshot['blink_counter']
+            self.blink_detected = snapshot['blink_detected']
+            self.subject = snapshot['subject']
+            self.version += 1
+        self.updated_at = time.time()
+        return True
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        state = cls(max_history=snapshot['max_history'])
+        state.restore(snapshot)
+        state.version = snapshot['version']
+        return state
+
+    def nbytes(self):
+        """Memory held by the history arrays"""
+        return sum(array.nbytes for array in (self.timestamps, self.nose, self.has_nose, self.steps, self.has_step))
+
+
+class LivenessStateStore:
+    """LivenessState by kiosk id; least recently used and idle kiosks are dropped"""
+
+    def __init__(self, max_kiosks=256, idle_timeout=300.0, max_history=5):
+        self.max_kiosks = max_kiosks
+        self.idle_timeout = idle_timeout
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._states = OrderedDict()  # least recently used first
+        self._evicted = {'idle': 0, 'capacity': 0}
+
+    def get(self, kiosk_id):
+        """The kiosk's state, created on first use"""
+        now = time.time()
+        with self._lock:
+            # Least recently used first, so the idle ones are at the front
+            while self._states:
+                oldest_id, oldest = next(iter(self._states.items()))
+                if now - oldest.updated_at <= self.idle_timeout:
+                    break
+                del self._states[oldest_id]
+                self._evicted['idle'] += 1
+            state = self._states.get(kiosk_id)
+            if state is None:
+                state = self._states[kiosk_id] = LivenessState(max_history=self.max_history)
+                while len(self._states) > self.max_kiosks:
+                    self._states.popitem(last=False)
+                    self._evicted['capacity'] += 1
+            else:
+                self._states.move_to_end(kiosk_id)
+            state.updated_at = now
+            return state
+
+    def reset(self, kiosk_id=None):
+        """Start one kiosk's liveness checks over (or every kiosk's)"""
+        with self._lock:
+            if kiosk_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(kiosk_id, None)
+
+    def stats(self):
+        with self._lock:
+            states = list(self._states.values())
+            evicted = dict(self._evicted)
+        return {
+            'kiosks': len(states),
+            'max_kiosks': self.max_kiosks,
+            'idle_timeout': self.idle_timeout,
+            'frames': sum(state.count for state in states),
+            'bytes': sum(state.nbytes() for state in states),
+            'evicted_idle': evicted['idle'],
+            'evicted_capacity': evicted['capacity']
+        }
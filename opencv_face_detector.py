@@ -9,6 +9,17 @@ import os
 import hashlib
 from pathlib import Path
 
+def load_image(source):
+    """
+    BGR image from a file path, encoded bytes (an upload read into memory)
+    or an already decoded BGR array; None when it cannot be read
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(str(source))
+
 class SimpleFaceDetector:
     """Simple face detector using OpenCV without external dependencies"""
     
@@ -66,10 +77,11 @@ class SimpleFaceDetector:
     def register_face(self, image_path, student_id):
         """
         Register a face for a student
+        image_path may also be encoded bytes or a BGR array (see load_image)
         """
         try:
             # Read image
-            image = cv2.imread(image_path)
+            image = load_image(image_path)
             if image is None:
                 return False, "Could not read image"
             
@@ -104,13 +116,14 @@ class SimpleFaceDetector:
         except Exception as e:
             return False, f"Error registering face: {str(e)}"
     
-    def recognize_face(self, image_path, threshold=0.65):
+    def recognize_face(self, image, threshold=0.65):
         """
         Recognize face in image against registered faces
+        image: path, encoded bytes or BGR array (see load_image)
         """
         try:
             # Read image
-            image = cv2.imread(image_path)
+            image = load_image(image)
             if image is None:
                 return None, "Could not read image"
             
@@ -163,11 +176,12 @@ def fallback_face_registration(image_path, student_id):
     """
     return simple_detector.register_face(image_path, student_id)
 
-def fallback_face_recognition(image_path):
+def fallback_face_recognition(image):
     """
     Fallback face recognition using simple OpenCV detection
+    image: path, encoded bytes or BGR array
     """
-    student_id, message = simple_detector.recognize_face(image_path)
+    student_id, message = simple_detector.recognize_face(image)
     
     if student_id:
         # Get student info from database
@@ -0,0 +1,150 @@
+"""
+Per-stage latency of the recognition pipeline
+A StageTimer travels with one frame (into a worker process and back inside
+the result as 'timings', milliseconds per stage). The web process feeds
+those timings into StageMetrics, which keeps a Prometheus-style cumulative
+histogram and a rolling window of recent samples for every stage, once per
+endpoint and once per kiosk
+"""
+
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Histogram bucket upper bounds in milliseconds (HOG detection ~100 ms, anti-spoofing ~1 s)
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageTimer:
+    """Milliseconds spent in each named stage of one request (repeated stages add up)"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000.0)
+
+    def add(self, name, ms):
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 3)
+
+
+class StageHistogram:
+    """Cumulative bucket counts (for Prometheus) plus the most recent samples"""
+
+    def __init__(self, buckets, window_size):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.recent = deque(maxlen=window_size)  # (observed_at, ms)
+
+    def observe(self, ms, now):
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum_ms += ms
+        self.recent.append((now, ms))
+
+    def summary(self, window_seconds, now):
+        recent = [ms for at, ms in self.recent if now - at <= window_seconds]
+        summary = {
+            'count': self.count,
+            'mean_ms': round(self.sum_ms / self.count, 2) if self.count else None,
+            'recent': len(recent)
+        }
+        if recent:
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+            summary.update(p50_ms=round(float(p50), 2), p95_ms=round(float(p95), 2), p99_ms=round(float(p99), 2))
+        return summary
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StageMetrics:
+    """
+    Stage histograms keyed by (endpoint, stage) and by (kiosk, stage)
+    Only the max_kiosks most recently active kiosks are kept
+    """
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS, window_seconds=300.0, window_size=512, max_kiosks=64):
+        self.buckets_ms = tuple(sorted(buckets_ms))
+        self.window_seconds = window_seconds
+        self.window_size = window_size
+        self.max_kiosks = max_kiosks
+        self._lock = threading.Lock()
+        self._endpoints = {}            # endpoint -> {stage: StageHistogram}
+        self._kiosks = OrderedDict()    # kiosk id -> {stage: StageHistogram}, most recent last
+
+    def _histogram(self, series, stage):
+        histogram = series.get(stage)
+        if histogram is None:
+            histogram = series[stage] = StageHistogram(self.buckets_ms, self.window_size)
+        return histogram
+
+    def observe(self, endpoint, kiosk_id, timings):
+        """Record one request's {stage: ms}"""
+        if not timings:
+            return
+        now = time.time()
+        with self._lock:
+            by_endpoint = self._endpoints.setdefault(endpoint, {})
+            by_kiosk = None
+            if kiosk_id is not None:
+                by_kiosk = self._kiosks.pop(kiosk_id, None) or {}
+                self._kiosks[kiosk_id] = by_kiosk
+                while len(self._kiosks) > self.max_kiosks:
+                    self._kiosks.popitem(last=False)
+            for stage, ms in timings.items():
+                self._histogram(by_endpoint, stage).observe(float(ms), now)
+                if by_kiosk is not None:
+                    self._histogram(by_kiosk, stage).observe(float(ms), now)
+
+    def snapshot(self):
+        """JSON view: count, mean and rolling p50/p95/p99 per endpoint/kiosk and stage"""
+        now = time.time()
+        with self._lock:
+            return {
+                'window_seconds': self.window_seconds,
+                'endpoints': {
+                    endpoint: {stage: h.summary(self.window_seconds, now) for stage, h in stages.items()}
+                    for endpoint, stages in self._endpoints.items()
+                },
+                'kiosks': {
+                    kiosk: {stage: h.summary(self.window_seconds, now) for stage, h in stages.items()}
+                    for kiosk, stages in self._kiosks.items()
+                }
+            }
+
+    def prometheus(self, prefix='facecheck'):
+        """Prometheus text exposition format (histograms in seconds)"""
+        lines = []
+        with self._lock:
+            for name, label, series in (
+                (f'{prefix}_stage_seconds', 'endpoint', self._endpoints),
+                (f'{prefix}_kiosk_stage_seconds', 'kiosk', self._kiosks)
+            ):
+                lines.append(f'# HELP {name} Recognition pipeline stage latency by {label}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, stages in series.items():
+                    for stage, h in stages.items():
+                        labels = f'{label}="{_escape(key)}",stage="{_escape(stage)}"'
+                        cumulative = 0
+                        for bound, count in zip(h.buckets, h.counts):
+                            cumulative += count
+                            lines.append(f'{name}_bucket{{{labels},le="{bound / 1000.0:g}"}} {cumulative}')
+                        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                        lines.append(f'{name}_sum{{{labels}}} {h.sum_ms / 1000.0:.6f}')
+                        lines.append(f'{name}_count{{{labels}}} {h.count}')
+        return '\n'.join(lines) + '\n'
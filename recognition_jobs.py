@@ -0,0 +1,197 @@
+"""
+Asynchronous recognition jobs
+A kiosk posts a frame and immediately gets a job id back; the result is
+picked up by long-polling the job or from the kiosk's server-sent event
+stream. Each kiosk has at most one frame waiting: a newer frame supersedes
+the queued one, and frames that waited longer than max_age are dropped
+instead of being recognized long after the person walked away
+"""
+
+import time
+import uuid
+import threading
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+EXPIRED = 'expired'
+FINAL_STATES = (DONE, FAILED, SUPERSEDED, EXPIRED)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting"""
+
+
+class RecognitionJob:
+    def __init__(self, seq, kiosk_id, owner, class_id=None, multi_face=False):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.seq = seq                  # monotonic, used as the SSE event id
+        self.kiosk_id = kiosk_id
+        self.owner = owner              # user id of the session that posted the frame
+        self.class_id = class_id
+        self.multi_face = multi_face
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_status = None       # superseded/expired, set just before cancelling
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        job = {
+            'job_id': self.job_id,
+            'seq': self.seq,
+            'kiosk_id': self.kiosk_id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+        if self.result is not None:
+            job['result'] = self.result
+        if self.error:
+            job['error'] = self.error
+        return job
+
+
+class RecognitionJobManager:
+    """
+    Tracks recognition jobs on top of any submit(image_bytes, class_id, multi_face,
+    kiosk_id=...) callable returning a concurrent.futures.Future (the worker pool, or a
+    thread running the inline pipeline). Superseding and expiry cancel the
+    Future, so a frame that has not started is never recognized
+    """
+
+    def __init__(self, submit, max_age=5.0, max_pending=32, retention=120.0):
+        self._submit = submit
+        self.max_age = max_age          # seconds a frame may wait before it is dropped
+        self.max_pending = max_pending  # unfinished jobs across all kiosks
+        self.retention = retention      # seconds finished jobs stay pollable
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._jobs = {}                 # job id -> RecognitionJob
+        self._latest = {}               # kiosk id -> job id of its newest frame
+        self._counts = {state: 0 for state in FINAL_STATES}
+
+    def submit(self, kiosk_id, owner, image_bytes, class_id=None, multi_face=False):
+        """Queue a frame for a kiosk; returns the new job (superseding its queued frame)"""
+        with self._cond:
+            self._expire()
+            self._prune()
+
+            previous = self._jobs.get(self._latest.get(kiosk_id))
+            if previous is not None and previous.status == QUEUED and previous.future is not None:
+                self._cancel(previous, SUPERSEDED)
+
+            pending = sum(1 for job in self._jobs.values() if job.status not in FINAL_STATES)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'{pending} recognition jobs already waiting')
+
+            self._seq += 1
+            job = RecognitionJob(self._seq, kiosk_id, owner, class_id=class_id, multi_face=multi_face)
+            self._jobs[job.job_id] = job
+            self._latest[kiosk_id] = job.job_id
+
+        # Outside the lock: an executor may run the done-callback synchronously
+        job.future = self._submit(image_bytes, class_id, multi_face, kiosk_id=kiosk_id)
+        job.future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=10.0):
+        """Long-poll: block until the job is finished or the timeout passes"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                self._expire()
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.time()
+                if job is None or job.status in FINAL_STATES or remaining <= 0:
+                    return job
+                self._cond.wait(min(remaining, 1.0))
+
+    def wait_kiosk(self, kiosk_id, after_seq=0, timeout=15.0):
+        """Jobs of a kiosk finished after after_seq, blocking up to timeout for the next one"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                self._expire()
+                finished = sorted(
+                    (job for job in self._jobs.values()
+                     if job.kiosk_id == kiosk_id and job.seq > after_seq and job.status in FINAL_STATES),
+                    key=lambda job: job.seq
+                )
+                remaining = deadline - time.time()
+                if finished or remaining <= 0:
+                    return finished
+                self._cond.wait(min(remaining, 1.0))
+
+    def latest_seq(self):
+        """Sequence number of the newest job (a stream starting now skips older ones)"""
+        with self._cond:
+            return self._seq
+
+    def metrics(self):
+        with self._cond:
+            states = {QUEUED: 0, RUNNING: 0}
+            for job in self._jobs.values():
+                if job.status in states:
+                    states[job.status] += 1
+            return {
+                'queued': states[QUEUED],
+                'running': states[RUNNING],
+                'kiosks': len(self._latest),
+                'finished': dict(self._counts)
+            }
+
+    def _on_done(self, job, future):
+        with self._cond:
+            if job.status in FINAL_STATES:
+                return
+            if future.cancelled():
+                self._finish(job, job.cancel_status or EXPIRED)
+            elif future.exception() is not None:
+                job.error = str(future.exception())
+                self._finish(job, FAILED)
+            else:
+                job.result = future.result()
+                self._finish(job, DONE)
+
+    def _cancel(self, job, status):
+        """Cancel a job that has not started; the done-callback records the status"""
+        job.cancel_status = status
+        if not job.future.cancel():
+            job.cancel_status = None  # already running: let it finish
+
+    def _finish(self, job, status):
+        """Caller holds the lock"""
+        job.status = status
+        job.finished_at = time.time()
+        self._counts[status] += 1
+        self._cond.notify_all()
+
+    def _expire(self):
+        """Drop frames that waited too long; mark started ones as running (caller holds the lock)"""
+        now = time.time()
+        for job in self._jobs.values():
+            if job.status not in (QUEUED, RUNNING) or job.future is None:
+                continue
+            if job.status == QUEUED and job.future.running():
+                job.status = RUNNING
+            elif job.status == QUEUED and now - job.created_at > self.max_age:
+                self._cancel(job, EXPIRED)
+
+    def _prune(self):
+        """Forget finished jobs past their retention (caller holds the lock)"""
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.status in FINAL_STATES and now - job.finished_at > self.retention]:
+            job = self._jobs.pop(job_id)
+            if self._latest.get(job.kiosk_id) == job_id:
+                del self._latest[job.kiosk_id]
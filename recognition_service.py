@@ -0,0 +1,689 @@
+"""
+Face recognition service
+recognize_frame() is the per-frame recognition pipeline (detect, shape,
+encode, match, anti-spoofing). RecognitionService runs it in a fixed set of
+worker processes: dlib HOG and ResNet encoding are CPU-bound and hold the
+GIL, so running them in Flask request threads serializes every kiosk on one
+core. Each worker loads the dlib models and the student gallery once at
+start, receives JPEG bytes over its own pipe, and applies gallery updates
+broadcast to it by the web process in order with the jobs
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from frame_analysis import FrameAnalysis
+from face_tracking import TrackingSession
+from liveness_state import LivenessState
+from pipeline_metrics import StageTimer
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+try:
+    from anti_spoofing import anti_spoofing_detector
+    ANTI_SPOOFING_AVAILABLE = True
+except ImportError:
+    ANTI_SPOOFING_AVAILABLE = False
+
+# Match tolerance from face_recog_test.py
+MATCH_TOLERANCE = 0.62
+
+
+def check_anti_spoofing(face, timer, liveness=None):
+    """Anti-spoofing result for one AnalyzedFace, with the kiosk's LivenessState (motion history)"""
+    anti_spoofing_result = {'is_live': True, 'confidence': 1.0, 'details': 'Anti-spoofing disabled'}
+    if ANTI_SPOOFING_AVAILABLE and face.landmarks:
+        print("Performing anti-spoofing analysis...")
+        with timer.stage('anti_spoofing'):
+            anti_spoofing_result = anti_spoofing_detector.comprehensive_anti_spoofing_check(
+                face.frame.rgb_image, face.landmarks, face.location, state=liveness
+            )
+        print(f"Anti-spoofing result: {anti_spoofing_result['details']}")
+    return anti_spoofing_result
+
+
+def spoofing_result(face_box, anti_spoofing_result):
+    return {
+        'success': False,
+        'message': f"Spoofing attempt detected! {anti_spoofing_result['details']}",
+        'student_id': 'SPOOFING_DETECTED',
+        'student_name': 'Spoofing Attempt',
+        'face_box': face_box,
+        'anti_spoofing': anti_spoofing_result
+    }
+
+
+def anti_spoofing_summary(anti_spoofing_result):
+    """The verdict as recognition results report it"""
+    return {
+        'is_live': bool(anti_spoofing_result.get('is_live', True)),
+        'confidence': float(anti_spoofing_result.get('confidence', 1.0)),
+        'details': str(anti_spoofing_result.get('details', 'Anti-spoofing disabled'))
+    }
+
+
+def recognize_face(gallery, match, face, timer=None, liveness=None):
+    """
+    Build the recognition result for one detected face
+    match is the (student id, distance) pair from the gallery for this face;
+    face is its AnalyzedFace (landmarks, box and liveness share one shape prediction);
+    liveness is the kiosk's LivenessState (motion history across its frames)
+    """
+    timer = timer or StageTimer()
+    best_id, best_distance = match
+    best_match = gallery.info(best_id) if best_id is not None else None
+    face_box = face.face_box
+
+    # Perform anti-spoofing check
+    anti_spoofing_result = check_anti_spoofing(face, timer, liveness)
+    if not anti_spoofing_result['is_live']:
+        return spoofing_result(face_box, anti_spoofing_result)
+
+    # Calculate real liveness detection metrics
+    with timer.stage('liveness'):
+        eye_ratio, nose_motion = face.liveness_metrics()
+    print(f"Liveness metrics - Eye ratio: {eye_ratio}, Nose motion: {nose_motion}")
+
+    print(f"Best match: {best_match['firstname'] if best_match else 'None'}")
+    print(f"Best distance: {best_distance}")
+    print(f"Tolerance: {MATCH_TOLERANCE}")
+
+    anti_spoofing = anti_spoofing_summary(anti_spoofing_result)
+
+    if best_match and best_distance <= MATCH_TOLERANCE:
+        print("Match found!")
+        confidence = int((1 - best_distance) * 100)  # Convert distance to confidence percentage
+        return {
+            'success': True,
+            'student_id': int(best_id),  # the gallery's owner id (faculty_id in the faculty gallery)
+            'user_id': best_match.get('user_id'),
+            'student_name': f"{best_match['firstname']} {best_match['lastname']}",
+            'distance': float(best_distance),
+            'confidence': confidence,
+            'face_box': face_box,  # Add face location for drawing box
+            'eye_ratio': float(eye_ratio),  # Real eye aspect ratio
+            'nose_motion': float(nose_motion),  # Real nose motion
+            'anti_spoofing': anti_spoofing
+        }
+
+    print("No match found")
+    return {
+        'success': False,
+        'message': 'No matching student found',
+        'student_id': 'Unknown',
+        'student_name': 'Unknown',
+        'distance': float(best_distance if best_match else 999.0),  # Use 999.0 instead of float('inf')
+        'confidence': 0,
+        'face_box': face_box,  # Still provide face box even if no match
+        'eye_ratio': float(eye_ratio),
+        'nose_motion': float(nose_motion),
+        'anti_spoofing': anti_spoofing
+    }
+
+
+def liveness_subject(locations, track_ids, liveness):
+    """
+    Index of the face the kiosk's liveness history follows: the face still on
+    the history's track, else the largest one. The motion check compares a
+    face with its own earlier frames, so the other faces of a multi-face frame
+    are checked without a history (their motion passes, as on a kiosk's first
+    frames) instead of measuring the distance between different people
+    """
+    if track_ids is not None and liveness is not None and liveness.subject in track_ids:
+        return track_ids.index(liveness.subject)
+    areas = [(bottom - top) * (right - left) for top, right, bottom, left in locations]
+    return areas.index(max(areas))
+
+
+def recognize_frame(rgb_image, gallery, detector, multi_face=False, class_id=None, tracking=None, timer=None,
+                    liveness=None):
+    """
+    Recognize the face(s) in one RGB frame against a gallery
+    With multi_face every detected face is encoded and matched in one pass and
+    the result carries one entry per face under 'faces'
+    tracking is the kiosk's TrackingSession: when its faces are found again
+    near their last boxes, identities carry over and encoding is skipped
+    liveness is the kiosk's LivenessState for the anti-spoofing motion check;
+    it follows one face per kiosk (see liveness_subject)
+    timer (a StageTimer) collects the milliseconds spent in each stage
+    """
+    timer = timer or StageTimer()
+    print(f"Found {len(gallery)} registered students" + (f" in class {class_id}" if class_id else ""))
+
+    if len(gallery) == 0:
+        return {
+            'success': False,
+            'message': 'No registered students enrolled in this class' if class_id else 'No registered students found',
+            'student_id': 'Unknown',
+            'student_name': 'Unknown'
+        }
+
+    context = (class_id, bool(multi_face))
+    followed = None
+    if tracking is not None:
+        with timer.stage('track'):
+            followed = tracking.follow(rgb_image, detector, context)
+    if followed:
+        # Tracked faces: landmarks/liveness on the new boxes, identities from the tracks
+        print(f"Following {len(followed)} tracked face(s)")
+        with timer.stage('landmarks'):
+            frame = FrameAnalysis(rgb_image, [location for _, location in followed],
+                                  detection={'tier': 'track', 'tracks': len(followed)})
+        matches = [(track['student_id'], track['distance']) for track, _ in followed]
+    else:
+        # Detect faces (on a downscaled copy, mapped back to full resolution) and run the
+        # 68-point shape predictor once per face; single-face mode only needs the first face
+        print("Detecting faces...")
+        with timer.stage('detect'):
+            locations, detection = detector.detect(rgb_image)
+        with timer.stage('landmarks'):
+            frame = FrameAnalysis(rgb_image, locations if multi_face else locations[:1], detection)
+    detection_tier = frame.detection
+    print(f"Found {len(frame)} face(s)" + (f" (tier {detection_tier})" if detection_tier else ""))
+
+    if not len(frame):
+        if tracking is not None:
+            tracking.update([], [], context, verified=True)
+        return {
+            'success': False,
+            'message': 'No face detected',
+            'student_id': 'Unknown',
+            'student_name': 'Unknown',
+            'detection': None,
+            'face_locations': []
+        }
+
+    if not followed:
+        # Encode from the same shapes (no second landmark pass)
+        print("Encoding faces...")
+        with timer.stage('encode'):
+            face_encodings = frame.encodings()
+        print(f"Generated {len(face_encodings)} face encoding(s)")
+
+        # Compare with known faces (every face against the gallery in one matrix operation)
+        print("Comparing with known faces...")
+        with timer.stage('match'):
+            matches = gallery.match_many(face_encodings)
+
+    track_ids = None
+    if tracking is not None:
+        track_ids = tracking.update(frame.locations, matches, context, verified=not followed)
+
+    # Only one face per frame adds to the kiosk's motion history
+    subject = liveness_subject(frame.locations, track_ids, liveness)
+    if liveness is not None and track_ids is not None:
+        liveness.follow(track_ids[subject])
+    faces = [recognize_face(gallery, match, face, timer, liveness if index == subject else LivenessState())
+             for index, (match, face) in enumerate(zip(matches, frame))]
+
+    if track_ids is not None:
+        for face, track_id in zip(faces, track_ids):
+            face['track_id'] = track_id
+    # Where each face was found, so a cached result can be checked again on a later frame
+    face_locations = [[int(v) for v in location] for location in frame.locations]
+
+    if not multi_face:
+        faces[0]['detection'] = detection_tier
+        faces[0]['face_locations'] = face_locations
+        return faces[0]
+
+    recognized = [face for face in faces if face['success']]
+    print(f"Recognized {len(recognized)} of {len(faces)} face(s)")
+    return {
+        'success': bool(recognized),
+        'multi_face': True,
+        'message': f'Recognized {len(recognized)} of {len(faces)} face(s)',
+        'face_count': len(faces),
+        'recognized_count': len(recognized),
+        'faces': faces,
+        'detection': detection_tier,
+        'face_locations': face_locations
+    }
+
+
+def recheck_anti_spoofing(rgb_image, result, liveness=None, timer=None):
+    """
+    A cached result re-checked on a new near-identical frame: identities are
+    reused, but landmarks and the anti-spoofing checks run again at the cached
+    face locations (with the kiosk's motion history), so a verdict is never
+    reused. A result with no faces is returned as is; None when the result
+    does not say where its faces were
+    """
+    timer = timer or StageTimer()
+    locations = result.get('face_locations')
+    if locations is None:
+        return None
+    if not locations:
+        return result
+    entries = result['faces'] if result.get('multi_face') else [result]
+    if len(entries) != len(locations):
+        return None
+    with timer.stage('landmarks'):
+        frame = FrameAnalysis(rgb_image, [tuple(location) for location in locations],
+                              detection={'tier': 'cache', 'faces': len(locations)})
+
+    track_ids = [entry.get('track_id') for entry in entries]
+    track_ids = None if None in track_ids else track_ids
+    subject = liveness_subject(frame.locations, track_ids, liveness)
+    if liveness is not None and track_ids is not None:
+        liveness.follow(track_ids[subject])
+    faces = []
+    for index, (entry, face) in enumerate(zip(entries, frame)):
+        anti_spoofing_result = check_anti_spoofing(face, timer, liveness if index == subject else LivenessState())
+        if anti_spoofing_result['is_live']:
+            entry = dict(entry, anti_spoofing=anti_spoofing_summary(anti_spoofing_result))
+        else:
+            entry = dict(spoofing_result(entry.get('face_box'), anti_spoofing_result),
+                         **{key: entry[key] for key in ('track_id',) if key in entry})
+        faces.append(entry)
+
+    if not result.get('multi_face'):
+        return dict(faces[0], **{key: result[key] for key in ('detection', 'face_locations', 'cached', 'cache_distance')
+                                 if key in result})
+    recognized = [face for face in faces if face['success']]
+    return dict(result, success=bool(recognized), faces=faces, recognized_count=len(recognized),
+                message=f'Recognized {len(recognized)} of {len(faces)} face(s)')
+
+
+def decode_image(image_bytes):
+    """JPEG/PNG bytes -> BGR array (what cv2.imread returns), or None when not an image"""
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def decode_frame(image_bytes):
+    """JPEG/PNG bytes -> RGB array, or None when the bytes are not an image"""
+    image = decode_image(image_bytes)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def error_result(message):
+    return {
+        'success': False,
+        'message': message,
+        'student_id': 'Unknown',
+        'student_name': 'Unknown'
+    }
+
+
+class _WorkerState:
+    """Everything a worker loads once: dlib models, detector and galleries"""
+
+    def __init__(self, db_path):
+        from security_config import SecurityConfig
+        from face_encoding_store import FaceEncodingStore
+        from face_gallery import StudentGallery, FacultyGallery, ClassGalleryCache
+        from face_detection import create_detector, parse_upsample_tiers
+        from ann_index import default_index_path
+        import face_recognition  # noqa: F401 - loads the dlib models now, not on the first frame
+
+        self.db_path = db_path
+        self.detector = create_detector(
+            SecurityConfig.DETECTOR_BACKEND,
+            scale=SecurityConfig.DETECTION_SCALE,
+            upsample_tiers=parse_upsample_tiers(SecurityConfig.DETECTION_UPSAMPLE_TIERS),
+            cascade_scale=SecurityConfig.DETECTOR_CASCADE_SCALE,
+            cascade_path=SecurityConfig.DETECTOR_CASCADE_PATH or None
+        )
+        self.gallery = StudentGallery(
+            FaceEncodingStore(db_path),
+            ann_min_size=SecurityConfig.ANN_MIN_GALLERY_SIZE,
+            ann_path=default_index_path(db_path),
+            ann_nprobe=SecurityConfig.ANN_NPROBE,
+            reduction=SecurityConfig.TEMPLATE_MATCH_REDUCTION,
+            k=SecurityConfig.TEMPLATE_MATCH_K,
+            precision=SecurityConfig.GALLERY_PRECISION,
+            rerank=SecurityConfig.GALLERY_RERANK
+        )
+        self.class_galleries = ClassGalleryCache(self.gallery, self.load_class_roster)
+        self.gallery.ensure_loaded()
+        # Event check-in matches faculty; loaded on the first event frame
+        self.faculty_gallery = FacultyGallery(FaceEncodingStore(db_path))
+
+    def load_class_roster(self, class_id):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            rows = conn.execute('SELECT student_id FROM student_class WHERE class_id = ?', (class_id,)).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    def apply(self, command, arg):
+        """Apply one broadcast gallery update"""
+        if command == 'refresh_user':
+            self.gallery.refresh_user(arg)
+            self.faculty_gallery.refresh_user(arg)
+        elif command == 'invalidate_class':
+            self.class_galleries.invalidate(arg)
+        elif command == 'sync':
+            self.gallery.sync()
+
+    def recognize(self, image_bytes, class_id, multi_face, tracks=None, gallery='student', liveness=None):
+        timer = StageTimer()
+        with timer.stage('decode'):
+            rgb_image = decode_frame(image_bytes)
+        if rgb_image is None:
+            return error_result('Could not load image')
+        if gallery == 'faculty':
+            gallery = self.faculty_gallery.ensure_loaded()
+        else:
+            gallery = self.gallery.ensure_loaded()
+            if class_id:
+                gallery = self.class_galleries.get(class_id)
+        # The kiosk's tracks travel with the job and come back in 'tracking_state'
+        tracking = TrackingSession.from_snapshot(tracks) if tracks else None
+        # ... and so does its liveness history ('liveness_state')
+        liveness_state = LivenessState.from_snapshot(liveness) if liveness else None
+        result = recognize_frame(rgb_image, gallery, self.detector, multi_face=multi_face, class_id=class_id,
+                                 tracking=tracking, timer=timer, liveness=liveness_state)
+        if tracking is not None:
+            result['tracking_state'] = tracking.snapshot()
+        if liveness_state is not None:
+            result['liveness_state'] = liveness_state.snapshot()
+        result['timings'] = timer.timings  # the web process records and strips them
+        return result
+
+
+def _worker_main(worker_id, db_path, conn, state_factory=_WorkerState):
+    """
+    Worker loop: load once, then handle messages from the web process in order
+    ('job', ...) recognizes one frame, ('update', command, arg) applies a gallery
+    update, ('stop',) exits. Updates and jobs share the pipe, so a job never
+    runs against a gallery older than the last broadcast before it
+    """
+    started = time.time()
+    try:
+        state = state_factory(db_path)
+    except Exception as e:
+        conn.send(('failed', worker_id, os.getpid(), f'{type(e).__name__}: {e}'))
+        return
+    conn.send(('ready', worker_id, os.getpid(), time.time() - started))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        kind = message[0]
+        if kind == 'stop':
+            return
+        if kind == 'update':
+            try:
+                state.apply(message[1], message[2])
+            except Exception as e:
+                print(f"Recognition worker {worker_id}: gallery update failed: {e}")
+            continue
+
+        _, job_id, image_bytes, class_id, multi_face, tracks, gallery, liveness = message
+        job_started = time.perf_counter()
+        try:
+            result = state.recognize(image_bytes, class_id, multi_face, tracks, gallery=gallery, liveness=liveness)
+        except Exception as e:
+            traceback.print_exc()
+            result = error_result(f'Recognition error: {str(e)}')
+        conn.send(('done', job_id, worker_id, result, (time.perf_counter() - job_started) * 1000.0))
+
+
+class RecognitionService:
+    """
+    Fixed pool of recognition worker processes
+    Each worker has its own pipe and runs one job at a time; jobs wait in the
+    web process until a worker is idle, so a crashing worker can never wedge a
+    queue shared with the others. Workers start lazily on the first job (so
+    importing the app does not spawn) and are restarted if they die; the job a
+    dead worker was running is failed
+    """
+
+    def __init__(self, worker_count=2, db_path='facecheck.db', job_timeout=30.0, state_factory=_WorkerState):
+        self.worker_count = max(1, int(worker_count))
+        self.db_path = os.path.abspath(db_path)
+        self.job_timeout = job_timeout
+        self.state_factory = state_factory  # builds the per-worker state (must be importable)
+        self._ctx = multiprocessing.get_context('spawn')  # dlib/OpenCV state must not be forked
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = False
+        self._next_job = 0
+        self._queue = deque()     # (job id, message) waiting for an idle worker
+        self._pending = {}        # job id -> (Future, submitted_at)
+        self._workers = {}        # worker id -> Process
+        self._conns = {}          # worker id -> Connection
+        self._busy = {}           # worker id -> job id it is running, or None
+        self._stats = {}          # worker id -> counters
+        self._completed = 0
+        self._failed = 0
+        self._queue_wait_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._stopping = False
+            for worker_id in range(self.worker_count):
+                self._spawn(worker_id)
+            self._collector = threading.Thread(target=self._collect, name='recognition-collector', daemon=True)
+            self._collector.start()
+            self._started = True
+            print(f"🚀 Recognition service started with {self.worker_count} worker(s)")
+
+    def _spawn(self, worker_id):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.db_path, child_conn, self.state_factory),
+            name=f'recognition-worker-{worker_id}',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers[worker_id] = process
+        self._conns[worker_id] = parent_conn
+        self._busy[worker_id] = None
+        stats = self._stats.setdefault(worker_id, {
+            'jobs': 0, 'total_ms': 0.0, 'last_ms': None, 'max_ms': 0.0, 'restarts': -1
+        })
+        stats.update({'pid': process.pid, 'ready': False, 'load_seconds': None, 'error': None,
+                      'spawned_at': time.time()})
+        stats['restarts'] += 1
+
+    def shutdown(self, timeout=5.0):
+        with self._lock:
+            if not self._started:
+                return
+            self._stopping = True
+            for conn in self._conns.values():
+                try:
+                    conn.send(('stop',))
+                except (OSError, ValueError):
+                    pass
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._collector.join(timeout)
+        with self._lock:
+            for conn in self._conns.values():
+                conn.close()
+            for future, _ in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError('Recognition service stopped'))
+            self._pending.clear()
+            self._queue.clear()
+            self._started = False
+
+    def submit(self, image_bytes, class_id=None, multi_face=False, tracks=None, gallery='student', liveness=None):
+        """
+        Queue one frame (encoded JPEG bytes); returns a Future resolving to the result dict
+        tracks is a TrackingSession snapshot; the updated one is returned as 'tracking_state'
+        liveness is a LivenessState snapshot; the updated one is returned as 'liveness_state'
+        gallery is 'student' (class attendance) or 'faculty' (event check-in)
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            self._next_job += 1
+            job_id = self._next_job
+            self._pending[job_id] = (future, time.time())
+            self._queue.append((job_id, ('job', job_id, bytes(image_bytes), class_id, bool(multi_face), tracks,
+                                          gallery, liveness)))
+            self._dispatch()
+        return future
+
+    def recognize(self, image_bytes, class_id=None, multi_face=False, timeout=None, tracks=None, gallery='student',
+                  liveness=None):
+        """Blocking submit(); raises concurrent.futures.TimeoutError when no worker answered in time"""
+        future = self.submit(image_bytes, class_id=class_id, multi_face=multi_face, tracks=tracks, gallery=gallery,
+                             liveness=liveness)
+        try:
+            return future.result(timeout=timeout or self.job_timeout)
+        except FutureTimeoutError:
+            future.cancel()  # a job still queued (not yet dispatched) is dropped instead of run for nobody
+            raise
+
+    def broadcast(self, command, arg=None):
+        """Send a gallery update ('refresh_user', 'invalidate_class', 'sync') to every worker"""
+        with self._lock:
+            if not self._started:
+                return  # workers load a fresh gallery when they start
+            for conn in self._conns.values():
+                try:
+                    conn.send(('update', command, arg))
+                except (OSError, ValueError):
+                    pass  # a dead worker reloads everything when it is restarted
+
+    def _dispatch(self):
+        """Hand queued jobs to idle, ready workers (caller holds the lock)"""
+        for worker_id, job_id in self._busy.items():
+            if not self._queue:
+                return
+            if job_id is not None or not self._stats[worker_id]['ready']:
+                continue
+            job_id, message = self._queue.popleft()
+            pending = self._pending.get(job_id)
+            if pending is None or not pending[0].set_running_or_notify_cancel():
+                self._pending.pop(job_id, None)  # cancelled while queued: never run it
+                continue
+            try:
+                self._conns[worker_id].send(message)
+            except (OSError, ValueError):
+                self._pending.pop(job_id, None)
+                self._failed += 1
+                pending[0].set_exception(RuntimeError(f'Recognition worker {worker_id} is gone'))
+                continue
+            self._busy[worker_id] = job_id
+            self._queue_wait_ms += max(0.0, time.time() - pending[1]) * 1000.0
+
+    def _collect(self):
+        while not self._stopping:
+            with self._lock:
+                conns = {conn: worker_id for worker_id, conn in self._conns.items()}
+                sentinels = {process.sentinel: worker_id for worker_id, process in self._workers.items()}
+            for ready in wait(list(conns) + list(sentinels), timeout=0.5):
+                if ready in conns:
+                    try:
+                        message = ready.recv()
+                    except (EOFError, OSError):
+                        continue  # the sentinel reports the exit
+                    self._handle(message)
+            self._check_workers()
+
+    def _handle(self, message):
+        kind = message[0]
+        with self._lock:
+            if kind == 'ready':
+                _, worker_id, pid, _ = message
+                # Measured from spawn: the models load while the child imports this module
+                load_seconds = time.time() - self._stats[worker_id]['spawned_at']
+                self._stats[worker_id].update({'ready': True, 'pid': pid, 'load_seconds': round(load_seconds, 3)})
+            elif kind == 'failed':
+                _, worker_id, pid, error = message
+                self._stats[worker_id]['error'] = error
+                print(f"❌ Recognition worker {worker_id} failed to start: {error}")
+            elif kind == 'done':
+                _, job_id, worker_id, result, elapsed_ms = message
+                self._busy[worker_id] = None
+                stats = self._stats[worker_id]
+                stats['jobs'] += 1
+                stats['total_ms'] += elapsed_ms
+                stats['last_ms'] = round(elapsed_ms, 2)
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+                self._completed += 1
+                pending = self._pending.pop(job_id, None)
+                if pending and isinstance(result, dict) and isinstance(result.get('timings'), dict):
+                    # Time outside the worker: waiting for a free worker plus the pipe round trip
+                    result['timings']['queue'] = round(max(0.0, (time.time() - pending[1]) * 1000.0 - elapsed_ms), 3)
+                if pending and not pending[0].done():
+                    pending[0].set_result(result)
+            self._dispatch()
+
+    def _check_workers(self):
+        with self._lock:
+            if self._stopping:
+                return
+            for worker_id, process in list(self._workers.items()):
+                if process.is_alive() or self._stats[worker_id].get('error'):
+                    continue
+                print(f"⚠️ Recognition worker {worker_id} exited ({process.exitcode}); restarting")
+                job_id = self._busy.get(worker_id)
+                pending = self._pending.pop(job_id, None) if job_id is not None else None
+                if pending and not pending[0].done():
+                    self._failed += 1
+                    pending[0].set_exception(RuntimeError(f'Recognition worker {worker_id} crashed'))
+                self._conns[worker_id].close()
+                self._spawn(worker_id)
+
+            # Workers that cannot even load (missing models, bad database) are not
+            # restarted; once none is left, queued jobs fail instead of timing out
+            if self._pending and all(stats.get('error') for stats in self._stats.values()):
+                for future, _ in self._pending.values():
+                    if not future.done():
+                        self._failed += 1
+                        future.set_exception(RuntimeError('No recognition worker could start'))
+                self._pending.clear()
+                self._queue.clear()
+            self._dispatch()
+
+    def metrics(self):
+        """Queue depth, in-flight jobs and per-worker latency"""
+        with self._lock:
+            in_flight = sum(1 for job_id in self._busy.values() if job_id is not None)
+            dispatched = self._completed + self._failed + in_flight
+            return {
+                'started': self._started,
+                'workers': self.worker_count,
+                'alive': sum(1 for p in self._workers.values() if p.is_alive()),
+                'queue_depth': len(self._queue),
+                'in_flight': in_flight,
+                'completed': self._completed,
+                'failed': self._failed,
+                'avg_queue_wait_ms': round(self._queue_wait_ms / dispatched, 2) if dispatched else None,
+                'per_worker': {
+                    worker_id: {
+                        'pid': stats['pid'],
+                        'ready': stats['ready'],
+                        'busy': self._busy.get(worker_id) is not None,
+                        'load_seconds': stats['load_seconds'],
+                        'jobs': stats['jobs'],
+                        'avg_ms': round(stats['total_ms'] / stats['jobs'], 2) if stats['jobs'] else None,
+                        'last_ms': stats['last_ms'],
+                        'max_ms': round(stats['max_ms'], 2),
+                        'restarts': stats['restarts'],
+                        'error': stats['error']
+                    }
+                    for worker_id, stats in self._stats.items()
+                }
+            }
@@ -26,10 +26,69 @@ class SecurityConfig:
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'known_faces')
     TEMP_FOLDER = os.environ.get('TEMP_FOLDER', 'temp')
+    # Debug capture: keep every Nth uploaded frame in a ring of this many files (0 = off)
+    DEBUG_CAPTURE_FRAMES = int(os.environ.get('DEBUG_CAPTURE_FRAMES', '0'))
+    DEBUG_CAPTURE_EVERY = int(os.environ.get('DEBUG_CAPTURE_EVERY', '10'))
     
     # Face recognition settings
     MATCH_TOLERANCE = float(os.environ.get('MATCH_TOLERANCE', '0.62'))
     
+    # Detection pipeline: HOG runs on the frame scaled by DETECTION_SCALE (1.0 = full
+    # resolution) and escalates through the upsample levels until a face is found
+    DETECTION_SCALE = float(os.environ.get('DETECTION_SCALE', '0.5'))
+    DETECTION_UPSAMPLE_TIERS = os.environ.get('DETECTION_UPSAMPLE_TIERS', '1,2')
+    # Detector backend: hog | haar | lbp | haar+hog | lbp+hog (cascade proposes, HOG confirms)
+    DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'hog')
+    DETECTOR_CASCADE_SCALE = float(os.environ.get('DETECTOR_CASCADE_SCALE', '0.25'))
+    DETECTOR_CASCADE_PATH = os.environ.get('DETECTOR_CASCADE_PATH', '')  # cascade file or directory (LBP)
+    
+    # Background check of registered photos vs. cached encodings / face_registered (seconds, 0 = off)
+    GALLERY_CHECK_INTERVAL = float(os.environ.get('GALLERY_CHECK_INTERVAL', '300'))
+    
+    # Event check-ins: most rows committed per transaction by the batched writer
+    EVENT_CHECKIN_BATCH_SIZE = int(os.environ.get('EVENT_CHECKIN_BATCH_SIZE', '200'))
+    
+    # Recognition worker processes (0 = recognize inline in the web process)
+    RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', '0'))
+    RECOGNITION_TIMEOUT = float(os.environ.get('RECOGNITION_TIMEOUT', '30'))  # seconds per frame
+    # Async recognition jobs: frames waiting longer than this are dropped; backlog cap
+    RECOGNITION_JOB_MAX_AGE = float(os.environ.get('RECOGNITION_JOB_MAX_AGE', '5'))  # seconds
+    RECOGNITION_JOB_QUEUE_LIMIT = int(os.environ.get('RECOGNITION_JOB_QUEUE_LIMIT', '32'))
+    # Near-duplicate frame cache: reuse a kiosk's result for frames whose perceptual
+    # hash (phash|ahash) is within MAX_DISTANCE of 64 bits, for TTL seconds (0 = off)
+    FRAME_CACHE_TTL = float(os.environ.get('FRAME_CACHE_TTL', '10'))
+    FRAME_CACHE_MAX_DISTANCE = int(os.environ.get('FRAME_CACHE_MAX_DISTANCE', '6'))
+    FRAME_CACHE_HASH = os.environ.get('FRAME_CACHE_HASH', 'phash')
+    # Face tracking per kiosk: full re-identification every N frames, faces are
+    # followed near their last box in between (N <= 1 disables tracking)
+    TRACK_REVERIFY_EVERY = int(os.environ.get('TRACK_REVERIFY_EVERY', '5'))
+    TRACK_IDLE_TIMEOUT = float(os.environ.get('TRACK_IDLE_TIMEOUT', '60'))  # seconds
+    # Anti-spoofing motion/blink history per kiosk: kiosks kept (least recently
+    # used dropped first) and seconds of inactivity before a kiosk's history is dropped
+    LIVENESS_MAX_KIOSKS = int(os.environ.get('LIVENESS_MAX_KIOSKS', '256'))
+    LIVENESS_IDLE_TIMEOUT = float(os.environ.get('LIVENESS_IDLE_TIMEOUT', '300'))  # seconds
+    # Stage latency metrics: rolling window for percentiles, kiosks tracked, scrape
+    # token for /metrics (empty: admin session or localhost only), and whether every
+    # detect response echoes its stage timings (admins can ask with debug_timings=1)
+    STAGE_METRICS_WINDOW = float(os.environ.get('STAGE_METRICS_WINDOW', '300'))  # seconds
+    STAGE_METRICS_MAX_KIOSKS = int(os.environ.get('STAGE_METRICS_MAX_KIOSKS', '64'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    DEBUG_TIMINGS = os.environ.get('DEBUG_TIMINGS', 'false').lower() == 'true'
+    
+    # Reference templates (several registered photos per person)
+    FACE_TEMPLATE_CAP = int(os.environ.get('FACE_TEMPLATE_CAP', '5'))  # templates kept per person
+    FACE_TEMPLATE_POLICY = os.environ.get('FACE_TEMPLATE_POLICY', 'oldest')  # 'oldest' or 'redundant'
+    TEMPLATE_MATCH_REDUCTION = os.environ.get('TEMPLATE_MATCH_REDUCTION', 'min')  # 'min' or 'mean_k'
+    TEMPLATE_MATCH_K = int(os.environ.get('TEMPLATE_MATCH_K', '2'))  # templates averaged by mean_k
+    
+    # Approximate nearest-neighbour index (campus-wide galleries)
+    ANN_MIN_GALLERY_SIZE = int(os.environ.get('ANN_MIN_GALLERY_SIZE', '5000'))  # 0 disables the index
+    ANN_NPROBE = int(os.environ.get('ANN_NPROBE', '8'))  # partitions scanned per query (recall vs latency)
+    # In-memory gallery rows: float32, float16 (1/2 the memory) or int8 (1/4); compact
+    # galleries re-rank their closest GALLERY_RERANK rows with the exact encodings
+    GALLERY_PRECISION = os.environ.get('GALLERY_PRECISION', 'float32')
+    GALLERY_RERANK = int(os.environ.get('GALLERY_RERANK', '16'))
+    
     # Database settings
     DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///facecheck.db')
 
@@ -14,6 +14,7 @@ class AntiSpoofingManager {
             enableRealTime: options.enableRealTime || false,
             checkInterval: options.checkInterval || 2000, // 2 seconds
             confidenceThreshold: options.confidenceThreshold || 0.7,
+            kioskId: options.kioskId || null, // motion history is kept per kiosk on the server
             ...options
         };
         
@@ -214,6 +215,9 @@ class AntiSpoofingManager {
     async analyzeImage(imageBlob) {
         const formData = new FormData();
         formData.append('image', imageBlob, 'capture.jpg');
+        if (this.options.kioskId) {
+            formData.append('kiosk_id', this.options.kioskId);
+        }
         
         const response = await fetch('/api/anti-spoofing/analyze', {
             method: 'POST',
@@ -329,7 +333,11 @@ class AntiSpoofingManager {
     
     async resetAnalysis() {
         try {
-            await fetch('/api/anti-spoofing/reset', { method: 'POST' });
+            const formData = new FormData();
+            if (this.options.kioskId) {
+                formData.append('kiosk_id', this.options.kioskId);
+            }
+            await fetch('/api/anti-spoofing/reset', { method: 'POST', body: formData });
             this.analysisHistory = [];
             this.updateStatus('⚪ Reset', 'Analysis state reset', 'text-gray-600');
         } catch (error) {
@@ -0,0 +1,89 @@
+"""
+Tests for the IVF approximate nearest-neighbour index
+Run: python test_ann_index.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ann_index import IVFIndex
+
+
+def random_encodings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    encs = rng.normal(size=(n, 128)).astype(np.float32)
+    return encs / np.linalg.norm(encs, axis=1, keepdims=True)
+
+
+class TestIVFIndex(unittest.TestCase):
+    """Test search, incremental updates and persistence of the IVF index"""
+
+    def setUp(self):
+        self.vectors = random_encodings(500)
+        self.ids = np.arange(1, 501)
+        self.index = IVFIndex(nprobe=4)
+        self.index.train(self.vectors)
+        self.index.add(self.ids, self.vectors)
+
+    def test_full_probe_is_exact(self):
+        """Scanning every partition returns the true nearest neighbour"""
+        query = self.vectors[123] + 0.01
+        ids, dists = self.index.search(query, k=3, nprobe=self.index.n_lists)
+        expected = np.argsort(np.linalg.norm(self.vectors - query, axis=1))[:3] + 1
+        np.testing.assert_array_equal(ids, expected)
+        self.assertTrue(np.all(np.diff(dists) >= 0))
+
+    def test_enrolled_identity_found(self):
+        """A query equal to an enrolled vector always lands in that vector's partition"""
+        for row in (0, 250, 499):
+            ids, dists = self.index.search(self.vectors[row], k=1, nprobe=1)
+            self.assertEqual(int(ids[0]), row + 1)
+            self.assertAlmostEqual(float(dists[0]), 0.0, places=5)
+
+    def test_insert_and_delete(self):
+        new_vector = random_encodings(1, seed=7)[0]
+        self.index.add([9999], [new_vector])
+        self.assertEqual(len(self.index), 501)
+        self.assertEqual(int(self.index.search(new_vector)[0][0]), 9999)
+
+        self.assertTrue(self.index.remove(9999))
+        self.assertFalse(self.index.remove(9999))
+        self.assertNotIn(9999, self.index)
+        self.assertNotEqual(int(self.index.search(new_vector)[0][0]), 9999)
+
+    def test_re_adding_moves_identity(self):
+        """Adding an existing id replaces its vector instead of duplicating it"""
+        self.index.add([1], [self.vectors[200]])
+        self.assertEqual(len(self.index), 500)
+        ids, _ = self.index.search(self.vectors[200], k=2, nprobe=self.index.n_lists)
+        self.assertEqual(sorted(int(i) for i in ids), [1, 201])
+
+    def test_save_load_and_reconcile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'facecheck_ann.npz')
+            self.index.save(path)
+            loaded = IVFIndex.load(path)
+
+        self.assertEqual(len(loaded), 500)
+        self.assertEqual(loaded.nprobe, 4)
+        np.testing.assert_array_equal(loaded.search(self.vectors[10])[0], self.index.search(self.vectors[10])[0])
+
+        # Gallery moved on: id 1 dropped, id 2 re-registered, id 600 new
+        ids = np.concatenate([self.ids[1:], [600]])
+        vectors = np.concatenate([self.vectors[1:], random_encodings(1, seed=3)])
+        vectors[0] = random_encodings(1, seed=4)[0]
+        changed = loaded.reconcile(ids, vectors)
+        self.assertEqual(changed, 2)
+        self.assertNotIn(1, loaded)
+        self.assertEqual(int(loaded.search(vectors[0], nprobe=loaded.n_lists)[0][0]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,128 @@
+"""
+Tests for the cheap-first anti-spoofing cascade
+Run: python test_anti_spoofing_cascade.py
+"""
+
+import os
+import sys
+import itertools
+import unittest
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from anti_spoofing import AntiSpoofingDetector
+
+CHECK_METHODS = {
+    'print_detection': 'detect_print_artifacts',
+    'edge_analysis': 'check_edge_characteristics',
+    'texture_analysis': 'analyze_texture_lbp',
+    'color_analysis': 'analyze_color_distribution',
+    'reflection_analysis': 'detect_specular_reflection',
+    'motion_analysis': 'analyze_motion_patterns'
+}
+IMAGE = np.zeros((120, 120, 3), dtype=np.uint8)
+LOCATION = (10, 110, 110, 10)
+
+
+def scripted_detector(outcomes, calls=None):
+    """A detector whose checks return the given pass/fail outcomes (and record their calls)"""
+    detector = AntiSpoofingDetector()
+
+    def scripted(name):
+        def check(*args):
+            if calls is not None:
+                calls.append(name)
+            passed = outcomes[name]
+            if name == 'reflection_analysis':
+                return passed, 0.0 if passed else 0.5
+            return passed, 0.7
+        return check
+
+    for name, method in CHECK_METHODS.items():
+        setattr(detector, method, scripted(name))
+    return detector
+
+
+class TestAntiSpoofingCascade(unittest.TestCase):
+
+    def test_decision_matches_full_evaluation(self):
+        for values in itertools.product((True, False), repeat=len(CHECK_METHODS)):
+            outcomes = dict(zip(CHECK_METHODS, values))
+            for strict, photo in itertools.product((False, True), repeat=2):
+                detector = scripted_detector(outcomes)
+                detector.strict_mode = strict
+                detector.PHOTO_DETECTION_ENABLED = photo
+                full = detector.comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION, cascade=False)
+                cascade = detector.comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION, cascade=True)
+
+                context = (outcomes, strict, photo)
+                self.assertEqual(full['skipped'], [])
+                # Downstream code reads the confidence too, so it must not depend on the cascade either
+                self.assertEqual((cascade['is_live'], cascade['confidence'], cascade['details']),
+                                 (full['is_live'], full['confidence'], full['details']), context)
+                if cascade['skipped']:
+                    self.assertFalse(cascade['is_live'], context)
+                self.assertEqual(set(cascade['checks']) | set(cascade['skipped']), set(full['checks']))
+
+    def test_full_evaluation_is_unchanged(self):
+        # Two critical failures: the photo/video verdict with the critical confidence
+        outcomes = dict.fromkeys(CHECK_METHODS, True)
+        outcomes.update(print_detection=False, edge_analysis=False)
+        result = scripted_detector(outcomes).comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION, cascade=False)
+        self.assertEqual((result['is_live'], result['confidence']), (False, 0.0))
+        self.assertIn('consistent with photo/video', result['details'])
+
+        # One critical failure: the weighted score decides (0.45 of 1.0 >= 0.40)
+        outcomes.update(print_detection=True, color_analysis=False)
+        result = scripted_detector(outcomes).comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION, cascade=False)
+        self.assertTrue(result['is_live'])
+        self.assertAlmostEqual(result['confidence'], 0.60)
+        self.assertEqual(list(result['checks']), list(CHECK_METHODS))
+
+    def test_all_pass_reports_the_full_confidence(self):
+        calls = []
+        detector = scripted_detector(dict.fromkeys(CHECK_METHODS, True), calls)
+        full = detector.comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION, cascade=False)
+        result = detector.comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION)
+
+        # A face that may be live runs every check: its confidence is the full weighted score
+        self.assertEqual(result['skipped'], [])
+        self.assertEqual((result['is_live'], result['confidence']), (True, 1.0))
+        self.assertEqual(result['confidence'], full['confidence'])
+
+    def test_critical_rejection_skips_the_supporting_checks(self):
+        calls = []
+        outcomes = dict.fromkeys(CHECK_METHODS, True)
+        outcomes.update(print_detection=False, edge_analysis=False)
+        result = scripted_detector(outcomes, calls).comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION)
+
+        # Motion always runs first (it records the frame), then the critical checks settle it
+        self.assertEqual(calls, ['motion_analysis', 'edge_analysis', 'print_detection'])
+        self.assertEqual(sorted(result['skipped']), ['color_analysis', 'reflection_analysis', 'texture_analysis'])
+        self.assertEqual((result['is_live'], result['confidence']), (False, 0.0))
+
+        # One critical failure leaves the decision to the weighted score: everything runs
+        calls.clear()
+        outcomes['print_detection'] = True
+        result = scripted_detector(outcomes, calls).comprehensive_anti_spoofing_check(IMAGE, {}, LOCATION)
+        self.assertEqual(sorted(calls), sorted(CHECK_METHODS))
+        self.assertTrue(result['is_live'])
+
+    def test_cascade_order_follows_cost_per_weight(self):
+        detector = AntiSpoofingDetector()
+        checks = detector.check_table(IMAGE, {})
+        detector.CHECK_COST_MS = {'print_detection': 6.0, 'edge_analysis': 0.9, 'texture_analysis': 0.6,
+                                  'color_analysis': 2.0, 'reflection_analysis': 0.2, 'motion_analysis': 5.0}
+        self.assertEqual(detector.cascade_order(checks),
+                         ['motion_analysis', 'edge_analysis', 'print_detection', 'reflection_analysis',
+                          'texture_analysis', 'color_analysis'])
+
+        detector.CHECK_COST_MS = dict(detector.CHECK_COST_MS, print_detection=0.01)
+        self.assertEqual(detector.cascade_order(checks)[:3], ['motion_analysis', 'print_detection', 'edge_analysis'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
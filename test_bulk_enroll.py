@@ -0,0 +1,164 @@
+"""
+Tests for bulk face enrollment
+Run: python test_bulk_enroll.py
+"""
+
+import os
+import sys
+import csv
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bulk_enroll
+from bulk_enroll import BulkEnroller, PhotoSource, load_journal, write_report
+from face_encoding_store import FaceEncodingStore
+from test_face_encoding_store import create_test_schema
+
+ENCODE_PHOTO = bulk_enroll.encode_photo
+
+
+def fake_encode(task):
+    """Stands in for the dlib worker: b'noface' has no face, anything else encodes"""
+    name, data = task
+    if data == b'noface':
+        return {'file': name, 'status': 'no_face', 'message': "No face detected"}
+    return {'file': name, 'status': 'ok', 'message': "ok",
+            'encoding': np.full(128, len(data) / 100.0), 'jpeg': b'jpeg:' + data}
+
+
+class TestBulkEnroll(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'test.db')
+        create_test_schema(self.db)
+        conn = sqlite3.connect(self.db)
+        for n, idno in enumerate(('S001', 'S002', 'S003'), start=1):
+            conn.execute("INSERT INTO user (user_id, idno, role) VALUES (?, ?, 'student')", (n, idno))
+            conn.execute("INSERT INTO student (student_id, user_id) VALUES (?, ?)", (n + 10, n))
+        conn.commit()
+        conn.close()
+
+        self.photos = os.path.join(self.tmp, 'photos')
+        os.makedirs(os.path.join(self.photos, 'section_a'))
+        self.write_photo('S001.jpg', b'face one')
+        self.write_photo('section_a/S002.JPG', b'face two')
+        self.write_photo('S003.png', b'noface')
+        self.write_photo('S999.jpg', b'stranger')
+        self.write_photo('readme.txt', b'not a photo')
+
+        patcher = mock.patch.object(bulk_enroll, 'encode_photo', fake_encode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write_photo(self, name, data):
+        with open(os.path.join(self.photos, name), 'wb') as f:
+            f.write(data)
+
+    def enroller(self, workers=0, **kwargs):
+        return BulkEnroller(self.db, faces_dir=os.path.join(self.tmp, 'known_faces'), workers=workers,
+                            batch_size=2, **kwargs)
+
+    def test_directory_and_zip_sources(self):
+        archive = os.path.join(self.tmp, 'photos.zip')
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('batch/S001.jpg', b'face one')
+            z.writestr('__MACOSX/batch/._S001.jpg', b'metadata')
+            z.writestr('batch/.hidden.jpg', b'x')
+            z.writestr('batch/list.csv', b'x')
+        with PhotoSource(archive) as source:
+            self.assertEqual(source.names(), ['batch/S001.jpg'])
+            self.assertEqual(source.read('batch/S001.jpg'), b'face one')
+        with PhotoSource(self.photos) as source:
+            self.assertEqual(source.names(), ['S001.jpg', 'S003.png', 'S999.jpg', 'section_a/S002.JPG'])
+        with self.assertRaises(ValueError):
+            PhotoSource(os.path.join(self.tmp, 'missing'))
+
+    def test_enrolls_and_reports_failures(self):
+        stats = self.enroller().run(self.photos)
+        self.assertEqual(stats, {'enrolled': 2, 'failed': 2, 'skipped': 0})
+
+        conn = sqlite3.connect(self.db)
+        images = dict(conn.execute('SELECT student_id, attendance_image FROM student').fetchall())
+        conn.close()
+        self.assertIsNone(images[13])
+        self.assertTrue(os.path.basename(images[11]).startswith('S001_'))
+        with open(images[11], 'rb') as f:
+            self.assertEqual(f.read(), b'jpeg:face one')
+
+        store = FaceEncodingStore(self.db)
+        self.assertEqual(store.get_encoding('student', 12)['image_path'], images[12])
+        self.assertEqual(len(store.get_templates('student', 11)), 1)
+
+        journal = load_journal(self.photos + '.enroll.jsonl')
+        report = os.path.join(self.tmp, 'report.csv')
+        self.assertEqual(write_report(journal, report), 2)
+        with open(report, newline='', encoding='utf-8') as f:
+            rows = {row['file']: row['status'] for row in csv.DictReader(f)}
+        self.assertEqual(rows, {'S003.png': 'no_face', 'S999.jpg': 'unknown_student'})
+
+    def test_resume_skips_handled_files(self):
+        self.enroller().run(self.photos)
+        self.write_photo('S001.jpg', b'face one, retaken')
+
+        stats = self.enroller().run(self.photos)
+        # S001 changed and is re-enrolled; S002 and the failed S003 are skipped;
+        # the unknown idno is checked again
+        self.assertEqual(stats, {'enrolled': 1, 'failed': 1, 'skipped': 2})
+        self.assertEqual(len(FaceEncodingStore(self.db).get_templates('student', 11)), 2)
+
+        stats = self.enroller(retry_failed=True).run(self.photos)
+        self.assertEqual(stats, {'enrolled': 0, 'failed': 2, 'skipped': 2})
+        self.assertEqual(self.enroller(force=True).run(self.photos)['enrolled'], 2)
+
+    def test_failed_batch_is_rolled_back(self):
+        enroller = self.enroller()
+        with mock.patch.object(enroller.store, 'save_encoding', side_effect=sqlite3.OperationalError('locked')):
+            with self.assertRaises(sqlite3.OperationalError):
+                enroller.run(self.photos)
+        self.assertEqual(os.listdir(os.path.join(self.tmp, 'known_faces')), [])
+        # Nothing was journaled as enrolled, so the next run does the work
+        self.assertEqual(self.enroller().run(self.photos)['enrolled'], 2)
+
+    def test_photo_that_raises_is_reported_and_the_run_goes_on(self):
+        def crashing_encode(task):
+            if task[1] == b'face two':
+                raise MemoryError("worker ran out of memory")
+            return fake_encode(task)
+
+        # The pool's futures re-raise what the worker raised
+        with mock.patch.object(bulk_enroll, 'encode_photo', crashing_encode), \
+                mock.patch.object(bulk_enroll, 'ProcessPoolExecutor',
+                                  lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)):
+            stats = self.enroller(workers=2).run(self.photos)
+        self.assertEqual(stats, {'enrolled': 1, 'failed': 3, 'skipped': 0})
+
+        entry = load_journal(self.photos + '.enroll.jsonl')['section_a/S002.JPG']
+        self.assertEqual((entry['status'], entry['idno']), ('error', 'S002'))
+        self.assertIn('out of memory', entry['message'])
+        self.assertEqual(write_report(load_journal(self.photos + '.enroll.jsonl'),
+                                      os.path.join(self.tmp, 'report.csv')), 3)
+
+    def test_worker_errors_become_results(self):
+        image = bulk_enroll.cv2.imencode('.jpg', np.zeros((120, 120, 3), np.uint8))[1].tobytes()
+        with mock.patch.object(bulk_enroll, 'compute_face_encoding', side_effect=RuntimeError("dlib failed")):
+            result = ENCODE_PHOTO(('S001.jpg', image))
+        self.assertEqual((result['file'], result['status']), ('S001.jpg', 'error'))
+        self.assertEqual(result['message'], "RuntimeError: dlib failed")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
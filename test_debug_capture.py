@@ -0,0 +1,83 @@
+"""
+Tests for in-memory frame ingestion and the debug capture ring
+Run: python test_debug_capture.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from debug_capture import FrameCaptureRing
+
+try:
+    import cv2
+    from opencv_face_detector import load_image
+    from recognition_service import decode_image, decode_frame
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+
+class TestFrameCaptureRing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_disabled_by_default(self):
+        ring = FrameCaptureRing(self.directory)
+        self.assertFalse(ring.enabled)
+        self.assertIsNone(ring.capture(b'jpeg'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_ring_is_bounded(self):
+        ring = FrameCaptureRing(self.directory, capacity=3, every=2)
+        for n in range(20):
+            ring.capture(f'frame-{n}'.encode(), 'detect')
+        self.assertEqual(sorted(os.listdir(self.directory)), ['frame_000.jpg', 'frame_001.jpg', 'frame_002.jpg'])
+        stats = ring.stats()
+        self.assertEqual((stats['frames_seen'], stats['frames_written']), (20, 10))
+        # Sampled frames are 0, 2, ..., 18; the last three written are 14, 16, 18
+        contents = {open(os.path.join(self.directory, name), 'rb').read() for name in os.listdir(self.directory)}
+        self.assertEqual(contents, {b'frame-14', b'frame-16', b'frame-18'})
+
+
+@unittest.skipUnless(OPENCV_AVAILABLE, "OpenCV not installed")
+class TestInMemoryDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.bgr = np.zeros((40, 60, 3), dtype=np.uint8)
+        self.bgr[:, :, 2] = 200  # red in BGR
+        self.png = cv2.imencode('.png', self.bgr)[1].tobytes()
+
+    def test_decode_matches_imread(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'frame.png')
+            with open(path, 'wb') as f:
+                f.write(self.png)
+            np.testing.assert_array_equal(decode_image(self.png), cv2.imread(path))
+            np.testing.assert_array_equal(load_image(path), load_image(self.png))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def test_decode_frame_is_rgb(self):
+        self.assertEqual(decode_frame(self.png)[0, 0].tolist(), [200, 0, 0])
+        self.assertIs(load_image(self.bgr), self.bgr)
+
+    def test_garbage_is_none(self):
+        self.assertIsNone(decode_image(b'not an image'))
+        self.assertIsNone(load_image(b'not an image'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
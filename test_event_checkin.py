@@ -0,0 +1,104 @@
+"""
+Tests for batched event check-ins
+Run: python test_event_checkin.py
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from event_checkin import EventCheckinWriter, MARKED, DUPLICATE
+
+
+class TestEventCheckinWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'test.db')
+        conn = sqlite3.connect(self.db)
+        conn.execute("""
+            CREATE TABLE event_attendance (
+                event_attend_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                attendance_time DATETIME NOT NULL,
+                status VARCHAR(10) NOT NULL CHECK (status IN ('present', 'absent', 'late')),
+                event_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL
+            )
+        """)
+        conn.execute("INSERT INTO event_attendance (attendance_time, status, event_id, user_id) "
+                     "VALUES ('2026-01-05 08:00:00', 'present', 1, 5)")
+        conn.commit()
+        conn.close()
+        self.writer = EventCheckinWriter(self.db)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def rows(self):
+        conn = sqlite3.connect(self.db)
+        try:
+            return conn.execute('SELECT event_id, user_id, status FROM event_attendance ORDER BY event_attend_id').fetchall()
+        finally:
+            conn.close()
+
+    def test_burst_is_written_in_batches(self):
+        # Hold the writer on its first batch so the rest of the burst queues up behind it
+        release = threading.Event()
+        write = self.writer._write
+
+        def slow_write(batch):
+            release.wait(5)
+            write(batch)
+
+        with mock.patch.object(self.writer, '_write', slow_write):
+            futures = [self.writer.submit(1, user_id) for user_id in range(100, 150)]
+            release.set()
+            results = [f.result(timeout=10) for f in futures]
+
+        self.assertTrue(all(r['status'] == MARKED for r in results))
+        self.assertEqual(len(self.rows()), 51)
+        stats = self.writer.stats()
+        self.assertEqual(stats['marked'], 50)
+        self.assertLessEqual(stats['batches'], 2)
+
+    def test_duplicates_are_suppressed(self):
+        # Checked in before the writer started: answered from memory with the first time
+        self.assertEqual(self.writer.check_in(1, 5), {'status': DUPLICATE, 'attendance_time': '2026-01-05 08:00:00'})
+        first = self.writer.check_in(1, 6, 'late')
+        self.assertEqual(first['status'], MARKED)
+        self.assertEqual(self.writer.check_in(1, 6)['status'], DUPLICATE)
+        self.assertEqual(self.writer.check_in(2, 6)['status'], MARKED)  # another event
+        self.assertEqual(self.rows(), [(1, 5, 'present'), (1, 6, 'late'), (2, 6, 'present')])
+
+        # A second process's writer finds the row under the write lock
+        other = EventCheckinWriter(self.db)
+        other._checked_in(3)
+        conn = sqlite3.connect(self.db)
+        conn.execute("INSERT INTO event_attendance (attendance_time, status, event_id, user_id) "
+                     "VALUES ('2026-01-05 09:00:00', 'present', 3, 7)")
+        conn.commit()
+        conn.close()
+        self.assertEqual(other.check_in(3, 7), {'status': DUPLICATE, 'attendance_time': '2026-01-05 09:00:00'})
+        self.assertEqual(len(self.rows()), 4)
+
+    def test_failed_batch_can_be_retried(self):
+        with mock.patch.object(self.writer, '_connect', side_effect=[self.writer._connect(),
+                                                                     sqlite3.OperationalError('locked')]):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.writer.check_in(1, 8)
+        self.assertEqual(self.writer.check_in(1, 8)['status'], MARKED)
+        self.assertEqual(self.writer.stats()['errors'], 1)
+        with self.assertRaises(ValueError):
+            self.writer.submit(1, 9, 'excused')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,84 @@
+"""
+Tests for the shared anti-spoofing face-crop preprocessing
+Run: python test_face_crop.py
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+import cv2
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_crop import FaceCropPreprocessor
+from anti_spoofing import AntiSpoofingDetector
+
+
+def frame(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+class TestFaceCrop(unittest.TestCase):
+
+    def setUp(self):
+        self.preprocessor = FaceCropPreprocessor()
+
+    def test_crop_has_the_analysis_size_at_any_resolution(self):
+        for height, width in ((480, 640), (960, 1280), (1080, 1920)):
+            image = frame(height, width)
+            box = (height // 4, width * 3 // 4, height * 3 // 4, width // 4)
+            crop = self.preprocessor.prepare(image, box, 128)
+            self.assertEqual((crop.shape, crop.gray.shape, crop.hsv.shape, crop.lab.shape),
+                             ((128, 128, 3), (128, 128), (128, 128, 3), (128, 128, 3)))
+
+        top, right, bottom, left = box
+        expected = cv2.resize(image[top:bottom, left:right], (128, 128), interpolation=cv2.INTER_AREA)
+        np.testing.assert_array_equal(crop.image, expected)
+        np.testing.assert_array_equal(crop.gray, cv2.cvtColor(expected, cv2.COLOR_BGR2GRAY))
+        np.testing.assert_array_equal(crop.lab, cv2.cvtColor(expected, cv2.COLOR_BGR2LAB))
+        self.assertIsNone(self.preprocessor.prepare(image, (10, 10, 10, 10), 128))
+
+    def test_scratch_buffers_are_reused_per_thread(self):
+        first = self.preprocessor.prepare(frame(480, 640, 1), (100, 400, 300, 200), 128)
+        buffers = (first.image, first.gray)
+        second = self.preprocessor.prepare(frame(960, 1280, 2), (200, 800, 600, 400), 128)
+        self.assertIs(second.image, buffers[0])
+        self.assertIs(second.gray, buffers[1])
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(
+            self.preprocessor.prepare(frame(480, 640, 3), (100, 400, 300, 200), 128).image))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], buffers[0])
+
+    def test_native_size_matches_the_raw_region(self):
+        # ANALYSIS_SIZE None: the checks see exactly what they saw before the preprocessing
+        image = frame(240, 320, 4)
+        box = (40, 250, 200, 90)
+        top, right, bottom, left = box
+        region = image[top:bottom, left:right]
+        crop = self.preprocessor.prepare(image, box, None)
+        detector = AntiSpoofingDetector()
+        for check in (detector.detect_print_artifacts, detector.check_edge_characteristics,
+                      detector.analyze_texture_lbp, detector.analyze_color_distribution,
+                      detector.detect_specular_reflection):
+            self.assertEqual(check(crop), check(region))
+
+    def test_detector_uses_the_analysis_crop(self):
+        detector = AntiSpoofingDetector()
+        seen = []
+        edge = detector.check_edge_characteristics
+        detector.check_edge_characteristics = lambda crop: seen.append(crop.shape) or edge(crop)
+        for height, width in ((480, 640), (1080, 1920)):
+            box = (height // 4, width * 3 // 4, height * 3 // 4, width // 4)
+            detector.comprehensive_anti_spoofing_check(frame(height, width), {}, box, cascade=False)
+        self.assertEqual(seen, [(128, 128, 3), (128, 128, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
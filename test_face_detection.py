@@ -0,0 +1,155 @@
+"""
+Tests for the resolution-aware face detection pipeline
+Run: python test_face_detection.py
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import face_detection
+from face_detection import (FaceDetectionPipeline, CascadeDetector, CascadeThenVerifyDetector, create_detector,
+                            cascade_box_to_location, parse_upsample_tiers, scale_location)
+
+
+class RecordingDetector:
+    """Returns a fixed box from the first upsample level that 'sees' the face"""
+
+    def __init__(self, box, found_at_upsample):
+        self.box = box
+        self.found_at_upsample = found_at_upsample
+        self.calls = []
+
+    def face_locations(self, image, number_of_times_to_upsample=1, model="hog"):
+        self.calls.append((image.shape[1], number_of_times_to_upsample))
+        return [self.box] if number_of_times_to_upsample >= self.found_at_upsample else []
+
+
+class TestFaceDetectionPipeline(unittest.TestCase):
+    """Test downscaling, box mapping and upsample escalation"""
+
+    def run_detect(self, pipeline, frame, detector):
+        with mock.patch.object(face_detection, 'face_recognition', detector, create=True), \
+                mock.patch.object(face_detection, 'FACE_RECOGNITION_AVAILABLE', True):
+            return pipeline.detect(frame)
+
+    def test_boxes_mapped_to_full_resolution(self):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        detector = RecordingDetector((100, 300, 200, 200), found_at_upsample=1)
+        locations, tier = self.run_detect(FaceDetectionPipeline(scale=0.5), frame, detector)
+
+        self.assertEqual(detector.calls, [(640, 1)])
+        self.assertEqual(locations, [(200, 600, 400, 400)])
+        self.assertEqual(tier['tier'], 0)
+        self.assertEqual(tier['scale'], 0.5)
+        self.assertEqual(tier['detect_size'], [640, 360])
+
+    def test_escalates_only_when_nothing_found(self):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        detector = RecordingDetector((10, 20, 30, 5), found_at_upsample=2)
+        locations, tier = self.run_detect(FaceDetectionPipeline(scale=0.5, upsample_tiers=(1, 2)), frame, detector)
+
+        self.assertEqual(detector.calls, [(640, 1), (640, 2)])
+        self.assertEqual((tier['tier'], tier['upsample']), (1, 2))
+        self.assertEqual(locations, [(20, 40, 60, 10)])
+
+    def test_no_tier_finds_a_face(self):
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        detector = RecordingDetector((0, 1, 1, 0), found_at_upsample=9)
+        self.assertEqual(self.run_detect(FaceDetectionPipeline(), frame, detector), ([], None))
+
+    def test_small_frames_are_not_shrunk_below_min_width(self):
+        pipeline = FaceDetectionPipeline(scale=0.25, min_width=320)
+        self.assertEqual(pipeline.effective_scale((720, 1280, 3)), 0.25)
+        self.assertAlmostEqual(pipeline.effective_scale((480, 640, 3)), 0.5)
+        self.assertEqual(pipeline.effective_scale((240, 320, 3)), 1.0)
+        self.assertEqual(FaceDetectionPipeline(scale=1.0).effective_scale((720, 1280, 3)), 1.0)
+
+    def test_pipeline_for_known_face_width(self):
+        roi = FaceDetectionPipeline(model='hog').for_face_width(200)
+        self.assertEqual((roi.scale, roi.upsample_tiers, roi.min_width), (0.5, (0, 1), 0))
+        self.assertEqual(FaceDetectionPipeline().for_face_width(60).scale, 1.0)
+
+    def test_scale_location_clips(self):
+        self.assertEqual(scale_location((10, 700, 400, -3), 2.0, (720, 1280)), (20, 1280, 720, 0))
+
+    def test_parse_upsample_tiers(self):
+        self.assertEqual(parse_upsample_tiers('1,2,3'), (1, 2, 3))
+        self.assertEqual(parse_upsample_tiers(' 0 , 1 '), (0, 1))
+        self.assertEqual(parse_upsample_tiers('bad'), (1, 2))
+        self.assertEqual(parse_upsample_tiers(''), (1, 2))
+
+
+class FixedDetector:
+    """Backend stub: fixed boxes, records the image sizes it was asked to search"""
+
+    def __init__(self, locations, kind='haar'):
+        self.locations = locations
+        self.kind = kind
+        self.calls = []
+
+    def for_face_width(self, face_width):
+        return self
+
+    def detect(self, rgb_image):
+        self.calls.append(rgb_image.shape[:2])
+        return (list(self.locations), {'tier': 0}) if self.locations else ([], None)
+
+
+class TestDetectorBackends(unittest.TestCase):
+    """Cascade box mapping, cascade-then-verify and backend selection"""
+
+    def test_cascade_box_matches_hog_framing(self):
+        # (x, y, w, h) on a half-size image -> shifted down, shrunk, full resolution
+        self.assertEqual(cascade_box_to_location((100, 100, 200, 200), 2.0, (960, 1280)), (234, 568, 603, 198))
+
+    def test_verifier_only_searches_candidate_windows(self):
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        cascade = FixedDetector([(100, 300, 200, 200), (300, 600, 400, 500)])
+        verifier = FixedDetector([(40, 120, 120, 40)])
+        locations, info = CascadeThenVerifyDetector(cascade, verifier, margin=0.3).detect(frame)
+
+        # Each window is the candidate grown by 30%; confirmed boxes map back into the frame
+        self.assertEqual(verifier.calls, [(160, 160), (160, 160)])
+        self.assertEqual(locations, [(110, 290, 190, 210), (310, 590, 390, 510)])
+        self.assertEqual((info['backend'], info['candidates'], info['verified']), ('haar+hog', 2, 2))
+
+    def test_unconfirmed_candidates_fall_back_to_full_frame(self):
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        verifier = FixedDetector([])
+        detector = CascadeThenVerifyDetector(FixedDetector([(100, 300, 200, 200)]), verifier)
+        self.assertEqual(detector.detect(frame), ([], None))
+        self.assertEqual(verifier.calls[-1], (480, 640))  # the whole frame was searched too
+
+        detector.fallback = False
+        verifier.calls = []
+        detector.detect(frame)
+        self.assertEqual(verifier.calls, [(160, 160)])
+
+    def test_haar_cascade_on_empty_frame(self):
+        detector = CascadeDetector('haar')
+        self.assertEqual(detector.detect(np.zeros((480, 640, 3), dtype=np.uint8)), ([], None))
+        self.assertEqual(detector.for_face_width(96).scale, 0.5)
+        self.assertIs(detector.for_face_width(96).classifier, detector.classifier)
+
+    def test_create_detector_backends(self):
+        self.assertIsInstance(create_detector('hog'), FaceDetectionPipeline)
+        self.assertIsInstance(create_detector('haar'), CascadeDetector)
+        combined = create_detector('HAAR+hog', scale=0.4)
+        self.assertIsInstance(combined, CascadeThenVerifyDetector)
+        self.assertEqual(combined.verifier.scale, 0.4)
+
+    def test_unavailable_backend_falls_back_to_hog(self):
+        self.assertIsInstance(create_detector('mtcnn'), FaceDetectionPipeline)
+        with mock.patch.object(face_detection, 'load_cascade', return_value=None):
+            self.assertIsInstance(create_detector('lbp+hog'), FaceDetectionPipeline)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,237 @@
+"""
+Tests for the persistent face encoding store
+Run: python test_face_encoding_store.py
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+import sys
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_encoding_store import FaceEncodingStore, blob_to_encoding, encoding_to_blob
+
+
+def create_test_schema(db_path):
+    """Create the minimal user/student/faculty schema used by the store"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE user (
+            user_id INTEGER PRIMARY KEY,
+            idno TEXT UNIQUE,
+            firstname TEXT,
+            lastname TEXT,
+            role TEXT,
+            is_active BOOLEAN DEFAULT 1
+        );
+        CREATE TABLE student (
+            student_id INTEGER PRIMARY KEY,
+            year_level TEXT,
+            attendance_image TEXT,
+            user_id INTEGER
+        );
+        CREATE TABLE faculty (
+            faculty_id INTEGER PRIMARY KEY,
+            position TEXT,
+            user_id INTEGER,
+            attendance_image TEXT
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+
+class TestFaceEncodingStore(unittest.TestCase):
+    """Test caching and loading of face encodings"""
+
+    def setUp(self):
+        self.test_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.test_db.close()
+        create_test_schema(self.test_db.name)
+        self.store = FaceEncodingStore(self.test_db.name)
+
+    def tearDown(self):
+        if os.path.exists(self.test_db.name):
+            os.unlink(self.test_db.name)
+
+    def test_blob_round_trip(self):
+        """Encodings survive serialization unchanged"""
+        encoding = np.random.rand(128)
+        np.testing.assert_array_equal(blob_to_encoding(encoding_to_blob(encoding)), encoding)
+
+    def test_save_and_replace(self):
+        """Saving twice for the same owner replaces the cached row"""
+        first = np.random.rand(128)
+        second = np.random.rand(128)
+        self.store.save_encoding('student', 1, 'known_faces/a.jpg', first, image_hash='aaa')
+        self.store.save_encoding('student', 1, 'known_faces/b.jpg', second, image_hash='bbb')
+
+        cached = self.store.get_encoding('student', 1)
+        self.assertEqual(cached['image_path'], 'known_faces/b.jpg')
+        self.assertEqual(cached['image_hash'], 'bbb')
+        np.testing.assert_array_equal(cached['encoding'], second)
+        self.assertEqual(self.store.stats(), {'student': 1})
+
+    def test_rejects_bad_input(self):
+        """Wrong owner types and encoding shapes are refused"""
+        with self.assertRaises(ValueError):
+            self.store.save_encoding('admin', 1, 'x.jpg', np.zeros(128), image_hash='x')
+        with self.assertRaises(ValueError):
+            self.store.save_encoding('student', 1, 'x.jpg', np.zeros(64), image_hash='x')
+
+    def test_load_student_gallery_uses_cache(self):
+        """Cached students are returned without touching their image files"""
+        conn = sqlite3.connect(self.test_db.name)
+        conn.execute("INSERT INTO user VALUES (1, '1001', 'Ana', 'Cruz', 'student', 1)")
+        conn.execute("INSERT INTO student VALUES (1, '1st Year', 'known_faces/does_not_exist.jpg', 1)")
+        conn.commit()
+        conn.close()
+
+        encoding = np.random.rand(128)
+        self.store.save_encoding('student', 1, 'known_faces/does_not_exist.jpg', encoding, image_hash='h')
+
+        gallery = self.store.load_student_gallery()
+        self.assertEqual(len(gallery), 1)
+        self.assertEqual(gallery[0]['firstname'], 'Ana')
+        np.testing.assert_array_equal(gallery[0]['encoding'], encoding)
+
+    def test_load_faculty_gallery(self):
+        """Faculty load from their own rows and templates, keyed by faculty_id"""
+        conn = sqlite3.connect(self.test_db.name)
+        conn.execute("INSERT INTO user VALUES (1, '1001', 'Ana', 'Cruz', 'student', 1)")
+        conn.execute("INSERT INTO student VALUES (1, '1st Year', 'known_faces/ana.jpg', 1)")
+        conn.execute("INSERT INTO user VALUES (2, 'F001', 'Ben', 'Reyes', 'faculty', 1)")
+        conn.execute("INSERT INTO faculty VALUES (7, 'Dean', 2, 'known_faces/faculty_F001.jpg')")
+        conn.commit()
+        conn.close()
+
+        student, faculty = np.random.rand(128), np.random.rand(128)
+        self.store.save_encoding('student', 1, 'known_faces/ana.jpg', student, image_hash='s')
+        self.store.save_encoding('faculty', 7, 'known_faces/faculty_F001.jpg', faculty, image_hash='f')
+
+        gallery = self.store.load_faculty_gallery()
+        self.assertEqual([(g['faculty_id'], g['user_id'], g['firstname']) for g in gallery], [(7, 2, 'Ben')])
+        np.testing.assert_array_equal(gallery[0]['encoding'], faculty)
+        self.assertEqual(self.store.registered_faculty_ids(), {7})
+        np.testing.assert_array_equal(self.store.load_faculty_templates([7])[7], faculty[None, :])
+        self.assertEqual([g['student_id'] for g in self.store.load_student_gallery()], [1])
+
+    def test_stale_cache_entry_is_skipped(self):
+        """A cache row for an old photo path is not used for a re-registered student"""
+        conn = sqlite3.connect(self.test_db.name)
+        conn.execute("INSERT INTO user VALUES (1, '1001', 'Ana', 'Cruz', 'student', 1)")
+        conn.execute("INSERT INTO student VALUES (1, '1st Year', 'known_faces/new.jpg', 1)")
+        conn.commit()
+        conn.close()
+
+        self.store.save_encoding('student', 1, 'known_faces/old.jpg', np.random.rand(128), image_hash='h')
+
+        # The new file does not exist here, so it cannot be encoded and is skipped
+        self.assertEqual(self.store.load_student_gallery(), [])
+
+
+    def _add_student(self, student_id=1, image='known_faces/current.jpg'):
+        conn = sqlite3.connect(self.test_db.name)
+        conn.execute("INSERT INTO user VALUES (?, ?, 'Ana', 'Cruz', 'student', 1)", (student_id, str(1000 + student_id)))
+        conn.execute("INSERT INTO student VALUES (?, '1st Year', ?, ?)", (student_id, image, student_id))
+        conn.commit()
+        conn.close()
+
+    def test_templates_accumulate_up_to_cap(self):
+        """Registrations append templates; the oldest is replaced past the cap"""
+        encodings = np.random.rand(4, 128)
+        for i, encoding in enumerate(encodings):
+            count = self.store.add_template('student', 1, f'known_faces/{i}.jpg', encoding,
+                                            image_hash=f'h{i}', max_templates=3)
+        self.assertEqual(count, 3)
+        np.testing.assert_array_equal(self.store.get_templates('student', 1), encodings[1:])
+        self.assertEqual(self.store.stats('face_template'), {'student': 3})
+
+        # Re-registering the same photo does not add a duplicate
+        self.assertEqual(self.store.add_template('student', 1, 'known_faces/3.jpg', encodings[3],
+                                                 image_hash='h3', max_templates=3), 3)
+
+    def test_redundant_policy_keeps_diverse_templates(self):
+        """The 'redundant' policy drops the template nearest to another one"""
+        base = np.random.rand(128)
+        near_duplicate = base + 0.001
+        other = base + 1.0
+        self.store.add_template('student', 1, 'a.jpg', base, image_hash='a', max_templates=2, policy='redundant')
+        self.store.add_template('student', 1, 'b.jpg', near_duplicate, image_hash='b', max_templates=2, policy='redundant')
+        self.store.add_template('student', 1, 'c.jpg', other, image_hash='c', max_templates=2, policy='redundant')
+
+        templates = self.store.get_templates('student', 1)
+        self.assertEqual(len(templates), 2)
+        np.testing.assert_array_equal(templates[-1], other)
+
+    def test_cached_photo_seeds_first_template(self):
+        """A student registered before templates keeps the old photo as a template"""
+        old_photo = np.random.rand(128)
+        new_photo = np.random.rand(128)
+        self.store.save_encoding('student', 1, 'known_faces/old.jpg', old_photo, image_hash='old')
+        self.store.add_template('student', 1, 'known_faces/new.jpg', new_photo, image_hash='new')
+        np.testing.assert_array_equal(self.store.get_templates('student', 1), [old_photo, new_photo])
+
+    def test_gallery_returns_all_templates(self):
+        self._add_student(image='known_faces/current.jpg')
+        current = np.random.rand(128)
+        earlier = np.random.rand(128)
+        self.store.add_template('student', 1, 'known_faces/earlier.jpg', earlier, image_hash='e')
+        self.store.add_template('student', 1, 'known_faces/current.jpg', current, image_hash='c')
+        self.store.save_encoding('student', 1, 'known_faces/current.jpg', current, image_hash='c')
+
+        gallery = self.store.load_student_gallery()
+        self.assertEqual(len(gallery), 1)
+        np.testing.assert_array_equal(gallery[0]['encoding'], current)
+        np.testing.assert_array_equal(gallery[0]['encodings'], [earlier, current])
+        self.assertEqual(len(self.store.load_student_gallery(changed_since='2000-01-01 00:00:00')), 1)
+
+    def test_large_id_lists_stay_within_the_variable_limit(self):
+        """Refreshing more owners than SQLite allows variables loads them in chunks"""
+        self.store.ensure_table()
+        conn = sqlite3.connect(self.test_db.name)
+        for student_id in range(1, 1201):
+            conn.execute("INSERT INTO user VALUES (?, ?, 'Ana', 'Cruz', 'student', 1)",
+                         (student_id, str(1000 + student_id)))
+            conn.execute("INSERT INTO student VALUES (?, '1st Year', 'known_faces/s.jpg', ?)", (student_id, student_id))
+            conn.execute("INSERT INTO face_encoding (owner_type, owner_id, image_path, image_hash, encoding) "
+                         "VALUES ('student', ?, 'known_faces/s.jpg', 'h', ?)",
+                         (student_id, encoding_to_blob(np.random.rand(128))))
+        conn.commit()
+        conn.close()
+
+        # The limit of older SQLite builds, whatever this one was compiled with
+        connect = self.store._connect
+
+        def limited():
+            conn = connect()
+            conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            return conn
+
+        self.store._connect = limited
+        gallery = self.store.load_student_gallery(user_ids=range(1, 1201), changed_since='2000-01-01 00:00:00')
+        self.assertEqual(sorted(g['user_id'] for g in gallery), list(range(1, 1201)))
+        self.assertEqual(self.store.load_student_gallery(user_ids=[]), [])
+        self.assertEqual(len(self.store.load_student_templates(range(1, 1201))), 1200)
+
+    def test_exact_templates_match_gallery_order(self):
+        """Re-ranking reads the same encodings, in the same order, as the gallery load"""
+        self._add_student(image='known_faces/current.jpg')
+        current = np.random.rand(128)
+        earlier = np.random.rand(128)
+        self.store.save_encoding('student', 1, 'known_faces/current.jpg', current, image_hash='c')
+        self.store.add_template('student', 1, 'known_faces/earlier.jpg', earlier, image_hash='e')
+
+        exact = self.store.load_student_templates([1, 99])
+        self.assertEqual(list(exact), [1])
+        np.testing.assert_array_equal(exact[1], self.store.load_student_gallery()[0]['encodings'])
+        self.assertEqual(self.store.load_student_templates([]), {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,384 @@
+"""
+Tests for the in-memory vectorized face gallery
+Run: python test_face_gallery.py
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_gallery import FaceGallery, ClassGalleryCache, StudentGallery, FacultyGallery, EncodingQuantizer, aggregate_distances
+
+
+def random_encodings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    encs = rng.normal(size=(n, 128))
+    return encs / np.linalg.norm(encs, axis=1, keepdims=True)
+
+
+class TestFaceGallery(unittest.TestCase):
+    """Test matching and incremental maintenance of the gallery matrix"""
+
+    def test_match_agrees_with_brute_force(self):
+        """Vectorized distances equal a per-row np.linalg.norm loop"""
+        encs = random_encodings(200)
+        gallery = FaceGallery(initial_capacity=4)
+        gallery.load((i + 1, enc, {'n': i}) for i, enc in enumerate(encs))
+
+        probe = encs[17] + 0.01
+        ids, dists = gallery.distances(probe)
+        expected = np.linalg.norm(encs - probe, axis=1)
+        np.testing.assert_allclose(dists, expected, atol=1e-4)
+
+        best_id, best_dist = gallery.match(probe)
+        self.assertEqual(best_id, 18)
+        self.assertAlmostEqual(best_dist, float(expected[17]), places=4)
+
+    def test_empty_gallery(self):
+        """Matching against no identities returns no owner"""
+        owner_id, distance = FaceGallery().match(np.zeros(128))
+        self.assertIsNone(owner_id)
+        self.assertEqual(distance, float('inf'))
+
+    def test_upsert_replaces_in_place(self):
+        """Re-registering an identity replaces its row rather than appending"""
+        encs = random_encodings(3)
+        gallery = FaceGallery()
+        gallery.upsert(1, encs[0], {'name': 'a'})
+        gallery.upsert(1, encs[1])
+        self.assertEqual(len(gallery), 1)
+        self.assertEqual(gallery.info(1), {'name': 'a'})
+        self.assertEqual(gallery.match(encs[1])[0], 1)
+
+    def test_remove_keeps_rows_consistent(self):
+        """Removing an identity swaps the last row in and keeps ids aligned"""
+        encs = random_encodings(5)
+        gallery = FaceGallery()
+        gallery.load((i, enc, None) for i, enc in enumerate(encs))
+
+        self.assertTrue(gallery.remove(1))
+        self.assertFalse(gallery.remove(1))
+        self.assertEqual(len(gallery), 4)
+        self.assertNotIn(1, gallery)
+        for i in (0, 2, 3, 4):
+            self.assertEqual(gallery.match(encs[i])[0], i)
+
+    def test_match_many_agrees_with_single_match(self):
+        """One matrix product over several probes gives the same answers as match()"""
+        encs = random_encodings(50)
+        gallery = FaceGallery()
+        gallery.load((i + 1, enc, None) for i, enc in enumerate(encs))
+
+        probes = encs[[3, 41, 7]] + 0.02
+        results = gallery.match_many(probes)
+        self.assertEqual([r[0] for r in results], [4, 42, 8])
+        for probe, (owner_id, dist) in zip(probes, results):
+            expected_id, expected_dist = gallery.match(probe)
+            self.assertEqual(owner_id, expected_id)
+            self.assertAlmostEqual(dist, expected_dist, places=4)
+
+        self.assertEqual(FaceGallery().match_many(probes[:2]), [(None, float('inf'))] * 2)
+
+    def test_version_changes_on_mutation(self):
+        gallery = FaceGallery()
+        version = gallery.version
+        gallery.upsert(1, np.zeros(128))
+        self.assertGreater(gallery.version, version)
+
+
+class TestTemplates(unittest.TestCase):
+    """Test identities with several reference templates"""
+
+    def setUp(self):
+        self.encs = random_encodings(12, seed=5)
+        self.templates = {1: self.encs[0:3], 2: self.encs[3:5], 3: self.encs[5:6], 4: self.encs[6:10]}
+
+    def build(self, **kwargs):
+        gallery = FaceGallery(initial_capacity=2, **kwargs)
+        gallery.load((owner_id, encs, {'id': owner_id}) for owner_id, encs in self.templates.items())
+        return gallery
+
+    def test_one_row_per_template(self):
+        gallery = self.build()
+        self.assertEqual(len(gallery), 4)
+        self.assertEqual(gallery.template_count, 10)
+        self.assertEqual(sorted(gallery.ids.tolist()), [1, 2, 3, 4])
+        np.testing.assert_array_equal(gallery.templates(2), self.encs[3:5].astype(np.float32))
+
+    def test_any_template_matches(self):
+        """With min reduction every template of a person identifies them"""
+        gallery = self.build()
+        for owner_id, encs in self.templates.items():
+            for enc in encs:
+                self.assertEqual(gallery.match(enc + 0.01)[0], owner_id)
+
+    def test_mean_of_k_matches_reference(self):
+        gallery = self.build(reduction='mean_k', k=2)
+        probe = self.encs[1] + 0.05
+        ids, dists = gallery.distances(probe)
+        expected = {
+            owner_id: np.mean(np.sort(np.linalg.norm(encs - probe, axis=1))[:2])
+            for owner_id, encs in self.templates.items()
+        }
+        owners, scores = aggregate_distances(ids, dists, 'mean_k', 2)
+        for owner_id, score in zip(owners, scores):
+            self.assertAlmostEqual(float(score), expected[int(owner_id)], places=4)
+        best_id = min(expected, key=expected.get)
+        self.assertEqual(gallery.match(probe)[0], best_id)
+        self.assertEqual(gallery.match_many([probe])[0][0], best_id)
+
+    def test_replace_and_remove_keep_rows_aligned(self):
+        gallery = self.build()
+        gallery.upsert(1, self.encs[10:12])
+        self.assertEqual(gallery.template_count, 9)
+        self.assertTrue(gallery.remove(2))
+        self.assertEqual(gallery.template_count, 7)
+
+        row_ids = gallery.row_ids
+        for owner_id in (1, 3, 4):
+            rows = gallery._rows_of[owner_id]
+            self.assertTrue(np.all(row_ids[rows] == owner_id))
+        self.assertEqual(gallery.match(self.encs[11])[0], 1)
+        self.assertNotEqual(gallery.match(self.encs[0])[0], 1)  # replaced template is gone
+
+    def test_subset_keeps_all_templates(self):
+        view = self.build(reduction='mean_k').subset([1, 4])
+        self.assertEqual(view.template_count, 7)
+        self.assertEqual(view.reduction, 'mean_k')
+        self.assertEqual(view.match(self.encs[8])[0], 4)
+
+
+class TestCompactPrecision(unittest.TestCase):
+    """Test float16/int8 galleries and the exact re-rank"""
+
+    def setUp(self):
+        self.encs = random_encodings(300, seed=11)
+        self.exact = {i + 1: enc[None, :] for i, enc in enumerate(self.encs)}
+        self.exact_calls = []
+
+    def exact_source(self, owner_ids):
+        self.exact_calls.append(list(owner_ids))
+        return {o: self.exact[o] for o in owner_ids if o in self.exact}
+
+    def build(self, precision, **kwargs):
+        gallery = FaceGallery(precision=precision, **kwargs)
+        gallery.load((i + 1, enc, None) for i, enc in enumerate(self.encs))
+        return gallery
+
+    def test_quantizer_round_trip(self):
+        for precision, tolerance in (('float16', 1e-3), ('int8', 0.01)):
+            quantizer = EncodingQuantizer(precision).fitted(self.encs)
+            codes = quantizer.encode(self.encs)
+            self.assertEqual(codes.dtype, EncodingQuantizer.DTYPES[precision])
+            np.testing.assert_allclose(quantizer.decode(codes), self.encs, atol=tolerance)
+
+    def test_compact_rows_use_less_memory(self):
+        full = self.build('float32').nbytes
+        self.assertEqual(self.build('float16').nbytes, full // 2)
+        self.assertEqual(self.build('int8').nbytes, full // 4)
+
+    def test_scan_distances_are_close(self):
+        probe = self.encs[40] + 0.02
+        expected = np.linalg.norm(self.encs - probe, axis=1)
+        for precision, tolerance in (('float16', 1e-3), ('int8', 0.03)):
+            _, dists = self.build(precision).distances(probe)
+            np.testing.assert_allclose(dists, expected, atol=tolerance)
+
+    def test_rerank_reports_exact_distance(self):
+        gallery = self.build('int8', exact_source=self.exact_source, rerank=4)
+        probe = self.encs[40] + 0.02
+        owner_id, distance = gallery.match(probe)
+        self.assertEqual(owner_id, 41)
+        self.assertAlmostEqual(distance, float(np.linalg.norm(self.encs[40] - probe)), places=5)
+        self.assertLessEqual(len(self.exact_calls[0]), 4)
+
+        results = gallery.match_many([probe, self.encs[7]])
+        self.assertEqual([r[0] for r in results], [41, 8])
+        self.assertAlmostEqual(results[1][1], 0.0, places=5)
+
+    def test_without_exact_source_scan_decides(self):
+        gallery = self.build('float16', rerank=4)
+        self.assertEqual(gallery.match(self.encs[5] + 0.01)[0], 6)
+
+    def test_updates_and_subsets_keep_precision(self):
+        gallery = self.build('int8', exact_source=self.exact_source)
+        gallery.upsert(1, self.encs[299])
+        gallery.remove(300)
+        self.exact[1] = self.encs[299:300]
+        del self.exact[300]
+        self.assertEqual(gallery.match(self.encs[299])[0], 1)
+
+        view = gallery.subset([2, 3, 4])
+        self.assertEqual((view.precision, view.matrix.dtype), ('int8', np.float32))
+        self.assertIs(view.quantizer, gallery.quantizer)
+        self.assertEqual(view.match(self.encs[2] + 0.01)[0], 3)
+
+    def test_unknown_precision(self):
+        with self.assertRaises(ValueError):
+            FaceGallery(precision='int4')
+
+
+class TestClassGalleryCache(unittest.TestCase):
+    """Test per-class sub-galleries and their invalidation"""
+
+    def setUp(self):
+        self.encs = random_encodings(6, seed=3)
+        self.gallery = FaceGallery()
+        self.gallery.load((i + 1, enc, {'student_id': i + 1}) for i, enc in enumerate(self.encs))
+        self.rosters = {10: [1, 2, 3], 20: [4, 5]}
+        self.loads = 0
+
+        def loader(class_id):
+            self.loads += 1
+            return self.rosters.get(class_id, [])
+
+        self.cache = ClassGalleryCache(self.gallery, loader)
+
+    def test_only_enrolled_students_match(self):
+        view = self.cache.get(10)
+        self.assertEqual(sorted(int(i) for i in view.ids), [1, 2, 3])
+        # Student 5 is not in class 10, so its nearest match there is someone else
+        self.assertNotEqual(view.match(self.encs[4])[0], 5)
+        self.assertEqual(view.info(2), {'student_id': 2})
+
+    def test_roster_cached_until_invalidated(self):
+        self.cache.get(10)
+        self.cache.get(10)
+        self.assertEqual(self.loads, 1)
+
+        self.rosters[10].append(6)
+        self.assertNotIn(6, self.cache.get(10))
+        self.cache.invalidate(10)
+        self.assertIn(6, self.cache.get(10))
+        self.assertEqual(self.loads, 2)
+
+    def test_parent_changes_propagate(self):
+        self.assertIn(1, self.cache.get(10))
+        self.gallery.remove(1)
+        self.assertNotIn(1, self.cache.get(10))
+        self.assertEqual(self.loads, 1)
+
+
+class FakeStore:
+    """Minimal stand-in for FaceEncodingStore"""
+
+    def __init__(self, students):
+        self.students = students
+        self.cursor = '2025-01-01 00:00:00'
+
+    def latest_update(self):
+        return self.cursor
+
+    def load_student_gallery(self, user_ids=None, changed_since=None):
+        rows = [s for s in self.students if s['active']]
+        if user_ids is not None:
+            rows = [s for s in rows if s['user_id'] in user_ids]
+        if changed_since is not None:
+            rows = [s for s in rows if s['updated_at'] >= changed_since]
+        return rows
+
+    def registered_student_ids(self):
+        return {s['student_id'] for s in self.students if s['active']}
+
+    def load_student_templates(self, student_ids):
+        self.template_reads = getattr(self, 'template_reads', 0) + 1
+        return {s['student_id']: s['encoding'][None, :] for s in self.students if s['student_id'] in student_ids}
+
+    # The same rows stand in for faculty (keyed by faculty_id)
+    def load_faculty_gallery(self, user_ids=None, changed_since=None):
+        return [dict(s, faculty_id=s['student_id'] + 50) for s in self.load_student_gallery(user_ids, changed_since)]
+
+    def registered_faculty_ids(self):
+        return {i + 50 for i in self.registered_student_ids()}
+
+
+class TestStudentGallery(unittest.TestCase):
+    """Test lazy loading and incremental refresh from the encoding store"""
+
+    def setUp(self):
+        encs = random_encodings(3, seed=1)
+        self.students = [
+            {'student_id': i + 1, 'user_id': 100 + i, 'firstname': f'S{i}', 'lastname': 'X',
+             'encoding': encs[i], 'active': True, 'updated_at': '2025-01-01 00:00:00'}
+            for i in range(3)
+        ]
+        self.store = FakeStore(self.students)
+        self.gallery = StudentGallery(self.store, sync_interval=3600)
+
+    def test_refresh_user_handles_deactivation(self):
+        self.gallery.ensure_loaded()
+        self.assertEqual(len(self.gallery), 3)
+
+        self.students[1]['active'] = False
+        self.gallery.refresh_user(101)
+        self.assertEqual(len(self.gallery), 2)
+        self.assertNotIn(2, self.gallery)
+
+        self.students[1]['active'] = True
+        self.gallery.refresh_user(101)
+        self.assertIn(2, self.gallery)
+
+    def test_sync_applies_remote_changes(self):
+        self.gallery.ensure_loaded()
+        new_encoding = random_encodings(1, seed=9)[0]
+        self.students[0]['encoding'] = new_encoding
+        self.students[0]['updated_at'] = '2025-01-02 00:00:00'
+        self.students[2]['active'] = False
+        self.store.cursor = '2025-01-02 00:00:00'
+
+        self.gallery.sync()
+        self.assertEqual(self.gallery.match(new_encoding)[0], 1)
+        self.assertNotIn(3, self.gallery)
+
+    def test_sync_sees_writes_in_the_cursor_second(self):
+        self.gallery.ensure_loaded()
+        self.store.cursor = self.students[0]['updated_at'] = '2025-01-02 00:00:00'
+        self.students[0]['encoding'] = random_encodings(1, seed=9)[0]
+        self.gallery.sync()
+
+        # Written after that sync, but within the same second as the cursor
+        late_encoding = random_encodings(1, seed=10)[0]
+        self.students[1]['encoding'] = late_encoding
+        self.students[1]['updated_at'] = '2025-01-02 00:00:00'
+        upserts = []
+        upsert = self.gallery.upsert
+        self.gallery.upsert = lambda *entry: upserts.append(entry[0]) or upsert(*entry)
+        self.gallery.sync()
+        self.assertEqual(self.gallery.match(late_encoding)[0], 2)
+        self.assertEqual(upserts, [2])  # student 1 was applied by the previous sync already
+
+        self.gallery.sync()
+        self.assertEqual(upserts, [2])
+
+    def test_compact_gallery_reranks_from_store(self):
+        gallery = StudentGallery(self.store, sync_interval=3600, precision='int8')
+        gallery.ensure_loaded()
+        probe = self.students[2]['encoding']
+        self.assertEqual(gallery.match(probe), (3, 0.0))
+        gallery.match(probe)
+        self.assertEqual(self.store.template_reads, 1)  # exact templates are cached
+
+        new_encoding = random_encodings(1, seed=9)[0]
+        self.students[2]['encoding'] = new_encoding
+        gallery.refresh_user(102)
+        self.assertAlmostEqual(gallery.match(new_encoding)[1], 0.0, places=6)
+        self.assertEqual(self.store.template_reads, 2)
+
+    def test_faculty_gallery(self):
+        gallery = FacultyGallery(self.store, sync_interval=3600).ensure_loaded()
+        self.assertEqual(sorted(gallery.ids), [51, 52, 53])
+        self.assertEqual(gallery.match(self.students[1]['encoding']), (52, 0.0))
+        self.assertEqual(gallery.info(52)['user_id'], 101)
+
+        self.students[1]['active'] = False
+        gallery.refresh_user(101)
+        self.assertNotIn(52, gallery)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
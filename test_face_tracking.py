@@ -0,0 +1,138 @@
+"""
+Tests for per-kiosk face tracking sessions
+A fake detector reports fixed faces (in frame coordinates) inside whatever
+crop it is given, so following, losing and re-verifying tracks is tested
+without dlib
+Run: python test_face_tracking.py
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_tracking import TrackingSession, FaceTracker, box_iou, expand_box
+
+FRAME = np.zeros((480, 640, 3), dtype=np.uint8)
+CONTEXT = (None, False)
+
+
+class FixedFacesDetector:
+    """Finds the configured faces that lie fully inside the searched image"""
+
+    def __init__(self, faces):
+        self.faces = faces
+        self.calls = []
+
+    def for_face_width(self, face_width):
+        return self
+
+    def detect(self, image):
+        # The crop's offset is recovered from where it sits inside FRAME's buffer
+        offset = 0 if image.base is None else (image.__array_interface__['data'][0] - FRAME.__array_interface__['data'][0])
+        top, left = divmod(offset // 3, FRAME.shape[1])
+        height, width = image.shape[:2]
+        self.calls.append((top, left, height, width))
+        found = [(t - top, r - left, b - top, l - left) for t, r, b, l in self.faces
+                 if t >= top and l >= left and b <= top + height and r <= left + width]
+        return found, ({'tier': 0} if found else None)
+
+
+class TestBoxes(unittest.TestCase):
+
+    def test_iou(self):
+        self.assertEqual(box_iou((0, 10, 10, 0), (0, 10, 10, 0)), 1.0)
+        self.assertEqual(box_iou((0, 10, 10, 0), (20, 30, 30, 20)), 0.0)
+        self.assertAlmostEqual(box_iou((0, 10, 10, 0), (0, 15, 10, 5)), 50 / 150.0)
+
+    def test_expand_is_clipped(self):
+        self.assertEqual(expand_box((100, 200, 200, 100), 0.5, FRAME.shape), (50, 250, 250, 50))
+        self.assertEqual(expand_box((0, 640, 100, 600), 0.5, FRAME.shape), (0, 640, 150, 580))
+
+
+class TestTrackingSession(unittest.TestCase):
+
+    def setUp(self):
+        self.session = TrackingSession(reverify_every=3, tolerance=0.6)
+        self.face = (100, 300, 220, 180)
+
+    def verify(self, locations, matches):
+        """One frame that went through the full pipeline"""
+        self.session.follow(FRAME, FixedFacesDetector(locations), CONTEXT)
+        return self.session.update(locations, matches, CONTEXT, verified=True)
+
+    def test_follow_until_reverification(self):
+        self.assertEqual(self.verify([self.face], [(7, 0.4)]), [1])
+
+        moved = (110, 310, 230, 190)
+        detector = FixedFacesDetector([moved])
+        for _ in range(2):
+            followed = self.session.follow(FRAME, detector, CONTEXT)
+            self.assertEqual([(t['student_id'], loc) for t, loc in followed], [(7, moved)])
+            self.assertEqual(self.session.update([moved], None, CONTEXT, verified=False), [1])
+        # Only a window around the face was searched
+        self.assertTrue(all(h < 480 and w < 640 for _, _, h, w in detector.calls))
+
+        # Third frame since verification: full pipeline again
+        self.assertIsNone(self.session.follow(FRAME, detector, CONTEXT))
+        self.assertEqual(self.session.update([moved], [(7, 0.4)], CONTEXT, verified=True), [1])
+        self.assertEqual((self.session.tracked_frames, self.session.full_frames), (2, 2))
+
+    def test_lost_unknown_and_context_change(self):
+        self.verify([self.face], [(7, 0.4)])
+        self.assertIsNone(self.session.follow(FRAME, FixedFacesDetector([]), CONTEXT))
+
+        self.verify([self.face], [(7, 0.4)])
+        self.assertIsNone(self.session.follow(FRAME, FixedFacesDetector([self.face]), (5, False)))
+
+        self.verify([self.face], [(7, 0.9)])  # too far: unrecognized, always re-identified
+        self.assertIsNone(self.session.follow(FRAME, FixedFacesDetector([self.face]), CONTEXT))
+
+    def test_track_ids_survive_reverification(self):
+        other = (100, 560, 220, 440)
+        self.assertEqual(self.verify([self.face, other], [(7, 0.4), (8, 0.5)]), [1, 2])
+        # The faces swap detection order; ids follow the boxes, a new face gets a new id
+        newcomer = (300, 100, 420, 0)
+        self.assertEqual(self.verify([other, newcomer, self.face], [(8, 0.5), (None, 999.0), (7, 0.4)]), [2, 3, 1])
+
+    def test_snapshot_round_trip(self):
+        self.verify([self.face], [(7, 0.4)])
+        copy = TrackingSession.from_snapshot(self.session.snapshot())
+        self.assertEqual(copy.reverify_every, 3)
+        self.assertEqual(copy.tracks, self.session.tracks)
+        self.assertIsNotNone(copy.follow(FRAME, FixedFacesDetector([self.face]), CONTEXT))
+
+
+    def test_stale_worker_state_is_not_adopted(self):
+        self.verify([self.face], [(7, 0.4)])
+        sent = self.session.snapshot()
+        first, second = TrackingSession.from_snapshot(sent), TrackingSession.from_snapshot(sent)
+        first.update([self.face], [(7, 0.4)], CONTEXT, verified=True)
+        second.update([self.face, (100, 560, 220, 440)], [(7, 0.4), (8, 0.5)], CONTEXT, verified=True)
+
+        self.assertTrue(self.session.restore(second.snapshot(), expected_version=sent['version']))
+        self.assertFalse(self.session.restore(first.snapshot(), expected_version=sent['version']))
+        self.assertEqual([track['student_id'] for track in self.session.tracks], [7, 8])
+        self.assertEqual(self.session.full_frames, 2)
+
+class TestFaceTracker(unittest.TestCase):
+
+    def test_sessions_per_kiosk(self):
+        tracker = FaceTracker(reverify_every=5)
+        self.assertIs(tracker.session('a'), tracker.session('a'))
+        self.assertIsNot(tracker.session('a'), tracker.session('b'))
+        tracker.session('a').update([(0, 10, 10, 0)], [(1, 0.1)], CONTEXT, verified=True)
+        tracker.reset_all()
+        self.assertEqual(tracker.session('a').tracks, [])
+        self.assertEqual(tracker.stats()['sessions'], 2)
+
+    def test_disabled(self):
+        self.assertIsNone(FaceTracker(reverify_every=1).session('a'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,105 @@
+"""
+Tests for the shared per-frame face analysis helpers
+Run: python test_frame_analysis.py
+"""
+
+import os
+import sys
+import glob
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import frame_analysis
+from frame_analysis import AnalyzedFace, FrameAnalysis, landmarks_from_points, liveness_metrics, face_box_for
+
+# Recorded kiosk frames (DEBUG_CAPTURE_FRAMES), if any; not part of the repository
+SAMPLE_FRAMES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples', '*.jpg')))
+
+
+def sample_points():
+    """68 landmark points laid out on a 10 px grid"""
+    return [(100 + (i % 17) * 10, 100 + (i // 17) * 10) for i in range(68)]
+
+
+class TestFrameAnalysisHelpers(unittest.TestCase):
+    """Test that derived metrics match the face_recognition conventions"""
+
+    def test_landmark_groups(self):
+        landmarks = landmarks_from_points(sample_points())
+        sizes = {name: len(points) for name, points in landmarks.items()}
+        self.assertEqual(sizes, {
+            'chin': 17, 'left_eyebrow': 5, 'right_eyebrow': 5, 'nose_bridge': 4, 'nose_tip': 5,
+            'left_eye': 6, 'right_eye': 6, 'top_lip': 12, 'bottom_lip': 12
+        })
+        self.assertEqual(landmarks['top_lip'][-1], sample_points()[60])
+
+    def test_eye_aspect_ratio(self):
+        # Open eye: 2 px tall on both verticals, 6 px wide
+        eye = [(0, 0), (2, -1), (4, -1), (6, 0), (4, 1), (2, 1)]
+        eye_ratio, nose_motion = liveness_metrics({'left_eye': eye, 'right_eye': eye, 'nose_tip': [(0, 0)] * 5})
+        self.assertAlmostEqual(eye_ratio, (2 + 2) / (2.0 * 6))
+        self.assertEqual(nose_motion, 10.0)
+        self.assertEqual(liveness_metrics(None), (0.0, 0.0))
+
+    def test_face_box_margins_and_fallback(self):
+        landmarks = {'chin': [(100, 100), (200, 300)]}
+        self.assertEqual(face_box_for(landmarks, None, (480, 640)),
+                         {'x': 85, 'y': 60, 'width': 130, 'height': 280})
+        # Clipped to the image
+        self.assertEqual(face_box_for(landmarks, None, (320, 210))['height'], 260)
+        # No landmarks: detector box
+        self.assertEqual(face_box_for(None, (10, 60, 90, 20), (480, 640)),
+                         {'x': 20, 'y': 10, 'width': 40, 'height': 80})
+
+    def test_analyzed_face_reuses_landmarks(self):
+        frame = SimpleNamespace(rgb_image=np.zeros((480, 640, 3), dtype=np.uint8))
+        landmarks = landmarks_from_points(sample_points())
+        face = AnalyzedFace(frame, (100, 270, 140, 100), landmarks=landmarks)
+        self.assertIs(face.landmarks, landmarks)
+        self.assertEqual(face.face_box, face_box_for(landmarks, face.location, (480, 640)))
+        self.assertEqual(face.liveness_metrics(), liveness_metrics(landmarks))
+
+
+class TestProbeEncoding(unittest.TestCase):
+    """Probes must be encoded exactly like registration photos and the gallery"""
+
+    def test_encoding_uses_the_5_point_alignment(self):
+        frame = SimpleNamespace(rgb_image=np.zeros((480, 640, 3), dtype=np.uint8), num_jitters=1)
+        face = AnalyzedFace(frame, (100, 270, 260, 110), shape='68-point shape')
+        api = mock.Mock()
+        api.pose_predictor_5_point.return_value = '5-point shape'
+        api.face_encoder.compute_face_descriptor.return_value = [0.5] * 128
+        with mock.patch.object(frame_analysis, 'face_recognition_api', api):
+            encoding = face.encoding
+            self.assertIs(face.encoding, encoding)  # computed once
+        api.face_encoder.compute_face_descriptor.assert_called_once_with(frame.rgb_image, '5-point shape', 1)
+        self.assertEqual(encoding.shape, (128,))
+
+    @unittest.skipUnless(SAMPLE_FRAMES, "no sample frames in samples/")
+    def test_registered_photo_and_probe_encode_identically(self):
+        import cv2
+        from face_encoding_store import compute_face_encoding, REGISTRATION_DETECTOR
+
+        compared = 0
+        for path in SAMPLE_FRAMES[:5]:
+            image = cv2.imread(path)
+            registered, message = compute_face_encoding(image)
+            if registered is None:
+                continue
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            locations, detection = REGISTRATION_DETECTOR.detect(rgb)
+            probe = FrameAnalysis(rgb, locations, detection)[0].encoding
+            np.testing.assert_array_equal(probe, registered)
+            compared += 1
+        if not compared:
+            self.skipTest("no single-face sample frame")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
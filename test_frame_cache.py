@@ -0,0 +1,161 @@
+"""
+Tests for the near-duplicate frame cache
+Run: python test_frame_cache.py
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from frame_cache import FrameResultCache, frame_hash, hamming, OPENCV_AVAILABLE
+from liveness_state import LivenessState
+
+if OPENCV_AVAILABLE:
+    import cv2
+
+
+def scene(seed, noise=0.0, shift=0):
+    """A 480x640 JPEG 'kiosk frame': smooth background plus a few blobs"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:480, 0:640]
+    image = (100 + 60 * np.sin(xx / 90.0 + seed) + 40 * np.cos(yy / 70.0)).astype(np.float32)
+    for _ in range(4):
+        cx, cy, r = rng.integers(80, 560), rng.integers(80, 400), rng.integers(30, 80)
+        image[(xx - cx - shift) ** 2 + (yy - cy) ** 2 < r * r] = rng.integers(0, 255)
+    if noise:
+        image += np.random.default_rng(seed + 1000).normal(0, noise, image.shape)
+    bgr = np.repeat(np.clip(image, 0, 255).astype(np.uint8)[:, :, None], 3, axis=2)
+    return cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+
+
+@unittest.skipUnless(OPENCV_AVAILABLE, "OpenCV not installed")
+class TestPerceptualHash(unittest.TestCase):
+
+    def test_near_duplicates_are_close(self):
+        for method in ('phash', 'ahash'):
+            base = frame_hash(scene(1), method)
+            self.assertLessEqual(hamming(base, frame_hash(scene(1, noise=4.0), method)), 6, method)
+            self.assertGreater(hamming(base, frame_hash(scene(2), method)), 10, method)
+
+    def test_undecodable(self):
+        self.assertIsNone(frame_hash(b'not a jpeg'))
+
+
+@unittest.skipUnless(OPENCV_AVAILABLE, "OpenCV not installed")
+class TestFrameResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FrameResultCache(ttl=5.0, max_distance=6)
+        self.result = {'success': True, 'student_id': 7, 'detection': {'tier': 0}}
+
+    def test_hit_on_near_duplicate(self):
+        cached, key = self.cache.lookup('k1', scene(1), (None, False))
+        self.assertIsNone(cached)
+        self.cache.store('k1', key, self.result, (None, False))
+
+        cached, _ = self.cache.lookup('k1', scene(1, noise=4.0), (None, False))
+        self.assertEqual(cached['student_id'], 7)
+        self.assertTrue(cached['cached'])
+        self.assertNotIn('cached', self.result)  # the stored result is not modified
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 1, 1))
+
+    def test_miss_for_other_kiosk_scene_or_context(self):
+        _, key = self.cache.lookup('k1', scene(1), (3, False))
+        self.cache.store('k1', key, self.result, (3, False))
+        self.assertIsNone(self.cache.lookup('k2', scene(1), (3, False))[0])
+        self.assertIsNone(self.cache.lookup('k1', scene(2), (3, False))[0])
+        self.assertIsNone(self.cache.lookup('k1', scene(1), (4, False))[0])
+        self.assertIsNone(self.cache.lookup('k1', scene(1), (3, True))[0])
+
+    def test_ttl_and_clear(self):
+        self.cache.ttl = 0.2
+        _, key = self.cache.lookup('k1', scene(1), None)
+        self.cache.store('k1', key, self.result)
+        self.assertIsNotNone(self.cache.lookup('k1', scene(1))[0])
+        time.sleep(0.3)
+        self.assertIsNone(self.cache.lookup('k1', scene(1))[0])
+
+        self.cache.ttl = 5.0
+        self.cache.store('k1', key, self.result)
+        self.cache.clear()
+        self.assertIsNone(self.cache.lookup('k1', scene(1))[0])
+
+    def test_disabled(self):
+        cache = FrameResultCache(ttl=0)
+        self.assertEqual(cache.lookup('k1', scene(1)), (None, None))
+
+
+@unittest.skipUnless(OPENCV_AVAILABLE, "OpenCV not installed")
+class TestCachedAntiSpoofing(unittest.TestCase):
+    """A cache hit reuses the identity, never the anti-spoofing verdict"""
+
+    def setUp(self):
+        import recognition_service
+        self.service = recognition_service
+        self.rgb = cv2.cvtColor(cv2.imdecode(np.frombuffer(scene(1), np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        self.cached = {'success': True, 'student_id': 7, 'student_name': 'A B', 'face_box': {'x': 200},
+                       'anti_spoofing': {'is_live': True, 'confidence': 1.0, 'details': 'earlier frame'},
+                       'detection': {'tier': 0}, 'face_locations': [[100, 400, 300, 200]],
+                       'cached': True, 'cache_distance': 2}
+
+    def recheck(self, verdict, result=None, liveness=None):
+        detector = mock.Mock()
+        detector.comprehensive_anti_spoofing_check.return_value = dict(verdict, checks={})
+        with mock.patch.object(self.service, 'anti_spoofing_detector', detector), \
+                mock.patch.object(self.service, 'ANTI_SPOOFING_AVAILABLE', True):
+            rechecked = self.service.recheck_anti_spoofing(self.rgb, result or self.cached, liveness)
+        return rechecked, detector.comprehensive_anti_spoofing_check
+
+    def test_hit_runs_the_checks_on_the_new_frame(self):
+        liveness = LivenessState()
+        rechecked, check = self.recheck({'is_live': True, 'confidence': 0.9, 'details': 'this frame'},
+                                        liveness=liveness)
+        image, _, location = check.call_args.args
+        self.assertIs(image, self.rgb)
+        self.assertEqual(location, (100, 400, 300, 200))
+        self.assertIs(check.call_args.kwargs['state'], liveness)
+        self.assertEqual((rechecked['student_id'], rechecked['anti_spoofing']['details']), (7, 'this frame'))
+        self.assertTrue(rechecked['cached'])
+
+    def test_spoof_on_a_hit_is_rejected(self):
+        rechecked, _ = self.recheck({'is_live': False, 'confidence': 0.0, 'details': 'photo'})
+        self.assertEqual((rechecked['success'], rechecked['student_id']), (False, 'SPOOFING_DETECTED'))
+        self.assertEqual(rechecked['cache_distance'], 2)
+
+        multi = {'success': True, 'multi_face': True, 'faces': [dict(self.cached)], 'recognized_count': 1,
+                 'detection': {'tier': 0}, 'face_locations': self.cached['face_locations']}
+        rechecked, _ = self.recheck({'is_live': False, 'confidence': 0.0, 'details': 'photo'}, multi)
+        self.assertEqual((rechecked['success'], rechecked['recognized_count']), (False, 0))
+        self.assertEqual(rechecked['faces'][0]['student_id'], 'SPOOFING_DETECTED')
+
+    def test_result_without_locations_is_a_miss(self):
+        result = {key: value for key, value in self.cached.items() if key != 'face_locations'}
+        self.assertIsNone(self.recheck({'is_live': True}, result)[0])
+
+
+    def test_no_face_result_is_a_hit(self):
+        # An empty hallway: the detector found nothing, and the hit has nothing to re-check
+        gallery = mock.MagicMock()
+        gallery.__len__.return_value = 3
+        detector = mock.Mock()
+        detector.detect.return_value = ([], None)
+        result = self.service.recognize_frame(self.rgb, gallery, detector)
+        self.assertEqual((result['message'], result['face_locations']), ('No face detected', []))
+
+        cached = dict(result, cached=True, cache_distance=1)
+        rechecked, check = self.recheck({'is_live': True}, cached)
+        self.assertIs(rechecked, cached)
+        check.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,193 @@
+"""
+Tests for the gallery consistency checker
+Run: python test_gallery_maintenance.py
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gallery_maintenance
+from gallery_maintenance import GalleryMaintainer, ensure_registration_schema
+from face_encoding_store import FaceEncodingStore
+from test_face_encoding_store import create_test_schema
+
+
+class CountingEncoder:
+    """Stands in for compute_face_encoding; images marked 'noface' have no face"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, image):
+        self.calls += 1
+        if image == 'noface':
+            return None, "No face detected"
+        return np.full(128, 0.1 * self.calls), "ok"
+
+
+class TestGalleryMaintenance(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'test.db')
+        self.faces = os.path.join(self.tmp, 'known_faces')
+        os.makedirs(self.faces)
+        create_test_schema(self.db)
+        self.photo = self.write_photo('S001_abc.jpg', b'photo one')
+        conn = sqlite3.connect(self.db)
+        conn.execute("INSERT INTO user (user_id, idno, role) VALUES (1, 'S001', 'student'), (2, 'S002', 'student'),"
+                     " (3, 'F001', 'faculty')")
+        conn.execute("INSERT INTO student (student_id, user_id, attendance_image) VALUES (11, 1, ?), (12, 2, NULL)",
+                     (self.photo,))
+        conn.execute("INSERT INTO faculty (faculty_id, user_id, attendance_image) VALUES (21, 3, ?)",
+                     (os.path.join(self.faces, 'gone.jpg'),))
+        conn.commit()
+        conn.close()
+
+        self.store = FaceEncodingStore(self.db)
+        self.encoder = CountingEncoder()
+        self.changes = []
+        self.maintainer = GalleryMaintainer(self.db, self.store, faces_dir=self.faces, on_change=self.changes.append)
+        for target, replacement in (('compute_face_encoding', self.encoder),
+                                    ('cv2', mock.Mock(imread=self.read_marker))):
+            patcher = mock.patch.object(gallery_maintenance, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    @staticmethod
+    def read_marker(path):
+        with open(path, 'rb') as f:
+            return 'noface' if f.read() == b'noface' else path
+
+    def write_photo(self, name, data, mtime=None):
+        path = os.path.join(self.faces, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def flags(self):
+        conn = sqlite3.connect(self.db)
+        try:
+            students = dict(conn.execute('SELECT student_id, face_registered FROM student').fetchall())
+            faculty = dict(conn.execute('SELECT faculty_id, face_registered FROM faculty').fetchall())
+            return students, faculty
+        finally:
+            conn.close()
+
+    def test_flag_starts_from_photo_path(self):
+        conn = sqlite3.connect(self.db)
+        ensure_registration_schema(conn)
+        conn.close()
+        self.assertEqual(self.flags(), ({11: 1, 12: 0}, {21: 1}))
+
+    def test_missing_photo_is_unregistered(self):
+        self.store.save_encoding('faculty', 21, os.path.join(self.faces, 'gone.jpg'), np.zeros(128), image_hash='x')
+        result = self.maintainer.check()
+
+        self.assertEqual((result['encoded'], result['missing']), (1, 1))
+        self.assertEqual(self.flags(), ({11: 1, 12: 0}, {21: 0}))
+        self.assertIsNone(self.store.get_encoding('faculty', 21))
+        self.assertEqual(self.changes, [[1, 3]])
+
+    def test_only_changed_photos_are_re_encoded(self):
+        self.maintainer.check()
+        self.assertEqual(self.encoder.calls, 1)
+
+        result = self.maintainer.check()
+        self.assertEqual((result['unchanged'], self.encoder.calls), (1, 1))
+
+        # Touched but identical: re-hashed, not re-encoded
+        os.utime(self.photo, (1_000_000, 1_000_000))
+        result = self.maintainer.check()
+        self.assertEqual((result['verified'], self.encoder.calls), (1, 1))
+        self.assertEqual(self.maintainer.check()['unchanged'], 1)
+
+        self.write_photo('S001_abc.jpg', b'photo one, retaken', mtime=2_000_000)
+        result = self.maintainer.check()
+        self.assertEqual((result['encoded'], self.encoder.calls), (1, 2))
+        self.assertEqual(result['changed_users'], [1])
+
+    def test_replaced_photo_no_longer_matches(self):
+        self.maintainer.check()
+        cached = self.store.get_encoding('student', 11)
+        old = cached['encoding']
+        self.store.add_template('student', 11, self.photo, old, image_hash=cached['image_hash'])
+        earlier = np.full(128, 5.0)
+        self.store.add_template('student', 11, 'known_faces/earlier.jpg', earlier, image_hash='earlier')
+
+        # The photo is overwritten with someone else's face
+        self.write_photo('S001_abc.jpg', b'another face', mtime=2_000_000)
+        self.assertEqual(self.maintainer.check()['encoded'], 1)
+        current = self.store.get_encoding('student', 11)['encoding']
+        encodings = self.store.load_student_gallery()[0]['encodings']
+        self.assertFalse(any(np.array_equal(encoding, old) for encoding in encodings))
+        self.assertEqual(len(encodings), 2)
+        self.assertTrue(any(np.array_equal(encoding, current) for encoding in encodings))
+        self.assertTrue(any(np.array_equal(encoding, earlier) for encoding in encodings))
+
+    def test_legacy_idno_photo_is_adopted(self):
+        legacy = self.write_photo('S002.jpg', b'old tool photo')
+        result = self.maintainer.check()
+
+        self.assertEqual(result['adopted'], 1)
+        self.assertEqual(self.flags()[0][12], 1)
+        self.assertEqual(self.store.get_encoding('student', 12)['image_path'], legacy)
+
+    def test_unencodable_photo_is_not_retried_every_pass(self):
+        self.write_photo('S001_abc.jpg', b'noface', mtime=3_000_000)
+        self.assertEqual(self.maintainer.check()['failed'], 1)
+        self.assertEqual(self.maintainer.check()['failed'], 1)
+        self.assertEqual(self.encoder.calls, 1)
+
+        self.write_photo('S001_abc.jpg', b'a better photo', mtime=4_000_000)
+        self.assertEqual(self.maintainer.check()['encoded'], 1)
+
+
+
+class TestFreshSchema(unittest.TestCase):
+
+    def test_new_database_matches_a_migrated_one(self):
+        import db
+        tmp = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            os.chdir(tmp)  # create_database() writes ./facecheck.db
+            with mock.patch('builtins.print'):
+                db.create_database()
+            path = os.path.join(tmp, 'facecheck.db')
+            conn = sqlite3.connect(path)
+
+            def columns():
+                return {table: [r[1:] for r in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+                        for table in ('student', 'faculty', 'face_encoding', 'face_template')}
+
+            fresh = columns()
+            # The runtime migrations find nothing to add
+            FaceEncodingStore(path).ensure_table()
+            ensure_registration_schema(conn)
+            self.assertEqual(columns(), fresh)
+            self.assertIn('image_mtime', [c[0] for c in fresh['face_encoding']])
+            self.assertIn('face_registered', [c[0] for c in fresh['faculty']])
+            conn.close()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
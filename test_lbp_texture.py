@@ -0,0 +1,101 @@
+"""
+Tests for the vectorized LBP texture codes
+Run: python test_lbp_texture.py
+"""
+
+import os
+import sys
+import glob
+import unittest
+
+import cv2
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lbp_texture import lbp_codes, lbp_histogram, lbp_texture_score, LBP_TABLES
+from anti_spoofing import AntiSpoofingDetector
+
+
+def loop_lbp(gray):
+    """The per-pixel 3x3 LBP loop analyze_texture_lbp used to run"""
+    h, w = gray.shape
+    lbp = np.zeros_like(gray)
+    for i in range(1, h-1):
+        for j in range(1, w-1):
+            center = gray[i, j]
+            code = 0
+            code |= (gray[i-1, j-1] >= center) << 0
+            code |= (gray[i-1, j] >= center) << 1
+            code |= (gray[i-1, j+1] >= center) << 2
+            code |= (gray[i, j+1] >= center) << 3
+            code |= (gray[i+1, j+1] >= center) << 4
+            code |= (gray[i+1, j] >= center) << 5
+            code |= (gray[i+1, j-1] >= center) << 6
+            code |= (gray[i, j-1] >= center) << 7
+            lbp[i, j] = code
+    return lbp
+
+
+def loop_score(gray):
+    lbp = loop_lbp(gray)
+    hist = cv2.calcHist([lbp], [0], None, [256], [0, 256])
+    hist_norm = hist / (lbp.shape[0] * lbp.shape[1])
+    entropy = -np.sum(hist_norm * np.log2(hist_norm + 1e-7))
+    return float(min(entropy / 8.0, 1.0))
+
+
+def sample_faces():
+    """Random textures plus face-sized crops of recorded frames, when there are any"""
+    rng = np.random.default_rng(3)
+    images = [rng.integers(0, 256, (61, 47), dtype=np.uint8),
+              rng.integers(100, 104, (40, 40), dtype=np.uint8),  # many ties with the centre
+              np.full((5, 9), 7, dtype=np.uint8),
+              np.zeros((2, 2), dtype=np.uint8)]
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples', '*.jpg')))[:2]:
+        frame = cv2.imread(path)
+        if frame is not None:
+            images.append(cv2.cvtColor(frame[100:300, 200:400], cv2.COLOR_BGR2GRAY))
+    return images
+
+
+class TestLbpTexture(unittest.TestCase):
+
+    def test_matches_the_pixel_loop(self):
+        for gray in sample_faces():
+            np.testing.assert_array_equal(lbp_codes(gray), loop_lbp(gray))
+            self.assertEqual(lbp_texture_score(gray), loop_score(gray))
+
+    def test_detector_score_is_unchanged(self):
+        face = np.random.default_rng(5).integers(0, 256, (80, 90, 3), dtype=np.uint8)
+        gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+        natural, score = AntiSpoofingDetector().analyze_texture_lbp(face)
+        self.assertEqual(score, loop_score(gray))
+        self.assertTrue(natural)
+
+    def test_variants(self):
+        flat = np.full((6, 6), 50, dtype=np.uint8)  # every neighbour ties: code 255
+        self.assertEqual(lbp_codes(flat, method='uniform')[2, 2], 8)
+        self.assertEqual(lbp_codes(flat, method='nri_uniform')[2, 2], LBP_TABLES['nri_uniform'][1] - 2)
+        for method, bins in (('default', 256), ('ror', 36), ('uniform', 10), ('nri_uniform', 59)):
+            self.assertEqual(LBP_TABLES[method][1], bins)
+            self.assertEqual(lbp_histogram(flat, method=method).shape, (bins, 1))
+
+        # Rotating the image rotates each code's bits; rotation-invariant codes do not change
+        gray = np.random.default_rng(7).integers(0, 256, (30, 30), dtype=np.uint8)
+        for method in ('ror', 'uniform'):
+            np.testing.assert_array_equal(np.rot90(lbp_codes(gray, method=method)),
+                                          lbp_codes(np.rot90(gray), method=method))
+
+        # Radius 2 compares with pixels two steps away and leaves a 2-pixel border
+        codes = lbp_codes(gray, radius=2)
+        self.assertTrue((codes[:2] == 0).all() and (codes[:, -2:] == 0).all())
+        self.assertEqual(codes[5, 5] & 1, int(gray[3, 3] >= gray[5, 5]))
+        self.assertLessEqual(lbp_texture_score(gray, radii=(1, 2, 3), method='uniform'), 1.0)
+        with self.assertRaises(ValueError):
+            lbp_codes(gray, method='circular')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,224 @@
+"""
+Tests for the per-kiosk liveness state store
+Run: python test_liveness_state.py
+"""
+
+import os
+import sys
+import pickle
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import liveness_state
+import recognition_service
+from liveness_state import LivenessState, LivenessStateStore
+from anti_spoofing import AntiSpoofingDetector
+from face_tracking import TrackingSession
+from frame_analysis import AnalyzedFace
+
+
+def nose_at(x, y):
+    return {'nose_tip': [(x, y), (x + 1, y), (x + 2, y)]}
+
+
+def list_motion(history, landmarks, max_history=5, threshold=5.0):
+    """The list-of-landmarks history analyze_motion_patterns used to keep"""
+    history.append(landmarks)
+    if len(history) > max_history:
+        history.pop(0)
+    if len(history) < 2:
+        return True, 0.0
+    scores = [np.linalg.norm(np.array(cur['nose_tip'][0]) - np.array(prev['nose_tip'][0]))
+              for prev, cur in zip(history, history[1:])
+              if prev and cur and 'nose_tip' in prev and 'nose_tip' in cur]
+    if not scores:
+        return True, 0.0
+    avg = np.mean(scores)
+    return bool(avg > threshold or len(history) < 3), float(avg)
+
+
+class TestLivenessState(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = AntiSpoofingDetector()
+        self.crop = np.zeros((100, 80, 3), dtype=np.uint8)
+
+    def test_kiosks_do_not_share_motion_history(self):
+        moving, still = LivenessState(), LivenessState()
+        for step in range(4):
+            self.detector.analyze_motion_patterns(nose_at(100 + 20 * step, 100), self.crop, moving)
+            self.detector.analyze_motion_patterns(nose_at(300, 300), self.crop, still)
+
+        self.assertEqual(self.detector.analyze_motion_patterns(nose_at(180, 100), self.crop, moving), (True, 20.0))
+        self.assertEqual(self.detector.analyze_motion_patterns(nose_at(300, 300), self.crop, still), (False, 0.0))
+        self.assertEqual(self.detector.state.count, 0)  # the detector's own state is untouched
+        self.assertEqual(moving.count, moving.max_history)
+
+    def test_ring_matches_list_history(self):
+        rng = np.random.default_rng(11)
+        state, history = LivenessState(), []
+        for _ in range(60):
+            landmarks = {} if rng.random() < 0.2 else nose_at(*(int(v) for v in rng.integers(0, 640, 2)))
+            if rng.random() < 0.3 and history and history[-1]:
+                landmarks = dict(history[-1])  # a still face
+            self.assertEqual(self.detector.analyze_motion_patterns(landmarks, self.crop, state),
+                             list_motion(history, landmarks))
+
+    def test_snapshot_round_trip(self):
+        state = LivenessState()
+        for step in range(3):
+            self.detector.analyze_motion_patterns(nose_at(10 * step, 0), self.crop, state)
+        state.blink_counter = 2
+
+        # Worker processes get the snapshot pickled over their pipe
+        copy = LivenessState.from_snapshot(pickle.loads(pickle.dumps(state.snapshot())))
+        self.assertEqual(copy.blink_counter, 2)
+        self.assertEqual(self.detector.analyze_motion_patterns(nose_at(30, 0), self.crop, copy),
+                         self.detector.analyze_motion_patterns(nose_at(30, 0), self.crop, state))
+
+        state.restore(None)  # a result without 'liveness_state' changes nothing
+        self.assertEqual(state.count, 4)
+        state.reset()
+        self.assertEqual((state.count, len(state.motion_steps()), state.blink_counter), (0, 0, 0))
+
+    def test_stale_worker_state_is_not_adopted(self):
+        state = LivenessState()
+        self.detector.analyze_motion_patterns(nose_at(0, 0), self.crop, state)
+        # Two frames of the kiosk go out with the same snapshot
+        sent = state.snapshot()
+        first, second = LivenessState.from_snapshot(sent), LivenessState.from_snapshot(sent)
+        self.detector.analyze_motion_patterns(nose_at(10, 0), self.crop, first)
+        for step in (2, 3):
+            self.detector.analyze_motion_patterns(nose_at(10 * step, 0), self.crop, second)
+
+        self.assertTrue(state.restore(second.snapshot(), expected_version=sent['version']))
+        # The frame that finishes last ran on the older history: it must not roll it back
+        self.assertFalse(state.restore(first.snapshot(), expected_version=sent['version']))
+        self.assertEqual(state.count, 3)
+        self.assertEqual(list(state.motion_steps()), [20.0, 10.0])
+
+    def test_store_evicts_idle_and_least_recently_used(self):
+        store = LivenessStateStore(max_kiosks=2, idle_timeout=60)
+        with mock.patch.object(liveness_state.time, 'time', return_value=1000.0):
+            first = store.get('a')
+            self.assertIs(store.get('a'), first)
+            store.get('b')
+            store.get('a')  # 'b' is now the least recently used
+            store.get('c')
+        self.assertEqual(list(store._states), ['a', 'c'])
+
+        with mock.patch.object(liveness_state.time, 'time', return_value=1030.0):
+            store.get('c')
+        with mock.patch.object(liveness_state.time, 'time', return_value=1070.0):
+            store.get('d')  # 'a' has been idle for 70 seconds
+        self.assertEqual(list(store._states), ['c', 'd'])
+        stats = store.stats()
+        self.assertEqual((stats['kiosks'], stats['evicted_capacity'], stats['evicted_idle']), (2, 1, 1))
+
+        store.reset('c')
+        self.assertEqual(list(store._states), ['d'])
+        store.reset()
+        self.assertEqual(store.stats()['kiosks'], 0)
+
+    def test_memory_is_fixed_and_small(self):
+        store = LivenessStateStore()
+        for kiosk in range(1000):
+            for step in range(8):
+                self.detector.analyze_motion_patterns(nose_at(step, kiosk), self.crop, store.get(kiosk))
+        stats = store.stats()
+        self.assertEqual((stats['kiosks'], stats['frames']), (256, 256 * 5))
+        self.assertLessEqual(stats['bytes'], 256 * 300)  # the face crops are not kept
+
+    def test_concurrent_frames_keep_history_bounded(self):
+        state = LivenessState(max_history=5)
+
+        def feed(offset):
+            for step in range(50):
+                self.detector.analyze_motion_patterns(nose_at(offset + step, 0), self.crop, state)
+
+        threads = [threading.Thread(target=feed, args=(100 * n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((state.count, len(state.motion_steps())), (5, 4))
+
+
+
+class TwoFaceFrame:
+    """FrameAnalysis stand-in: the faces at the given boxes, nose at each box's centre"""
+
+    def __init__(self, rgb_image, locations, detection=None):
+        self.rgb_image = rgb_image
+        self.detection = detection
+        self.num_jitters = 1
+        self.faces = [AnalyzedFace(self, (top, right, bottom, left),
+                                   landmarks=nose_at((left + right) // 2, (top + bottom) // 2))
+                      for top, right, bottom, left in locations]
+
+    def __len__(self):
+        return len(self.faces)
+
+    def __iter__(self):
+        return iter(self.faces)
+
+    def __getitem__(self, index):
+        return self.faces[index]
+
+    @property
+    def locations(self):
+        return [face.location for face in self.faces]
+
+    def encodings(self):
+        return [np.zeros(128) for _ in self.faces]
+
+
+class TestMultiFaceLiveness(unittest.TestCase):
+    """One kiosk history, several faces per frame"""
+
+    def setUp(self):
+        self.gallery = mock.Mock()
+        self.gallery.__len__ = mock.Mock(return_value=2)
+        self.gallery.match_many.side_effect = lambda encodings: [(None, 999.0)] * len(encodings)
+        self.image = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def run_frames(self, boxes, liveness, tracking=None, frames=4):
+        detector = SimpleNamespace(detect=lambda rgb: (list(boxes), {'tier': 0}))
+        with mock.patch.object(recognition_service, 'FrameAnalysis', TwoFaceFrame):
+            for _ in range(frames):
+                result = recognition_service.recognize_frame(self.image, self.gallery, detector, multi_face=True,
+                                                             tracking=tracking, liveness=liveness)
+        return result
+
+    def test_two_still_faces_do_not_pass_as_motion(self):
+        # Two people standing still 300 px apart: the history holds one nose, not both
+        small, large = (100, 200, 200, 100), (100, 550, 260, 390)
+        liveness = LivenessState()
+        result = self.run_frames([small, large], liveness)
+        self.assertEqual(result['face_count'], 2)
+        self.assertEqual(liveness.count, 4)
+        self.assertEqual(list(liveness.motion_steps()), [0.0, 0.0, 0.0])
+        self.assertEqual(liveness.nose[0].tolist(), [470.0, 180.0])  # the larger face
+
+    def test_history_follows_the_tracked_face(self):
+        first, second = (100, 200, 200, 100), (100, 550, 260, 390)
+        liveness, tracking = LivenessState(), TrackingSession(reverify_every=1)
+        self.run_frames([first, second], liveness, tracking, frames=3)
+        subject = liveness.subject
+        self.assertIsNotNone(subject)
+
+        # The followed face leaves: the other person's history starts over
+        self.run_frames([first], liveness, tracking, frames=1)
+        self.assertNotEqual(liveness.subject, subject)
+        self.assertEqual((liveness.count, len(liveness.motion_steps())), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
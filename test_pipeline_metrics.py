@@ -0,0 +1,84 @@
+"""
+Tests for per-stage latency metrics
+Run: python test_pipeline_metrics.py
+"""
+
+import os
+import sys
+import time
+import unittest
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline_metrics import StageTimer, StageMetrics
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_repeated_stages_add_up(self):
+        timer = StageTimer()
+        with timer.stage('detect'):
+            time.sleep(0.01)
+        timer.add('detect', 5.0)
+        timer.add('encode', 2.5)
+        self.assertGreaterEqual(timer.timings['detect'], 15.0)
+        self.assertEqual(timer.timings['encode'], 2.5)
+
+    def test_stage_recorded_on_error(self):
+        timer = StageTimer()
+        with self.assertRaises(ValueError):
+            with timer.stage('decode'):
+                raise ValueError('bad frame')
+        self.assertIn('decode', timer.timings)
+
+
+class TestStageMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = StageMetrics(buckets_ms=(10, 100, 1000), window_seconds=60, max_kiosks=2)
+
+    def test_snapshot_per_endpoint_and_kiosk(self):
+        for ms in range(1, 101):
+            self.metrics.observe('detect', 'k1', {'detect': float(ms), 'total': ms * 2.0})
+        self.metrics.observe('detect_async', 'k2', {'detect': 50.0})
+
+        snapshot = self.metrics.snapshot()
+        detect = snapshot['endpoints']['detect']['detect']
+        self.assertEqual(detect['count'], 100)
+        self.assertAlmostEqual(detect['mean_ms'], 50.5)
+        self.assertAlmostEqual(detect['p50_ms'], 50.5)
+        self.assertGreater(detect['p99_ms'], detect['p95_ms'])
+        self.assertEqual(snapshot['kiosks']['k1']['total']['count'], 100)
+        self.assertEqual(snapshot['endpoints']['detect_async']['detect']['count'], 1)
+
+    def test_rolling_window(self):
+        self.metrics.window_seconds = 0.1
+        self.metrics.observe('detect', None, {'detect': 20.0})
+        time.sleep(0.2)
+        summary = self.metrics.snapshot()['endpoints']['detect']['detect']
+        self.assertEqual((summary['count'], summary['recent']), (1, 0))
+        self.assertNotIn('p50_ms', summary)
+
+    def test_least_recent_kiosk_is_dropped(self):
+        for kiosk in ('k1', 'k2', 'k1', 'k3'):
+            self.metrics.observe('detect', kiosk, {'detect': 1.0})
+        self.assertEqual(sorted(self.metrics.snapshot()['kiosks']), ['k1', 'k3'])
+        # The endpoint series keeps every observation
+        self.assertEqual(self.metrics.snapshot()['endpoints']['detect']['detect']['count'], 4)
+
+    def test_prometheus_histogram(self):
+        for ms in (5.0, 50.0, 500.0, 5000.0):
+            self.metrics.observe('detect', 'kiosk "a"', {'encode': ms})
+        text = self.metrics.prometheus()
+        self.assertIn('# TYPE facecheck_stage_seconds histogram', text)
+        self.assertIn('facecheck_stage_seconds_bucket{endpoint="detect",stage="encode",le="0.01"} 1', text)
+        self.assertIn('facecheck_stage_seconds_bucket{endpoint="detect",stage="encode",le="1"} 3', text)
+        self.assertIn('facecheck_stage_seconds_bucket{endpoint="detect",stage="encode",le="+Inf"} 4', text)
+        self.assertIn('facecheck_stage_seconds_count{endpoint="detect",stage="encode"} 4', text)
+        self.assertIn('facecheck_stage_seconds_sum{endpoint="detect",stage="encode"} 5.555000', text)
+        self.assertIn('facecheck_kiosk_stage_seconds_count{kiosk="kiosk \\"a\\"",stage="encode"} 4', text)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,111 @@
+"""
+Tests for asynchronous recognition jobs
+A one-thread executor with a gate stands in for the recognition pipeline
+Run: python test_recognition_jobs.py
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from recognition_jobs import RecognitionJobManager, JobQueueFull, DONE, FAILED, SUPERSEDED, EXPIRED, RUNNING
+
+
+class GatedRecognizer:
+    """Recognizes one frame at a time; each frame waits until the gate opens"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.gate = threading.Event()
+        self.seen = []
+
+    def submit(self, image_bytes, class_id, multi_face, kiosk_id=None):
+        return self.executor.submit(self._run, image_bytes, class_id)
+
+    def _run(self, image_bytes, class_id):
+        self.gate.wait(5)
+        if image_bytes == b'boom':
+            raise ValueError('bad frame')
+        self.seen.append(image_bytes)
+        return {'success': True, 'frame': image_bytes.decode(), 'class_id': class_id}
+
+
+class TestRecognitionJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.recognizer = GatedRecognizer()
+        self.jobs = RecognitionJobManager(self.recognizer.submit, max_age=5.0, max_pending=4)
+
+    def tearDown(self):
+        self.recognizer.gate.set()
+        self.recognizer.executor.shutdown(wait=True)
+
+    def test_result_by_long_poll(self):
+        self.recognizer.gate.set()
+        job = self.jobs.submit('kiosk-a', 1, b'frame-1', class_id=3)
+        finished = self.jobs.wait(job.job_id, timeout=5)
+        self.assertEqual(finished.status, DONE)
+        self.assertEqual(finished.result, {'success': True, 'frame': 'frame-1', 'class_id': 3})
+        self.assertEqual(finished.to_dict()['result']['frame'], 'frame-1')
+
+    def test_newer_frame_supersedes_queued_one(self):
+        running = self.jobs.submit('kiosk-a', 1, b'frame-1')   # occupies the only thread
+        time.sleep(0.1)
+        queued = self.jobs.submit('kiosk-a', 1, b'frame-2')
+        other = self.jobs.submit('kiosk-b', 1, b'frame-b')     # another kiosk is untouched
+        newest = self.jobs.submit('kiosk-a', 1, b'frame-3')
+        self.assertEqual(self.jobs.get(queued.job_id).status, SUPERSEDED)
+        self.assertEqual(self.jobs.get(running.job_id).status, RUNNING)
+
+        self.recognizer.gate.set()
+        for job in (running, other, newest):
+            self.assertEqual(self.jobs.wait(job.job_id, timeout=5).status, DONE)
+        self.assertNotIn(b'frame-2', self.recognizer.seen)
+        self.assertEqual(self.jobs.metrics()['finished'][SUPERSEDED], 1)
+
+    def test_stale_frame_expires(self):
+        self.jobs.max_age = 0.2
+        self.jobs.submit('kiosk-a', 1, b'frame-1')
+        time.sleep(0.05)
+        stale = self.jobs.submit('kiosk-b', 1, b'frame-b')
+        time.sleep(0.3)
+        self.assertEqual(self.jobs.get(stale.job_id).status, EXPIRED)
+        self.recognizer.gate.set()
+        time.sleep(0.1)
+        self.assertNotIn(b'frame-b', self.recognizer.seen)
+
+    def test_failed_job(self):
+        self.recognizer.gate.set()
+        job = self.jobs.submit('kiosk-a', 1, b'boom')
+        finished = self.jobs.wait(job.job_id, timeout=5)
+        self.assertEqual(finished.status, FAILED)
+        self.assertIn('bad frame', finished.error)
+
+    def test_backlog_is_bounded(self):
+        for n in range(4):
+            self.jobs.submit(f'kiosk-{n}', 1, b'frame')
+        with self.assertRaises(JobQueueFull):
+            self.jobs.submit('kiosk-9', 1, b'frame')
+
+    def test_kiosk_stream_order(self):
+        after = self.jobs.latest_seq()
+        self.recognizer.gate.set()
+        first = self.jobs.submit('kiosk-a', 1, b'frame-1')
+        self.jobs.wait(first.job_id, timeout=5)
+        second = self.jobs.submit('kiosk-a', 1, b'frame-2')
+        self.jobs.wait(second.job_id, timeout=5)
+        self.jobs.submit('kiosk-b', 1, b'frame-b')
+
+        events = self.jobs.wait_kiosk('kiosk-a', after_seq=after, timeout=1)
+        self.assertEqual([job.job_id for job in events], [first.job_id, second.job_id])
+        self.assertEqual(self.jobs.wait_kiosk('kiosk-a', after_seq=second.seq, timeout=0.2), [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
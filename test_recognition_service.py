@@ -0,0 +1,112 @@
+"""
+Tests for the recognition worker pool
+Workers run a lightweight stand-in state so the pool mechanics (queueing,
+broadcasts, metrics, crash recovery) are tested without loading dlib models
+Run: python test_recognition_service.py
+"""
+
+import os
+import sys
+import time
+import unittest
+from concurrent import futures
+
+# Add the project directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from recognition_service import RecognitionService
+
+
+class EchoState:
+    """Worker state that reports what it received and which updates it applied"""
+
+    def __init__(self, db_path):
+        self.updates = []
+
+    def apply(self, command, arg):
+        self.updates.append([command, arg])
+
+    def recognize(self, image_bytes, class_id, multi_face, tracks=None, gallery='student', liveness=None):
+        if image_bytes == b'crash':
+            os._exit(3)
+        if image_bytes == b'slow':
+            time.sleep(1.0)
+        return {
+            'success': True,
+            'size': len(image_bytes),
+            'class_id': class_id,
+            'multi_face': multi_face,
+            'gallery': gallery,
+            'liveness': liveness,
+            'pid': os.getpid(),
+            'updates': list(self.updates)
+        }
+
+
+class BrokenState:
+    def __init__(self, db_path):
+        raise RuntimeError('models missing')
+
+
+class TestRecognitionService(unittest.TestCase):
+    """Test the pool with real worker processes"""
+
+    def setUp(self):
+        self.service = RecognitionService(worker_count=2, job_timeout=20, state_factory=EchoState)
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def test_jobs_round_trip(self):
+        futures = [self.service.submit(b'x' * n, class_id=7, multi_face=True) for n in range(1, 9)]
+        results = [f.result(timeout=20) for f in futures]
+        self.assertEqual([r['size'] for r in results], list(range(1, 9)))
+        self.assertTrue(all(r['class_id'] == 7 and r['multi_face'] and r['gallery'] == 'student' for r in results))
+        event = self.service.recognize(b'event', gallery='faculty', liveness={'blink_counter': 1})
+        self.assertEqual((event['gallery'], event['liveness']), ('faculty', {'blink_counter': 1}))
+
+        metrics = self.service.metrics()
+        self.assertEqual(metrics['completed'], 9)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['in_flight'], 0)
+        self.assertEqual(sum(w['jobs'] for w in metrics['per_worker'].values()), 9)
+        self.assertTrue(all(w['avg_ms'] is not None for w in metrics['per_worker'].values() if w['jobs']))
+
+    def test_broadcast_reaches_every_worker(self):
+        self.service.recognize(b'warm-up')
+        self.service.broadcast('refresh_user', 42)
+        pids = {}
+        for _ in range(20):
+            result = self.service.recognize(b'frame')
+            pids[result['pid']] = result['updates']
+        for updates in pids.values():
+            self.assertIn(['refresh_user', 42], updates)
+
+    def test_crashed_worker_is_replaced(self):
+        self.service.recognize(b'warm-up')
+        with self.assertRaises(RuntimeError):
+            self.service.recognize(b'crash')
+        self.assertTrue(self.service.recognize(b'after')['success'])
+        self.assertEqual(sum(w['restarts'] for w in self.service.metrics()['per_worker'].values()), 1)
+
+    def test_timeout_raises_the_futures_timeout(self):
+        # Callers catch concurrent.futures.TimeoutError (the builtin one only from Python 3.11)
+        self.service.recognize(b'warm-up')
+        with self.assertRaises(futures.TimeoutError):
+            self.service.recognize(b'slow', timeout=0.2)
+        self.assertTrue(self.service.recognize(b'after')['success'])
+
+
+class TestBrokenWorkers(unittest.TestCase):
+    def test_jobs_fail_when_no_worker_starts(self):
+        service = RecognitionService(worker_count=1, job_timeout=20, state_factory=BrokenState)
+        try:
+            with self.assertRaises(RuntimeError):
+                service.recognize(b'frame')
+            self.assertIn('models missing', service.metrics()['per_worker'][0]['error'])
+        finally:
+            service.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)